@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili视频统计数据自适应轮询调度
+功能：根据每个视频最近的统计数据增长速度和发布时间决定下一次采样时间，
+      增长快的视频和新视频采样密集，平稳的老视频很少采样；
+      所有视频的采样共用一个全局请求预算，需求超出预算时按比例拉长所有视频的采样间隔。
+      待采样视频保存在按下次采样时间排序的优先队列（堆）中
+"""
+
+import argparse
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from bilibili_crawler import BilibiliCrawler
+from http_resilience import RequestFailedError
+from rate_limiter import TokenBucket
+from stats_poller import STAT_FIELDS, VideoStatsStore
+
+
+# 用于判断增长速度的统计字段：这些字段变化快说明视频正在被大量观看和讨论
+GROWTH_FIELDS = ['view', 'danmaku', 'reply', 'like']
+
+
+class AdaptivePollScheduler:
+    def __init__(self, crawler, store, budget=1.0, min_interval=60, max_interval=86400,
+                 target_growth=0.01, max_workers=4, refresh_interval=60):
+        """
+        crawler: BilibiliCrawler实例，通过其session和限速器请求视频信息接口
+        store: VideoStatsStore实例，提供跟踪列表并保存采样结果
+        budget: 全局请求预算（次/秒）
+        min_interval/max_interval: 单个视频采样间隔的上下限（秒）
+        target_growth: 希望相邻两次采样之间统计数据增长的比例，
+                       由增长速度推算采样间隔：间隔 = target_growth / 每秒增长比例
+        max_workers: 同时进行的请求数量
+        refresh_interval: 重新读取跟踪列表的间隔（秒），用于发现新加入的视频
+        """
+        self.crawler = crawler
+        self.store = store
+        self.budget = float(budget)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_growth = target_growth
+        self.max_workers = max(1, int(max_workers))
+        self.refresh_interval = refresh_interval
+        self.bucket = TokenBucket(self.budget, self.budget, self.budget)
+        self.intervals = {}       # BV号 -> 期望的采样间隔（秒）
+        self.last_samples = {}    # BV号 -> 最近一次采样
+        self.poll_counts = {}     # BV号 -> 本次运行中的采样次数
+        self._heap = []           # (下次采样时间, BV号)
+        self._scheduled = set()   # 已在堆中或正在采样的BV号
+        self._in_flight = {}      # 正在进行的采样 -> BV号
+
+    def age_interval(self, pubdate, now):
+        """
+        按发布时间推算的采样间隔：发布6小时内按最短间隔采样，之后随视频年龄线性增长
+        """
+        age_hours = max(0.0, (now - pubdate) / 3600)
+        return self.min_interval * max(1.0, age_hours / 6)
+
+    def growth_interval(self, previous, current):
+        """
+        按最近两次采样之间的增长速度推算的采样间隔
+        """
+        elapsed = current['ts'] - previous['ts']
+        if elapsed <= 0:
+            return None
+        growth = max((current[field] - previous[field]) / max(previous[field], 1)
+                     for field in GROWTH_FIELDS)
+        if growth <= 0:
+            return self.max_interval
+        return self.target_growth * elapsed / growth
+
+    def next_interval(self, bvid, previous, current):
+        """
+        根据最近的采样结果计算期望的采样间隔：取增长速度和视频年龄推算的间隔中较密集的一个；
+        变热时立即加密，变冷时每次最多放慢一倍，避免一次偶然的平稳采样让热门视频被冷落
+        """
+        candidates = [self.age_interval(current['pubdate'], current['ts'])] if 'pubdate' in current else []
+        if previous is None:
+            # 还没有历史采样，无法估计增长速度：尽快再采样一次
+            candidates.append(self.min_interval)
+        else:
+            interval = self.growth_interval(previous, current)
+            if interval is not None:
+                candidates.append(interval)
+        interval = min(candidates) if candidates else self.max_interval
+        old_interval = self.intervals.get(bvid)
+        if old_interval is not None:
+            interval = min(interval, old_interval * 2)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def stretch(self):
+        """
+        所有视频的采样需求（次/秒）超出全局预算时，采样间隔需要乘以的系数
+        """
+        demand = sum(1.0 / interval for interval in self.intervals.values())
+        return max(1.0, demand / self.budget)
+
+    def _schedule(self, bvid, due):
+        heapq.heappush(self._heap, (due, bvid))
+        self._scheduled.add(bvid)
+
+    def refresh(self, now):
+        """
+        把新加入跟踪列表的视频加入调度：按预算错开，依次尽快采样；
+        已取消跟踪的视频从调度中移除，正在采样的视频完成后不再重新调度
+        """
+        tracked = self.store.tracked()
+        removed = self._scheduled - set(tracked)
+        if removed:
+            self._scheduled -= removed
+            for bvid in removed:
+                self.intervals.pop(bvid, None)
+                self.last_samples.pop(bvid, None)
+            self._heap = [entry for entry in self._heap if entry[1] not in removed]
+            heapq.heapify(self._heap)
+        # 取消跟踪后又重新跟踪、且仍在采样中的视频，等采样完成后的下一次刷新再加入调度
+        in_flight = set(self._in_flight.values())
+        new_bvids = [bvid for bvid in tracked if bvid not in self._scheduled and bvid not in in_flight]
+        for index, bvid in enumerate(new_bvids):
+            latest = self.store.latest(bvid)
+            if latest is not None:
+                self.last_samples[bvid] = latest
+            self._schedule(bvid, now + index / self.budget)
+        return len(new_bvids)
+
+    def _poll(self, bvid):
+        self.bucket.acquire()
+        try:
+            sample = self.crawler.get_video_stats(bvid)
+        except (RequestFailedError, KeyError, ValueError) as e:
+            self.crawler.record_failure(bvid, 'stats', e)
+            return None
+        sample['ts'] = int(time.time())
+        return sample
+
+    def _reschedule(self, bvid, sample, now):
+        if sample is None:
+            # 请求失败：按原有间隔稍后重试
+            interval = self.intervals.get(bvid, self.min_interval)
+        else:
+            previous = self.last_samples.get(bvid)
+            interval = self.next_interval(bvid, previous, sample)
+            self.last_samples[bvid] = {field: sample[field] for field in ['ts', 'pubdate'] + STAT_FIELDS}
+            self.poll_counts[bvid] = self.poll_counts.get(bvid, 0) + 1
+        self.intervals[bvid] = interval
+        self._schedule(bvid, now + interval * self.stretch())
+
+    def run(self, duration=None):
+        """
+        持续调度采样，duration为None时一直运行直到被中断
+        返回本次运行的采样次数
+        """
+        started = time.time()
+        next_refresh = started
+        total = 0
+        in_flight = self._in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while duration is None or time.time() - started < duration or in_flight:
+                now = time.time()
+                stopping = duration is not None and now - started >= duration
+                if not stopping and now >= next_refresh:
+                    self.refresh(now)
+                    next_refresh = now + self.refresh_interval
+
+                # 发出所有已到期的采样
+                while (not stopping and self._heap and self._heap[0][0] <= now
+                       and len(in_flight) < self.max_workers):
+                    # 采样进行中的视频仍留在_scheduled中，refresh不会重复调度，完成后由_reschedule重新入堆
+                    _, bvid = heapq.heappop(self._heap)
+                    if bvid not in self._scheduled:
+                        # 已取消跟踪
+                        continue
+                    in_flight[executor.submit(self._poll, bvid)] = bvid
+
+                if in_flight:
+                    timeout = max(0.0, self._heap[0][0] - now) if self._heap else None
+                    if len(in_flight) >= self.max_workers or stopping:
+                        timeout = None
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    samples = []
+                    for future in done:
+                        bvid = in_flight.pop(future)
+                        sample = future.result()
+                        if bvid in self._scheduled:
+                            self._reschedule(bvid, sample, time.time())
+                        if sample is not None:
+                            samples.append(sample)
+                    # 同一次唤醒中完成的采样在一个事务中写入
+                    self.store.append(samples)
+                    total += len(samples)
+                else:
+                    wake = min(self._heap[0][0] if self._heap else next_refresh, next_refresh)
+                    if duration is not None:
+                        wake = min(wake, started + duration)
+                    time.sleep(max(0.0, min(wake - time.time(), 1.0)))
+        return total
+
+    def describe(self, limit=10):
+        """
+        返回采样最密集的视频及其当前采样间隔
+        """
+        ranked = sorted(self.intervals.items(), key=lambda item: item[1])[:limit]
+        stretch = self.stretch()
+        return [(bvid, interval * stretch, self.poll_counts.get(bvid, 0)) for bvid, interval in ranked]
+
+
+def main():
+    """
+    主函数 - 先用 stats_poller.py track 加入跟踪的视频，再运行本脚本自适应采样
+    """
+    parser = argparse.ArgumentParser(description="Bilibili视频统计数据自适应轮询")
+    parser.add_argument('--db', default='video_stats.db', help="时间序列数据库路径")
+    parser.add_argument('--budget', type=float, default=1.0, help="全局请求预算（次/秒）")
+    parser.add_argument('--min-interval', type=float, default=60, help="最短采样间隔（秒）")
+    parser.add_argument('--max-interval', type=float, default=86400, help="最长采样间隔（秒）")
+    parser.add_argument('--target-growth', type=float, default=0.01,
+                        help="相邻两次采样之间期望的增长比例")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=None, help="运行时长（秒），默认一直运行")
+    parser.add_argument('--api-base', default='https://api.bilibili.com')
+    args = parser.parse_args()
+
+    crawler = BilibiliCrawler(api_base=args.api_base)
+    store = VideoStatsStore(args.db)
+    scheduler = AdaptivePollScheduler(crawler, store, budget=args.budget, min_interval=args.min_interval,
+                                      max_interval=args.max_interval, target_growth=args.target_growth,
+                                      max_workers=args.workers)
+    try:
+        total = scheduler.run(args.duration)
+        print(f"共采样 {total} 次")
+    except KeyboardInterrupt:
+        print("轮询已停止")
+    finally:
+        store.close()
+
+    print("采样最密集的视频:")
+    for bvid, interval, count in scheduler.describe():
+        print(f"  {bvid}: 每 {interval:.0f} 秒采样一次（本次运行采样 {count} 次）")
+    crawler.print_failure_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,10 +16,12 @@ from wordcloud import WordCloud
 from collections import Counter
 import re
 import os
-import glob
+import sqlite3
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_catalog import DEFAULT_CATALOG_PATH, open_catalog, uncatalogued_info_files
+
 # 尝试设置中文字体
 def set_chinese_font():
     """
@@ -124,48 +126,112 @@ class AdvancedSingerDataAnalyzer:
         self.song_names = extract_song_names()  # 提取歌曲名称
         self.video_bvids = []  # 存储每个视频的BV号
         
-    def load_data(self):
-        """加载所有视频信息和弹幕数据"""
-        # 查找所有info.csv文件
-        info_files = glob.glob('*_info.csv')
+    # 各项分析用到的视频信息列和弹幕列，从Parquet存储读取时只解码这些列
+    VIDEO_INFO_COLUMNS = ['bvid', 'title', 'song_name', 'view', 'danmaku', 'comment',
+                          'like', 'coin', 'favorite', 'share']
+    DANMAKU_COLUMNS = ['content']
         
-        # 过滤掉旧格式的文件（包含特殊字符的文件）
-        filtered_info_files = [f for f in info_files if not any(c in f for c in ['【', '《', '__'])]
+    def load_data(self, source=None, parquet_dir='danmaku_parquet', bvids=None, catalog_path=DEFAULT_CATALOG_PATH):
+        """
+        加载所有视频信息和弹幕数据
+        source: 'csv' 读取CSV文件，'parquet' 读取Parquet存储；
+                None时存在parquet_dir则读取Parquet存储，否则读取CSV
+        bvids: 只加载这些视频，None表示全部
+        catalog_path: 数据目录库路径，通过目录库查找数据文件；读取CSV时还会加载当前目录中未登记到目录库的文件，
+                      读取Parquet时目录库不存在或没有对应记录则读取整个Parquet存储
+        """
+        if source is None:
+            source = 'parquet' if os.path.isdir(parquet_dir) else 'csv'
+        videos = None
+        catalog = open_catalog(catalog_path)
+        if catalog is not None:
+            try:
+                videos = catalog.videos(storage=source, bvids=bvids)
+            finally:
+                catalog.close()
+            print(f"数据目录库中登记了 {len(videos)} 个视频")
+            if not videos:
+                # 目录库中没有该存储方式的记录（例如引入目录库之前保存的数据），改为扫描数据目录
+                print("目录库中没有对应的记录，扫描数据目录")
+                videos = None
+        if source == 'parquet':
+            if videos is not None:
+                bvids = [video['bvid'] for video in videos]
+            self.load_parquet_data(parquet_dir, bvids)
+            return
         
-        print(f"找到 {len(info_files)} 个视频信息文件，过滤后剩余 {len(filtered_info_files)} 个")
+        # 目录库记录了每个视频的信息文件和弹幕文件；再扫描当前目录中没有登记到目录库的info.csv文件，
+        # 按文件名找到对应的弹幕文件
+        datasets = [(video['info_path'], video['danmaku_paths']) for video in videos or []]
+        info_files = uncatalogued_info_files(info_file for info_file, _ in datasets)
+        if info_files:
+            print(f"找到 {len(info_files)} 个未登记的视频信息文件")
+        datasets += [(info_file, [info_file.replace('_info.csv', '_danmaku.csv')]) for info_file in info_files]
+        # 过滤掉旧格式的文件
+        datasets = [(info_file, danmaku_files) for info_file, danmaku_files in datasets
+                    if not any(c in info_file for c in ['【', '《', '__'])]
         
         # 加载视频信息数据
-        for info_file in filtered_info_files:
+        for info_file, danmaku_files in datasets:
             try:
                 df = pd.read_csv(info_file)
                 if not df.empty:
+                    if bvids is not None and df.iloc[0]['bvid'] not in bvids:
+                        continue
                     self.video_data.append(df.iloc[0])
                     # 存储视频的BV号
                     self.video_bvids.append(df.iloc[0]['bvid'])
                     
-                    # 获取对应的弹幕文件名
-                    danmaku_file = info_file.replace('_info.csv', '_danmaku.csv')
-                    if os.path.exists(danmaku_file):
-                        danmaku_df = pd.read_csv(danmaku_file)
+                    # 获取对应的弹幕文件
+                    danmaku_files = [f for f in danmaku_files if os.path.exists(f)]
+                    if danmaku_files:
+                        danmaku_df = pd.concat([pd.read_csv(f) for f in danmaku_files], ignore_index=True)
                         # 为弹幕数据添加bvid列
                         danmaku_df['bvid'] = df.iloc[0]['bvid']
                         self.danmaku_data.append(danmaku_df)
-                        
-                        # 获取视频标题并尝试匹配歌曲名称
-                        video_title = df.iloc[0]['title']
-                        song_name = self.get_song_name(video_title, info_file)
-                        self.video_titles.append(song_name)
                     else:
-                        print(f"未找到弹幕文件: {danmaku_file}")
+                        print(f"未找到 {info_file} 对应的弹幕文件")
                         self.danmaku_data.append(pd.DataFrame())
-                        video_title = df.iloc[0]['title']
-                        song_name = self.get_song_name(video_title, info_file)
-                        self.video_titles.append(song_name)
+                    
+                    # 获取视频标题并尝试匹配歌曲名称
+                    video_title = df.iloc[0]['title']
+                    song_name = self.get_song_name(video_title, info_file)
+                    self.video_titles.append(song_name)
             except Exception as e:
                 print(f"加载文件 {info_file} 时出错: {e}")
         
         print(f"成功加载 {len(self.video_data)} 个视频的数据")
         
+    def load_parquet_data(self, parquet_dir='danmaku_parquet', bvids=None):
+        """
+        从Parquet存储加载视频信息（每个视频最近一次快照）和弹幕数据：
+        只打开所需视频的分区，只读取分析用到的列，列类型已固定，不需要重新推断
+        """
+        from parquet_store import ParquetDanmakuStore
+        store = ParquetDanmakuStore(parquet_dir)
+        info = store.read_video_info(columns=self.VIDEO_INFO_COLUMNS, bvids=bvids)
+        if info.empty:
+            print(f"Parquet存储 {parquet_dir} 中没有视频信息")
+            return
+        # 与CSV一致：有歌曲名称时用歌曲名称作为标题
+        info['title'] = info['song_name'].fillna(info['title'])
+        
+        danmaku = store.read_danmaku(columns=['bvid'] + self.DANMAKU_COLUMNS, bvids=list(info['bvid']))
+        danmaku_by_bvid = dict(tuple(danmaku.groupby('bvid', sort=False))) if not danmaku.empty else {}
+        print(f"从Parquet存储读取到 {len(info)} 个视频、{len(danmaku)} 条弹幕")
+        
+        for _, row in info.iterrows():
+            self.video_data.append(row)
+            self.video_bvids.append(row['bvid'])
+            danmaku_df = danmaku_by_bvid.get(row['bvid'])
+            if danmaku_df is None:
+                print(f"未找到弹幕数据: {row['bvid']}")
+                danmaku_df = pd.DataFrame()
+            self.danmaku_data.append(danmaku_df.reset_index(drop=True))
+            self.video_titles.append(self.get_song_name(row['title'], row['bvid']))
+        
+        print(f"成功加载 {len(self.video_data)} 个视频的数据")
+        
     def get_song_name(self, video_title, file_path):
         """
         获取歌曲名称
@@ -282,6 +348,55 @@ class AdvancedSingerDataAnalyzer:
         print(f"最高弹幕数: {df['danmaku'].max():,.0f}")
         print(f"最低弹幕数: {df['danmaku'].min():,.0f}")
         
+    def analyze_growth_trend(self, stats_db='video_stats.db'):
+        """根据定时轮询得到的统计时间序列分析真实的增长曲线和增长速度"""
+        if not os.path.exists(stats_db):
+            print(f"未找到统计时间序列数据库 {stats_db}，请先运行 stats_poller.py 轮询视频统计数据")
+            return
+        
+        with sqlite3.connect(stats_db) as conn:
+            stats = pd.read_sql_query(
+                'SELECT s.*, t.song_name FROM video_stats s '
+                'LEFT JOIN tracked_videos t ON s.bvid = t.bvid ORDER BY s.bvid, s.ts', conn)
+        if stats.empty:
+            print("统计时间序列为空")
+            return
+        
+        stats['time'] = pd.to_datetime(stats['ts'], unit='s')
+        stats['song_name'] = stats['song_name'].fillna(stats['bvid'].map(self.song_names)).fillna(stats['bvid'])
+        # 相邻两次记录之间的增长速度（每小时播放增量）
+        grouped = stats.groupby('bvid')
+        stats['view_velocity'] = grouped['view'].diff() * 3600 / grouped['ts'].diff()
+        
+        fig, axes = plt.subplots(1, 2, figsize=(18, 8))
+        fig.suptitle('单依纯《歌手》节目播放量增长曲线', fontsize=20, fontweight='bold', fontproperties=big_title_font_prop)
+        for song_name, series in stats.groupby('song_name'):
+            axes[0].plot(series['time'], series['view'], marker='o', markersize=3, linewidth=1.5, label=song_name)
+            axes[1].plot(series['time'], series['view_velocity'], linewidth=1.5, label=song_name)
+        axes[0].set_title('累计播放量', fontsize=16, pad=15, fontproperties=title_font_prop)
+        axes[0].set_ylabel('播放量', fontsize=12, fontproperties=label_font_prop)
+        axes[0].ticklabel_format(style='plain', axis='y')
+        axes[1].set_title('播放增长速度', fontsize=16, pad=15, fontproperties=title_font_prop)
+        axes[1].set_ylabel('每小时播放增量', fontsize=12, fontproperties=label_font_prop)
+        for ax in axes:
+            ax.set_xlabel('时间', fontsize=12, fontproperties=label_font_prop)
+            ax.grid(True, alpha=0.3)
+            ax.tick_params(axis='x', rotation=30)
+        axes[1].legend(prop=chinese_font_prop, fontsize=9, loc='upper right')
+        
+        plt.tight_layout()
+        plt.savefig('播放量增长曲线.png', dpi=300, bbox_inches='tight', facecolor='white')
+        plt.show()
+        
+        # 输出统计信息
+        print("\n=== 播放量增长分析 ===")
+        latest = stats.groupby('song_name').agg(
+            samples=('ts', 'size'), view=('view', 'last'), velocity=('view_velocity', 'last'))
+        for song_name, row in latest.sort_values('velocity', ascending=False).iterrows():
+            velocity = 0 if pd.isna(row['velocity']) else row['velocity']
+            print(f"{song_name:<20} 播放量: {row['view']:>12,.0f}  当前增速: {velocity:>10,.0f}/小时  "
+                  f"（{int(row['samples'])} 次采样）")
+        
     def analyze_danmaku_sentiment(self):
         """分析弹幕情感倾向"""
         if not self.danmaku_data:
@@ -665,6 +780,9 @@ def main():
     # 热度趋势分析
     analyzer.analyze_heat_trend()
     
+    # 真实增长曲线（需要先用stats_poller.py轮询统计数据）
+    analyzer.analyze_growth_trend()
+    
     # 弹幕情感分析
     analyzer.analyze_danmaku_sentiment()
     
@@ -683,6 +801,8 @@ def main():
     print("3. 弹幕词云_高级版.png")
     print("4. 视频综合得分排名_高级版.png")
     print("5. 观众参与度分析.png")
+    if os.path.exists('播放量增长曲线.png'):
+        print("6. 播放量增长曲线.png")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
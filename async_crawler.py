@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫异步批量抓取引擎
+功能：使用asyncio并发处理多个视频的信息获取和弹幕抓取，
+      通过同时处理的视频数上限和按域名的并发请求上限控制请求压力
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from http_resilience import RequestFailedError
+from job_queue import default_worker_id
+from rate_limiter import HostConcurrencyLimiter
+
+
+class AsyncCrawlEngine:
+    def __init__(self, crawler, concurrency=8, per_host_limit=4):
+        """
+        crawler: BilibiliCrawler实例，网络请求仍然通过crawler.session发出
+        concurrency: 同时处理的视频数量上限
+        per_host_limit: 每个域名同时进行的HTTP请求数上限，运行期间由crawler._request在每个请求发出时限制
+                        （包括多P和分段弹幕的并发请求）
+        """
+        self.crawler = crawler
+        self.concurrency = max(1, int(concurrency))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self._video_semaphore = None
+        self._executor = None
+        self._active_jobs = set()
+
+    async def _run(self, func, *args):
+        """
+        在线程池中执行同步的请求或写入函数
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _install_host_limiter(self):
+        """
+        为crawler设置按域名的并发请求上限，返回原来的设置
+        """
+        previous = self.crawler.host_limiter
+        self.crawler.host_limiter = HostConcurrencyLimiter(self.per_host_limit)
+        return previous
+
+    async def _crawl_video(self, url):
+        """
+        处理单个视频：获取视频信息 -> 抓取并保存弹幕和视频信息
+        成功时返回视频信息，失败时返回None（失败原因记录在crawler.failures中）
+        """
+        crawler = self.crawler
+        try:
+            video_info = await self._run(crawler.get_video_info, url)
+            if not video_info:
+                # 失败原因已由get_video_info记录
+                return None
+
+            try:
+                # 抓取（含所有分P）并保存，多P视频边抓取边写入文件
+                count = await self._run(crawler.crawl_and_save_danmaku, video_info)
+            except RequestFailedError as e:
+                crawler.record_failure(url, 'danmaku', e)
+                return None
+            # 启用后台写入时等待该视频的数据写入磁盘，写入失败的视频不算成功（失败原因已记录）
+            error = await self._run(crawler.wait_for_writes, video_info['bvid'], url)
+            if error is not None:
+                return None
+            display_title = video_info.get('song_name', video_info['title'])
+            print(f"{display_title}: 共爬取 {count} 条弹幕")
+            return video_info
+        except Exception as e:
+            crawler.record_failure(url, 'crawl', e)
+            return None
+
+    async def _crawl_one(self, index, total, url):
+        async with self._video_semaphore:
+            print(f"\n正在处理第 {index}/{total} 个视频: {url}")
+            return await self._crawl_video(url) is not None
+
+    async def crawl_many(self, urls):
+        """
+        并发处理多个视频，返回与urls顺序一致的成功标记列表
+        """
+        self._video_semaphore = asyncio.Semaphore(self.concurrency)
+        previous_limiter = self._install_host_limiter()
+        # 每个视频同一时刻最多占用一个线程（请求或写文件），线程数与视频并发数一致即可
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            total = len(urls)
+            tasks = [self._crawl_one(i, total, url) for i, url in enumerate(urls, 1)]
+            return await asyncio.gather(*tasks)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self.crawler.host_limiter = previous_limiter
+
+    async def _job_worker(self, queue, worker_id, results):
+        """
+        从任务队列中不断领取任务并处理，直到队列为空
+        """
+        crawler = self.crawler
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await loop.run_in_executor(self._executor, queue.claim, worker_id)
+            if job is None:
+                return
+            if job['song_name']:
+                crawler.song_names[job['bvid']] = job['song_name']
+            print(f"\n正在处理任务 #{job['id']}（第 {job['attempts']} 次尝试）: {job['url']}")
+            self._active_jobs.add(job['id'])
+            try:
+                video_info = await self._crawl_video(job['url'])
+            finally:
+                self._active_jobs.discard(job['id'])
+            if video_info is not None:
+                updated = await loop.run_in_executor(
+                    self._executor, functools.partial(queue.complete, job['id'], video_info['cid'],
+                                                      worker_id=worker_id))
+            else:
+                failure = crawler.last_failure(job['url'])
+                reason = failure['reason'] if failure else '未知错误'
+                retryable = failure['retryable'] if failure else True
+                updated = await loop.run_in_executor(
+                    self._executor, functools.partial(queue.fail, job['id'], reason, retryable,
+                                                      worker_id=worker_id))
+            if not updated:
+                print(f"任务 #{job['id']} 的租约已过期并被其他工作进程领取，本次结果不更新任务状态")
+            results.append(video_info is not None)
+
+    async def _heartbeat(self, queue, worker_id, interval):
+        """
+        定期为正在处理的任务续约，避免处理时间较长的任务被其他工作进程重新领取
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            for job_id in list(self._active_jobs):
+                try:
+                    await loop.run_in_executor(self._executor, queue.heartbeat, job_id, worker_id)
+                except Exception as e:
+                    print(f"任务 #{job_id} 续约失败: {e}")
+
+    async def crawl_jobs(self, queue, worker_id=None):
+        """
+        并发处理任务队列中的所有任务，返回本次处理的成功标记列表
+        queue: CrawlJobQueue或RedisJobQueue
+        worker_id: 工作进程标识，默认为 主机名:进程号
+        """
+        worker_id = worker_id or default_worker_id()
+        previous_limiter = self._install_host_limiter()
+        self._active_jobs = set()
+        # 多留一个线程给心跳，避免所有线程都在抓取时无法续约
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency + 1)
+        results = []
+        heartbeat = asyncio.ensure_future(self._heartbeat(queue, worker_id, queue.lease_seconds / 3))
+        try:
+            workers = [self._job_worker(queue, worker_id, results) for _ in range(self.concurrency)]
+            await asyncio.gather(*workers)
+            return results
+        finally:
+            heartbeat.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self.crawler.host_limiter = previous_limiter
+
+    def run_jobs(self, queue, worker_id=None):
+        """
+        同步入口：处理任务队列中的任务
+        """
+        return asyncio.run(self.crawl_jobs(queue, worker_id))
+
+    def run(self, urls):
+        """
+        同步入口：并发处理给定的视频列表（不经过任务队列）
+        """
+        if not urls:
+            return []
+        return asyncio.run(self.crawl_many(urls))
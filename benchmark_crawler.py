@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫吞吐量基准测试脚本
+功能：在本地模拟服务器上按不同并发度、注入延迟和弹幕XML大小（1千到100万条）运行
+      crawl_batch_danmaku / crawl_video_danmaku，统计视频/秒、弹幕/秒、请求延迟p50/p99、
+      峰值内存和CPU时间；结果保存为JSON，并与保存的基线比较，性能退化时以非零状态退出
+
+用法：
+  python benchmark_crawler.py                    # 运行全部场景并与基线比较
+  python benchmark_crawler.py --quick            # 只运行小规模场景
+  python benchmark_crawler.py --update-baseline  # 把本次结果保存为新的基线
+"""
+
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+from bilibili_crawler import BilibiliCrawler
+from mock_bilibili_server import MockBilibiliServer, fake_cid
+from rate_limiter import AdaptiveRateLimiter, DEFAULT_BUDGETS
+
+
+# 基准测试衡量的是引擎本身的吞吐量，因此放开限速器的预算
+UNLIMITED_BUDGETS = {name: {'rate': 10000.0, 'max_rate': 10000.0} for name in DEFAULT_BUDGETS}
+
+# 基准测试场景：mode为 'batch' 时批量抓取videos个视频，为 'single' 时抓取单个视频；
+# quick为True的场景在 --quick 模式下也会运行
+SCENARIOS = [
+    {'name': 'batch_c1_50ms', 'mode': 'batch', 'videos': 20, 'concurrency': 1,
+     'latency': 0.05, 'num_danmaku': 1000, 'quick': True},
+    {'name': 'batch_c8_50ms', 'mode': 'batch', 'videos': 40, 'concurrency': 8,
+     'latency': 0.05, 'num_danmaku': 1000, 'quick': True},
+    {'name': 'batch_c16_50ms', 'mode': 'batch', 'videos': 80, 'concurrency': 16,
+     'latency': 0.05, 'num_danmaku': 1000, 'quick': False},
+    {'name': 'batch_c8_0ms', 'mode': 'batch', 'videos': 80, 'concurrency': 8,
+     'latency': 0.0, 'num_danmaku': 1000, 'quick': True},
+    {'name': 'single_xml_10k', 'mode': 'single', 'videos': 1, 'concurrency': 1,
+     'latency': 0.0, 'num_danmaku': 10000, 'quick': True},
+    {'name': 'single_xml_100k', 'mode': 'single', 'videos': 1, 'concurrency': 1,
+     'latency': 0.0, 'num_danmaku': 100000, 'quick': False},
+    {'name': 'single_xml_1m', 'mode': 'single', 'videos': 1, 'concurrency': 1,
+     'latency': 0.0, 'num_danmaku': 1000000, 'quick': False},
+]
+
+# 与基线比较的指标：'higher' 表示越大越好，'lower' 表示越小越好
+METRICS = {
+    'videos_per_second': 'higher',
+    'danmaku_per_second': 'higher',
+    'latency_p50_ms': 'lower',
+    'latency_p99_ms': 'lower',
+    'peak_rss_mb': 'lower',
+    'cpu_seconds': 'lower',
+}
+
+# 低于该值的延迟和CPU时间差异主要来自计时误差，不视为退化
+ABSOLUTE_SLACK = {'latency_p50_ms': 2.0, 'latency_p99_ms': 5.0, 'cpu_seconds': 0.2, 'peak_rss_mb': 5.0}
+
+
+def percentile(values, q):
+    """
+    返回values的第q百分位数（最近秩法），values为空时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """
+    当前进程的峰值常驻内存（MB），Linux上ru_maxrss的单位为KB，macOS上为字节
+    """
+    if resource is None:
+        return 0.0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss / 1024 / 1024
+    return maxrss / 1024
+
+
+def count_danmaku_rows(directory):
+    """
+    统计目录中所有弹幕CSV文件的数据行数
+    """
+    total = 0
+    for path in glob.glob(os.path.join(directory, '*_danmaku.csv')):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            total += max(0, sum(1 for _ in csv.reader(f)) - 1)
+    return total
+
+
+def run_scenario(scenario, base_url):
+    """
+    在子进程中执行一个场景，返回指标字典；每个场景单独一个进程，峰值内存和CPU时间互不影响
+    """
+    crawler = BilibiliCrawler(api_base=base_url, comment_base=base_url,
+                              rate_limiter=AdaptiveRateLimiter(UNLIMITED_BUDGETS))
+    latencies = []
+
+    def record_latency(response, *args, **kwargs):
+        # response.elapsed 为发出请求到收到响应头的时间，不含读取响应体
+        latencies.append(response.elapsed.total_seconds())
+
+    for pooled in crawler.session_pool.sessions:
+        pooled.session.hooks['response'].append(record_latency)
+
+    bvids = [f'BV1mock{i:05d}' for i in range(scenario['videos'])]
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            # 屏蔽爬虫自身的进度输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                cpu_start = time.process_time()
+                start = time.perf_counter()
+                if scenario['mode'] == 'batch':
+                    with open('urls.txt', 'w', encoding='utf-8') as f:
+                        f.writelines(f'https://www.bilibili.com/video/{bvid}\n' for bvid in bvids)
+                    crawler.crawl_batch_danmaku('urls.txt', concurrency=scenario['concurrency'],
+                                                per_host_limit=scenario['concurrency'],
+                                                job_db=os.path.join(tmpdir, 'jobs.db'))
+                    success = len(glob.glob('*_info.csv'))
+                else:
+                    success = sum(1 for bvid in bvids if crawler.crawl_video_danmaku(bvid))
+                elapsed = time.perf_counter() - start
+                cpu_seconds = time.process_time() - cpu_start
+            danmaku_count = count_danmaku_rows(tmpdir)
+        finally:
+            os.chdir(old_cwd)
+
+    return {
+        'success': success,
+        'videos': len(bvids),
+        'danmaku': danmaku_count,
+        'requests': len(latencies),
+        'elapsed_seconds': round(elapsed, 4),
+        'videos_per_second': round(success / elapsed, 3),
+        'danmaku_per_second': round(danmaku_count / elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'cpu_seconds': round(cpu_seconds, 3),
+    }
+
+
+def benchmark(scenario):
+    """
+    为场景启动模拟服务器（在主进程中），预先生成弹幕XML，然后在子进程中运行爬虫
+    """
+    with MockBilibiliServer(latency=scenario['latency'], num_danmaku=scenario['num_danmaku']) as server:
+        # 弹幕XML在服务器第一次请求时生成并缓存，预先生成以免计入爬虫耗时
+        for i in range(scenario['videos']):
+            server.danmaku_xml(fake_cid(f'BV1mock{i:05d}'))
+        # 使用spawn启动干净的子进程，峰值内存不受主进程中服务器缓存的影响
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            return pool.apply(run_scenario, (scenario, server.base_url))
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    与基线比较，返回退化描述列表
+    tolerance: 允许的相对变化比例，如0.2表示吞吐量下降或耗时上升超过20%视为退化
+    """
+    regressions = []
+    for name, metrics in results.items():
+        base_metrics = baseline.get(name)
+        if base_metrics is None:
+            continue
+        for metric, direction in METRICS.items():
+            current = metrics.get(metric)
+            base = base_metrics.get(metric)
+            if current is None or not base:
+                continue
+            slack = ABSOLUTE_SLACK.get(metric, 0.0)
+            if direction == 'higher':
+                regressed = current < base * (1 - tolerance)
+            else:
+                regressed = current > base * (1 + tolerance) + slack
+            if regressed:
+                change = (current - base) / base
+                regressions.append(f"{name}.{metric}: {base} -> {current}（{change:+.0%}）")
+    return regressions
+
+
+def print_result(name, metrics):
+    print(f"{name:<16} 成功 {metrics['success']}/{metrics['videos']}, "
+          f"{metrics['videos_per_second']:.2f} 视频/秒, {metrics['danmaku_per_second']:.0f} 弹幕/秒, "
+          f"p50 {metrics['latency_p50_ms']:.1f}ms, p99 {metrics['latency_p99_ms']:.1f}ms, "
+          f"峰值内存 {metrics['peak_rss_mb']:.0f}MB, CPU {metrics['cpu_seconds']:.2f}s")
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili弹幕爬虫吞吐量基准测试")
+    parser.add_argument('--quick', action='store_true', help="只运行小规模场景")
+    parser.add_argument('--scenario', action='append', default=[], help="只运行指定名称的场景，可重复指定")
+    parser.add_argument('--output', default='benchmark_results.json', help="结果JSON文件")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="基线JSON文件")
+    parser.add_argument('--update-baseline', action='store_true', help="把本次结果写入基线文件")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的相对退化比例")
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS
+                 if (not args.quick or scenario['quick'])
+                 and (not args.scenario or scenario['name'] in args.scenario)]
+    if not scenarios:
+        print("没有匹配的场景")
+        sys.exit(2)
+
+    results = {}
+    for scenario in scenarios:
+        print(f"运行 {scenario['name']}: {scenario['videos']} 个视频, 并发度 {scenario['concurrency']}, "
+              f"注入延迟 {scenario['latency'] * 1000:.0f}ms, 每视频弹幕数 {scenario['num_danmaku']}")
+        results[scenario['name']] = benchmark(scenario)
+        print_result(scenario['name'], results[scenario['name']])
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scenarios': {scenario['name']: scenario for scenario in scenarios},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f).get('results', {})
+        # 只更新本次运行的场景，保留其他场景的基线
+        baseline.update(results)
+        report['results'] = baseline
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"基线文件 {args.baseline} 不存在，使用 --update-baseline 创建")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f).get('results', {})
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("\n" + "!" * 60)
+        print(f"性能退化（超出允许的 {args.tolerance:.0%}）:")
+        for line in regressions:
+            print(f"  {line}")
+        print("!" * 60)
+        sys.exit(1)
+    print(f"与基线相比没有超出 {args.tolerance:.0%} 的退化")
+
+
+if __name__ == "__main__":
+    main()
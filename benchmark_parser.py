@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕XML解析后端基准测试脚本
+功能：用大体积的弹幕XML比较各解析后端（lxml、标准库）的吞吐量，并检查各后端的解析结果一致。
+      XML来自录制的固定数据：模拟服务器固定数据目录中的 {cid}.xml、流量录制目录中的弹幕XML响应，
+      或任意XML文件；没有指定时按 --sizes 合成弹幕XML。
+      数据按爬虫下载时的块大小送入解析器，与实际抓取的解析路径一致
+
+用法：
+  python benchmark_parser.py                       # 合成10万、100万条弹幕的XML
+  python benchmark_parser.py fixtures/ cassette/   # 使用录制的弹幕XML
+  python benchmark_parser.py --malformed           # 另外测试内容含非法控制字符的XML
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+import numpy as np
+
+from danmaku_batch import DanmakuBatch
+from danmaku_parser import XML_BACKENDS, available_xml_backends, iter_danmaku_xml_batches
+from mock_bilibili_server import build_danmaku_xml
+
+
+# 与爬虫下载弹幕XML时的块大小一致
+CHUNK_SIZE = 64 * 1024
+
+# 合成弹幕XML使用的cid
+SYNTHETIC_CID = 12345
+
+
+def find_fixtures(paths):
+    """
+    收集XML固定数据，返回 [(名称, 文件路径)]
+    paths中的目录按 *.xml 文件和流量录制（*.json中请求地址为弹幕XML）查找
+    """
+    fixtures = []
+    for path in paths:
+        if not os.path.isdir(path):
+            fixtures.append((os.path.basename(path), path))
+            continue
+        for xml_path in sorted(glob.glob(os.path.join(path, '*.xml'))):
+            fixtures.append((os.path.basename(xml_path), xml_path))
+        for meta_path in sorted(glob.glob(os.path.join(path, '*.json'))):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (ValueError, OSError):
+                continue
+            if not isinstance(meta, dict) or meta.get('status_code') != 200:
+                continue
+            url_path = urlparse(meta.get('url', '')).path
+            if url_path.endswith('.xml'):
+                fixtures.append((os.path.basename(url_path), meta_path[:-len('.json')] + '.body'))
+    return fixtures
+
+
+def synthetic_fixtures(sizes, malformed=False):
+    """
+    按弹幕数量合成XML，返回 [(名称, XML字节)]
+    malformed为True时额外生成一份部分弹幕内容含非法控制字符的XML（线上偶尔出现）
+    """
+    fixtures = []
+    for size in sizes:
+        body = build_danmaku_xml(SYNTHETIC_CID, size)
+        fixtures.append((f'synthetic_{size}', body))
+        if malformed:
+            # 弹幕序号以7开头的内容中插入退格符，XML 1.0不允许出现该字符
+            fixtures.append((f'malformed_{size}', body.replace('>弹幕7'.encode('utf-8'), '>弹\x08幕7'.encode('utf-8'))))
+    return fixtures
+
+
+def parse(body, backend):
+    """
+    按块解析XML，返回DanmakuBatch
+    """
+    chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    return DanmakuBatch.concat(iter_danmaku_xml_batches(chunks, backend=backend))
+
+
+def same_batches(left, right):
+    """
+    比较两个批次的所有列是否完全相同
+    """
+    if len(left) != len(right):
+        return False
+    for name, column in left.numeric.items():
+        if not np.array_equal(left.column(name), right.column(name)):
+            return False
+    for name, column in left.strings.items():
+        other = right.strings[name]
+        if column.offsets != other.offsets or column.data != other.data:
+            return False
+    return True
+
+
+def benchmark(name, body, backends, repeat):
+    """
+    用各后端解析同一份XML，每个后端取repeat次中最快的一次，返回 {后端: 指标}
+    """
+    results = {}
+    reference = None
+    for backend in backends:
+        best = None
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                batch = parse(body, backend)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        except ET.ParseError as e:
+            results[backend] = {'error': str(e)}
+            print(f"  {backend:<8} 解析失败: {e}")
+            continue
+        if reference is None:
+            reference = batch
+        results[backend] = {
+            'danmaku': len(batch),
+            'seconds': round(best, 4),
+            'danmaku_per_second': round(len(batch) / best, 1),
+            'mb_per_second': round(len(body) / 1024 / 1024 / best, 2),
+            'matches_first_backend': same_batches(reference, batch),
+        }
+        metrics = results[backend]
+        print(f"  {backend:<8} {metrics['danmaku']} 条, {metrics['seconds']:.3f}s, "
+              f"{metrics['danmaku_per_second']:.0f} 弹幕/秒, {metrics['mb_per_second']:.1f} MB/s"
+              + ("" if metrics['matches_first_backend'] else "（解析结果与第一个后端不一致）"))
+    timings = {backend: metrics['seconds'] for backend, metrics in results.items() if 'seconds' in metrics}
+    if 'stdlib' in timings and len(timings) > 1:
+        for backend, seconds in timings.items():
+            if backend != 'stdlib':
+                print(f"  {backend} 相对标准库加速 {timings['stdlib'] / seconds:.2f}x")
+    return results
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili弹幕XML解析后端基准测试")
+    parser.add_argument('paths', nargs='*', help="XML文件、固定数据目录或流量录制目录")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help="没有指定XML时合成的弹幕数量")
+    parser.add_argument('--malformed', action='store_true', help="另外合成内容含非法控制字符的XML")
+    parser.add_argument('--backend', action='append', choices=tuple(XML_BACKENDS), default=[],
+                        help="只测试指定的后端，可重复指定")
+    parser.add_argument('--repeat', type=int, default=3, help="每个后端重复解析的次数，取最快一次")
+    parser.add_argument('--output', default=None, help="把结果保存为JSON文件")
+    args = parser.parse_args()
+
+    available = available_xml_backends()
+    backends = [backend for backend in (args.backend or XML_BACKENDS) if backend in available]
+    missing = [backend for backend in (args.backend or XML_BACKENDS) if backend not in available]
+    if missing:
+        print(f"未安装，跳过: {', '.join(missing)}")
+    if not backends:
+        sys.exit(2)
+
+    if args.paths:
+        fixtures = find_fixtures(args.paths)
+        if not fixtures:
+            print("没有找到弹幕XML")
+            sys.exit(2)
+    else:
+        fixtures = synthetic_fixtures(args.sizes, args.malformed)
+
+    results = {}
+    for name, source in fixtures:
+        if isinstance(source, bytes):
+            body = source
+        else:
+            with open(source, 'rb') as f:
+                body = f.read()
+        print(f"{name}: {len(body) / 1024 / 1024:.1f} MB")
+        results[name] = benchmark(name, body, backends, max(1, args.repeat))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
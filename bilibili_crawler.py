@@ -11,21 +11,226 @@ import json
 import time
 import re
 import csv
+import os
+import sqlite3
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs
 
+from rate_limiter import AdaptiveRateLimiter, classify_endpoint, THROTTLE_STATUS_CODES, THROTTLE_API_CODES
+from http_resilience import (RetryPolicy, CircuitBreakerRegistry, RequestFailedError,
+                             CircuitOpenError, RETRYABLE_STATUS_CODES, RETRYABLE_API_CODES)
+from danmaku_batch import DanmakuBatch
+from danmaku_parser import iter_danmaku_xml_batches, resolve_xml_backend, DANMAKU_FIELDS
+from danmaku_protobuf import decode_danmaku_segment_batch, segment_count
+from parquet_store import ParquetDanmakuStore
+from sqlite_store import SQLiteDanmakuStore, DEFAULT_SQLITE_PATH
+from data_catalog import DataCatalog, DEFAULT_CATALOG_PATH
+from csv_writer import StreamingCSVWriter
+from write_behind import WriteBehindWriter, DEFAULT_WRITE_QUEUE_SIZE
+from async_crawler import AsyncCrawlEngine
+from history_sweeper import HistoryDanmakuSweeper
+from watermarks import WatermarkStore
+from response_cache import ResponseCache, CachingHTTPAdapter, cache_key
+from job_queue import open_job_queue
+from session_pool import SessionPool
+from traffic_replay import TrafficCassette, RecordingHTTPAdapter, ReplayHTTPAdapter
+
+
+# 弹幕CSV的列：弹幕字段加上所属分P和cid
+DANMAKU_CSV_FIELDS = DANMAKU_FIELDS + ['page', 'cid']
+
 
 class BilibiliCrawler:
-    def __init__(self, danmaku_limit=None):
-        self.session = requests.Session()
+    def __init__(self, danmaku_limit=None, api_base='https://api.bilibili.com',
+                 comment_base='https://comment.bilibili.com', rate_limiter=None,
+                 retry_policy=None, danmaku_source='xml', segment_workers=4, watermarks=None,
+                 cache_dir=None, cache_ttls=None, page_workers=4, record_dir=None, replay_dir=None,
+                 replay_realtime=False, xml_backend=None, storage='csv', parquet_dir='danmaku_parquet',
+                 catalog_path=DEFAULT_CATALOG_PATH, sqlite_path=DEFAULT_SQLITE_PATH,
+                 write_behind=False, write_queue_size=DEFAULT_WRITE_QUEUE_SIZE):
+        if storage not in ('csv', 'parquet', 'sqlite'):
+            raise ValueError(f"未知的存储方式: {storage}（可选 csv, parquet, sqlite）")
+        if sum(1 for option in (cache_dir, record_dir, replay_dir) if option) > 1:
+            raise ValueError("cache_dir、record_dir、replay_dir只能设置其中一个")
+        # 磁盘响应缓存：设置cache_dir后挂载到每个session上，重复运行时复用已下载的响应
+        self.response_cache = ResponseCache(cache_dir, cache_ttls) if cache_dir else None
+        # 流量录制/回放：record_dir录制所有响应，replay_dir按录制顺序回放而不访问网络
+        self.traffic_cassette = TrafficCassette(record_dir or replay_dir) if (record_dir or replay_dir) else None
+        self.replaying = bool(replay_dir)
+        self.replay_realtime = replay_realtime
+        # 会话池：默认只有一个会话，可通过add_session添加更多登录身份或代理
+        self.session_pool = SessionPool(self._new_session)
+        self.session = self.session_pool.add(name='default').session
+        self.danmaku_limit = danmaku_limit  # 弹幕抓取上限
+        self.song_names = {}  # 存储从urls.txt中读取的歌曲名称
+        # 接口地址前缀，可替换为本地模拟服务器地址用于离线测试
+        self.api_base = api_base.rstrip('/')
+        self.comment_base = comment_base.rstrip('/')
+        # 所有请求共享的自适应限速器，按接口分别限速
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        # 重试策略和按接口划分的熔断器
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breakers = CircuitBreakerRegistry()
+        # 按域名的并发请求上限（HostConcurrencyLimiter），由批量抓取引擎设置；为None时不限制
+        self.host_limiter = None
+        # 结构化的失败记录，批量抓取结束后汇总
+        self.failures = []
+        self._failures_lock = threading.Lock()
+        # 弹幕来源：'xml' 为 comment.bilibili.com 的XML（有条数上限），
+        # 'segment' 为按6分钟分段的protobuf接口（完整弹幕）
+        self.danmaku_source = danmaku_source
+        # 弹幕XML解析后端：'lxml' 或 'stdlib'，默认安装了lxml时使用lxml
+        self.xml_backend = resolve_xml_backend(xml_backend)
+        self.segment_workers = max(1, int(segment_workers))
+        # 多P视频同时抓取的分P数量
+        self.page_workers = max(1, int(page_workers))
+        # 增量抓取水位线（WatermarkStore），为None时每次全量写入
+        self.watermarks = watermarks
+        # 弹幕和视频信息的存储方式：'csv' 为每个视频一对CSV文件，
+        # 'parquet' 为按bvid/cid/抓取日期分区的Parquet存储（需要pyarrow），
+        # 'sqlite' 为所有视频共用的SQLite数据库（按弹幕ID去重，不使用水位线）
+        self.storage = storage
+        self.parquet_store = ParquetDanmakuStore(parquet_dir) if storage == 'parquet' else None
+        self.sqlite_store = SQLiteDanmakuStore(sqlite_path) if storage == 'sqlite' else None
+        # 数据目录库：每次保存后登记数据文件的位置、条数和内容哈希，首次保存时才打开；为None时不登记
+        self.catalog_path = catalog_path
+        self._catalog = None
+        self._catalog_lock = threading.Lock()
+        # 后台写入：CSV弹幕和视频信息的写文件、fsync和提交交给专门的写入线程，与网络请求重叠；
+        # 队列满时抓取线程等待。为None时在抓取线程中直接写入
+        self.write_behind = WriteBehindWriter(write_queue_size) if write_behind else None
+
+    @property
+    def catalog(self):
+        """
+        数据目录库（DataCatalog），未设置catalog_path时为None
+        """
+        if self.catalog_path is None:
+            return None
+        with self._catalog_lock:
+            if self._catalog is None:
+                self._catalog = DataCatalog(self.catalog_path)
+            return self._catalog
+
+    def _catalog_video(self, video_info, storage, info_path):
+        """
+        在目录库中登记视频信息文件；登记失败不影响已保存的数据
+        """
+        if self.catalog is None:
+            return
+        try:
+            self.catalog.record_video(video_info, storage, info_path)
+        except sqlite3.Error as e:
+            print(f"更新数据目录库时发生异常: {e}")
+
+    def _catalog_danmaku(self, video_info, storage, path, results, append):
+        """
+        在目录库中登记各分P的弹幕文件
+        results: [{'cid', 'page', 'written'}]，written为本次写入的条数；
+                 各分P保存在不同位置时在结果中给出 'path'，否则都使用path
+        append: 是否为增量追加（条数累加到已有记录）
+        """
+        if self.catalog is None:
+            return
+        entries = [{'cid': result['cid'], 'page': result['page'], 'path': result.get('path', path),
+                    'rows': result['written']}
+                   for result in results]
+        try:
+            self.catalog.record_danmaku(video_info['bvid'], storage, entries, append=append)
+        except sqlite3.Error as e:
+            print(f"更新数据目录库时发生异常: {e}")
+
+    def _submit_write(self, key, func, *args, cleanup=None):
+        """
+        执行一个写入操作：启用后台写入时提交到写入线程（按提交顺序执行），否则直接执行
+        key: 操作所属视频的BV号
+        cleanup: 写入失败时调用，用于删除临时文件
+        """
+        if self.write_behind is not None:
+            self.write_behind.submit(key, func, *args, cleanup=cleanup)
+            return
+        try:
+            func(*args)
+        except BaseException:
+            if cleanup is not None:
+                cleanup()
+            raise
+
+    def wait_for_writes(self, bvid, target=None):
+        """
+        等待视频的所有后台写入完成（数据已fsync并提交），写入失败时记录失败并返回异常，否则返回None
+        target: 记录失败时使用的目标（如视频链接），默认为BV号
+        """
+        if self.write_behind is None:
+            return None
+        error = self.write_behind.wait(bvid)
+        if error is not None:
+            self._report_write_error(target or bvid, error)
+        return error
+
+    def _report_write_error(self, target, error):
+        print(f"写入 {target} 的数据时发生异常: {error}")
+        self.record_failure(target, 'write', error)
+
+    def flush_writes(self):
+        """
+        等待所有后台写入完成，记录其中的失败，返回失败的视频数
+        """
+        if self.write_behind is None:
+            return 0
+        errors = self.write_behind.flush()
+        for bvid, error in errors.items():
+            self._report_write_error(bvid, error)
+        return len(errors)
+
+    def close(self):
+        """
+        按提交顺序写完所有后台写入后停止写入线程，记录其中的失败
+        """
+        if self.write_behind is None:
+            return
+        writer, self.write_behind = self.write_behind, None
+        for bvid, error in writer.close().items():
+            self._report_write_error(bvid, error)
+
+    def _new_session(self):
+        """
+        创建设置好请求头（以及响应缓存或流量录制/回放）的requests.Session
+        """
+        session = requests.Session()
         # 设置User-Agent，模拟浏览器访问
-        self.session.headers.update({
+        session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36',
             'Referer': 'https://www.bilibili.com/'
         })
-        self.danmaku_limit = danmaku_limit  # 弹幕抓取上限
-        self.logged_in = False
-        self.song_names = {}  # 存储从urls.txt中读取的歌曲名称
+        adapter = None
+        if self.response_cache is not None:
+            adapter = CachingHTTPAdapter(self.response_cache)
+        elif self.replaying:
+            adapter = ReplayHTTPAdapter(self.traffic_cassette, realtime=self.replay_realtime)
+        elif self.traffic_cassette is not None:
+            adapter = RecordingHTTPAdapter(self.traffic_cassette)
+        if adapter is not None:
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+    @property
+    def logged_in(self):
+        return self.session_pool.logged_in
+
+    def add_session(self, cookies_str=None, proxy=None, rate_limiter=None):
+        """
+        向会话池添加一个会话（新的登录身份和/或代理），使用独立的限速器，
+        吞吐量随身份数量增加；请求总是交给当前最健康的会话
+        rate_limiter: 该会话的限速器，默认按默认预算新建
+        """
+        rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        pooled = self.session_pool.add(cookies_str, proxy, rate_limiter=rate_limiter)
+        print(f"已添加会话 {pooled.name}" + ("（已登录）" if pooled.logged_in else ""))
+        return pooled
 
     def login(self, username, password):
         """
@@ -43,23 +248,202 @@ class BilibiliCrawler:
         cookies_str: 浏览器中获取的cookies字符串
         """
         try:
-            # 解析cookies字符串
-            cookies = {}
-            for item in cookies_str.split(';'):
-                item = item.strip()
-                if '=' in item:
-                    key, value = item.split('=', 1)
-                    cookies[key] = value
-            
-            # 设置cookies
-            self.session.cookies.update(cookies)
-            self.logged_in = True
+            # 设置默认会话的cookies
+            self.session_pool.set_cookies(self.session_pool.sessions[0], cookies_str)
             print("Cookies设置成功，已登录")
             return True
         except Exception as e:
             print(f"Cookies设置失败: {e}")
             return False
 
+    def _request(self, url, params=None, parse_json=False, stream=False):
+        """
+        发送GET请求：检查熔断器、按接口预算限速，失败时指数退避重试
+        parse_json为True时返回解析后的JSON（接口返回码同时反馈给限速器），否则返回response
+        stream为True时只读取响应头，响应体由调用方边下载边处理，处理完毕后需关闭response
+        所有尝试都失败或遇到不可重试的错误时抛出RequestFailedError
+        """
+        endpoint = classify_endpoint(url)
+        breaker = self.circuit_breakers.get(endpoint)
+        policy = self.retry_policy
+        reason = None
+        
+        for attempt in range(1, policy.max_attempts + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(url, endpoint)
+            breaker_recorded = False
+            try:
+                # 每次尝试都选择当前最健康的会话，被限流的身份会自动让给其他会话
+                pooled = self.session_pool.acquire(require_login=endpoint == 'dm_history')
+                rate_limiter = pooled.rate_limiter or self.rate_limiter
+                # 回放的请求和缓存未过期的请求不会发到服务器，无需占用限速配额；
+                # 需要登录的接口按所选会话的身份查找缓存
+                cached = self.replaying or (
+                    self.response_cache is not None and
+                    self.response_cache.is_fresh(cache_key(
+                        pooled.session.prepare_request(requests.Request('GET', url, params=params)))))
+                if not cached:
+                    rate_limiter.acquire(url)
+                # 按域名限制同时进行的请求数；流式读取的响应在调用方关闭响应时才释放名额
+                release_host = (self.host_limiter.acquire(url)
+                                if self.host_limiter is not None and not cached else None)
+                
+                started = time.monotonic()
+                try:
+                    response = pooled.session.get(url, params=params, timeout=policy.timeout, stream=stream)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if release_host is not None:
+                        release_host()
+                    breaker.record_failure()
+                    breaker_recorded = True
+                    reason = f"网络异常: {e.__class__.__name__}"
+                    self.session_pool.release(pooled, time.monotonic() - started, ok=False)
+                except BaseException:
+                    if release_host is not None:
+                        release_host()
+                    self.session_pool.release(pooled, time.monotonic() - started, ok=False)
+                    raise
+                else:
+                    if release_host is not None:
+                        if stream:
+                            response.close = self._closing_with(response.close, release_host)
+                        else:
+                            release_host()
+                    status = response.status_code
+                    data = None
+                    api_code = None
+                    if parse_json:
+                        try:
+                            data = response.json()
+                            api_code = data.get('code') if isinstance(data, dict) else None
+                        except ValueError:
+                            data = None
+                
+                    if not cached:
+                        rate_limiter.feedback(url, status, api_code)
+                    throttled = status in THROTTLE_STATUS_CODES or api_code in THROTTLE_API_CODES
+                    ok = status == 200 and not throttled
+                    self.session_pool.release(pooled, time.monotonic() - started, ok, throttled)
+                    # 只有服务端错误计入熔断，限流由限速器负责
+                    if status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    breaker_recorded = True
+                
+                    if status != 200 and stream:
+                        response.close()
+                
+                    if status in RETRYABLE_STATUS_CODES or api_code in RETRYABLE_API_CODES:
+                        reason = f"HTTP {status}" if api_code is None else f"HTTP {status}, 返回码 {api_code}"
+                    elif status != 200:
+                        raise RequestFailedError(url, endpoint, f"HTTP {status}", attempt, retryable=False)
+                    elif parse_json and data is None:
+                        raise RequestFailedError(url, endpoint, "响应不是有效的JSON", attempt, retryable=False)
+                    else:
+                        return data if parse_json else response
+            finally:
+                # 其他异常（非网络类的请求异常、解析响应时出错、被中断等）同样结束本次尝试，
+                # 否则半开状态的试探请求一直占用，该接口在进程结束前都无法恢复
+                if not breaker_recorded:
+                    breaker.record_failure()
+            
+            if attempt < policy.max_attempts:
+                policy.sleep(attempt)
+        
+        raise RequestFailedError(url, endpoint, reason, policy.max_attempts, retryable=True)
+
+    @staticmethod
+    def _closing_with(close, release):
+        """
+        包装response.close：关闭响应后释放域名的请求名额
+        """
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+        return close_and_release
+
+    def record_failure(self, target, stage, error):
+        """
+        记录一次结构化的失败结果
+        target: 失败的视频链接、BV号或cid
+        stage: 失败的阶段，如 'video_info'、'danmaku'、'history'
+        """
+        if isinstance(error, RequestFailedError):
+            failure = {
+                'target': target,
+                'stage': stage,
+                'endpoint': error.endpoint,
+                'url': error.url,
+                'reason': error.reason,
+                'attempts': error.attempts,
+                'retryable': error.retryable,
+            }
+        else:
+            failure = {
+                'target': target,
+                'stage': stage,
+                'endpoint': None,
+                'url': None,
+                'reason': f"{error.__class__.__name__}: {error}",
+                'attempts': 0,
+                'retryable': False,
+            }
+        with self._failures_lock:
+            self.failures.append(failure)
+        return failure
+
+    def last_failure(self, target):
+        """
+        返回target最近一次的失败记录，没有时返回None
+        """
+        with self._failures_lock:
+            for failure in reversed(self.failures):
+                if failure['target'] == target:
+                    return failure
+        return None
+
+    def save_failures(self, filename="failed_urls.txt"):
+        """
+        将可重试的失败视频写成与urls.txt相同格式的文件，可直接作为批量抓取的输入重新运行
+        返回写入的视频数量
+        """
+        targets = []
+        for failure in self.failures:
+            if failure['retryable'] and failure['target'] not in targets:
+                targets.append(failure['target'])
+        if not targets:
+            return 0
+        
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                for target in targets:
+                    target = str(target)
+                    bvid = self.get_bvid_from_url(target) if target.startswith('http') else target
+                    if bvid in self.song_names:
+                        f.write(f"# {self.song_names[bvid]}\n")
+                    f.write(f"{target}\n")
+        except Exception as e:
+            print(f"保存失败列表时发生异常: {e}")
+            return 0
+        return len(targets)
+
+    def print_failure_summary(self):
+        """
+        按阶段和原因汇总失败结果
+        """
+        if not self.failures:
+            return
+        summary = {}
+        for failure in self.failures:
+            key = (failure['stage'], failure['reason'], failure['retryable'])
+            summary[key] = summary.get(key, 0) + 1
+        print(f"失败 {len(self.failures)} 次：")
+        for (stage, reason, retryable), count in sorted(summary.items(), key=lambda item: -item[1]):
+            print(f"  [{stage}] {reason} x{count}{'（可重试）' if retryable else ''}")
+
     def get_bvid_from_url(self, url):
         """
         从URL中提取BV号
@@ -108,17 +492,16 @@ class BilibiliCrawler:
         if url_or_bvid.startswith('http'):
             bvid = self.get_bvid_from_url(url_or_bvid)
             if not bvid:
-                print("无效的B站视频URL")
+                self.record_failure(url_or_bvid, 'video_info', ValueError("无效的B站视频URL"))
                 return None
         else:
             bvid = url_or_bvid
         
-        url = 'https://api.bilibili.com/x/web-interface/view'
+        url = f'{self.api_base}/x/web-interface/view'
         params = {'bvid': bvid}
         
         try:
-            response = self.session.get(url, params=params)
-            data = response.json()
+            data = self._request(url, params=params, parse_json=True)
             
             if data['code'] == 0:
                 video_data = data['data']
@@ -130,7 +513,14 @@ class BilibiliCrawler:
                     'duration': video_data['duration'],
                     'pubdate': video_data['pubdate'],
                     'owner': video_data['owner']['name'],
-                    'cid': video_data['cid'],  # 默认cid，用于弹幕爬取
+                    'cid': video_data['cid'],  # 默认cid（第1P）
+                    # 所有分P，多P视频会逐个抓取弹幕
+                    'pages': [{
+                        'page': page['page'],
+                        'cid': page['cid'],
+                        'part': page.get('part', ''),
+                        'duration': page.get('duration', video_data['duration']),
+                    } for page in video_data.get('pages') or []],
                     'view': video_data['stat']['view'],      # 播放数
                     'danmaku': video_data['stat']['danmaku'], # 弹幕数
                     'comment': video_data['stat']['reply'],   # 评论数
@@ -146,152 +536,523 @@ class BilibiliCrawler:
                 
                 return video_info
             else:
-                print(f"获取视频信息失败: {data['message']}")
+                error = RequestFailedError(url, 'view', f"获取视频信息失败: {data.get('message')}",
+                                           retryable=False)
+                self.record_failure(url_or_bvid, 'video_info', error)
                 return None
         except Exception as e:
-            print(f"获取视频信息时发生异常: {e}")
+            self.record_failure(url_or_bvid, 'video_info', e)
             return None
 
-    def crawl_danmaku(self, oid):
+    def get_video_stats(self, bvid):
         """
-        爬取弹幕数据（当前弹幕）
+        只获取视频当前的统计数据（播放、弹幕、评论、点赞、投币、收藏、转发）和发布时间，供定时轮询使用
+        请求失败时抛出RequestFailedError
+        """
+        url = f'{self.api_base}/x/web-interface/view'
+        data = self._request(url, params={'bvid': bvid}, parse_json=True)
+        if data['code'] != 0:
+            raise RequestFailedError(url, 'view', f"获取视频统计数据失败: {data.get('message')}",
+                                     retryable=False)
+        stat = data['data']['stat']
+        return {
+            'bvid': bvid,
+            'pubdate': data['data']['pubdate'],
+            'view': stat['view'],
+            'danmaku': stat['danmaku'],
+            'reply': stat['reply'],
+            'like': stat['like'],
+            'coin': stat['coin'],
+            'favorite': stat['favorite'],
+            'share': stat['share'],
+        }
+
+    def danmaku_xml_url(self, oid):
+        """
+        当前弹幕XML的地址
         oid: 视频的cid
         """
-        danmaku_url = f'https://comment.bilibili.com/{oid}.xml'
-        danmakus = self._fetch_danmaku_from_url(danmaku_url)
-        return danmakus
+        return f'{self.comment_base}/{oid}.xml'
+
+    def iter_danmaku(self, oid):
+        """
+        流式爬取当前弹幕，逐条产出弹幕记录
+        oid: 视频的cid
+        请求失败时抛出RequestFailedError
+        """
+        return self._iter_danmaku_from_url(self.danmaku_xml_url(oid))
+
+    def iter_danmaku_batches(self, oid):
+        """
+        流式爬取当前弹幕，每收到一块数据产出一个DanmakuBatch
+        oid: 视频的cid
+        请求失败时抛出RequestFailedError
+        """
+        return self._iter_danmaku_batches_from_url(self.danmaku_xml_url(oid))
 
-    def crawl_historical_danmaku(self, oid, date):
+    def crawl_danmaku(self, oid, raise_errors=False):
         """
-        爬取历史弹幕数据
+        爬取弹幕数据（当前弹幕），返回DanmakuBatch
+        oid: 视频的cid
+        raise_errors: 为True时请求失败抛出RequestFailedError，否则记录失败并返回空批次
+        """
+        try:
+            return self._fetch_danmaku_from_url(self.danmaku_xml_url(oid))
+        except RequestFailedError as e:
+            if raise_errors:
+                raise
+            self.record_failure(oid, 'danmaku', e)
+            return DanmakuBatch()
+
+    def danmaku_segment_url(self, oid, segment_index):
+        """
+        分段弹幕（protobuf）的地址，segment_index从1开始，每段6分钟
+        """
+        return f'{self.api_base}/x/v2/dm/web/seg.so?type=1&oid={oid}&segment_index={segment_index}'
+
+    def crawl_danmaku_segments(self, oid, duration, raise_errors=False):
+        """
+        爬取分段弹幕：按视频时长计算分段数，并发下载所有分段，
+        按分段顺序合并为一个DanmakuBatch
+        oid: 视频的cid
+        duration: 视频时长（秒）
+        raise_errors: 为True时任一分段失败即抛出RequestFailedError，否则记录失败并返回空批次
+        """
+        try:
+            return DanmakuBatch.concat(self.iter_danmaku_segment_batches(oid, duration))
+        except RequestFailedError as e:
+            if raise_errors:
+                raise
+            self.record_failure(oid, 'danmaku', e)
+            return DanmakuBatch()
+
+    def iter_danmaku_segment_batches(self, oid, duration):
+        """
+        并发下载分段弹幕，按分段顺序逐段产出DanmakuBatch，达到弹幕抓取上限后停止
+        oid: 视频的cid
+        duration: 视频时长（秒）
+        任一分段失败时抛出RequestFailedError
+        """
+        urls = [self.danmaku_segment_url(oid, index) for index in range(1, segment_count(duration) + 1)]
+        remaining = self.danmaku_limit or None
+        with ThreadPoolExecutor(max_workers=min(self.segment_workers, len(urls))) as executor:
+            for batch in executor.map(self._fetch_danmaku_segment, urls):
+                # 如果设置了弹幕抓取上限，只保留前面的部分
+                if remaining is not None:
+                    batch = batch.head(remaining)
+                    remaining -= len(batch)
+                yield batch
+                if remaining == 0:
+                    break
+
+    def crawl_historical_danmaku(self, oid, date, raise_errors=False):
+        """
+        爬取历史弹幕数据，返回DanmakuBatch
         oid: 视频的cid
         date: 日期，格式为 'YYYY-MM-DD'
+        raise_errors: 为True时请求失败抛出RequestFailedError，否则记录失败并返回空批次
         """
         if not self.logged_in:
             print("需要登录才能获取历史弹幕，请先设置cookies")
-            return []
+            return DanmakuBatch()
         
-        danmaku_url = f'https://api.bilibili.com/x/v2/dm/history?type=1&oid={oid}&date={date}'
-        danmakus = self._fetch_danmaku_from_api(danmaku_url)
-        return danmakus
+        danmaku_url = f'{self.api_base}/x/v2/dm/history?type=1&oid={oid}&date={date}'
+        try:
+            return self._fetch_danmaku_from_api(danmaku_url)
+        except RequestFailedError as e:
+            if raise_errors:
+                raise
+            self.record_failure(oid, 'history', e)
+            return DanmakuBatch()
+
+    def _iter_danmaku_from_url(self, url):
+        """
+        从XML URL流式获取弹幕数据，逐条产出弹幕记录字典
+        """
+        for batch in self._iter_danmaku_batches_from_url(url):
+            yield from batch.records()
+
+    def _iter_danmaku_batches_from_url(self, url):
+        """
+        从XML URL流式获取弹幕数据，每收到一块数据产出一个DanmakuBatch
+        边下载边解压边解析，达到弹幕抓取上限后立即关闭连接，不再下载剩余内容
+        请求失败、传输中断或XML无法解析时抛出RequestFailedError
+        """
+        response = self._request(url, stream=True)
+        try:
+            chunks = response.iter_content(chunk_size=64 * 1024)
+            yield from iter_danmaku_xml_batches(chunks, limit=self.danmaku_limit, backend=self.xml_backend)
+        except ET.ParseError as e:
+            # 响应被截断时XML不完整，稍后重新抓取可能成功
+            raise RequestFailedError(url, 'comment_xml', f"弹幕XML解析失败: {e}")
+        except requests.RequestException as e:
+            raise RequestFailedError(url, 'comment_xml', f"弹幕传输中断: {e.__class__.__name__}")
+        finally:
+            response.close()
 
     def _fetch_danmaku_from_url(self, url):
         """
-        从XML URL获取弹幕数据
+        从XML URL获取弹幕数据，返回DanmakuBatch
+        请求失败或XML无法解析时抛出RequestFailedError
         """
+        return DanmakuBatch.concat(self._iter_danmaku_batches_from_url(url))
+
+    def _fetch_danmaku_segment(self, url):
+        """
+        获取并解析一个分段的protobuf弹幕，返回DanmakuBatch
+        请求失败或消息无法解析时抛出RequestFailedError
+        """
+        response = self._request(url)
+        
+        # 出错时接口返回JSON而不是protobuf
+        if 'json' in response.headers.get('Content-Type', ''):
+            try:
+                message = response.json().get('message')
+            except ValueError:
+                message = response.text[:100]
+            raise RequestFailedError(url, 'dm_segment', f"分段弹幕接口响应异常: {message}", retryable=False)
+        
         try:
-            response = self.session.get(url)
-            response.encoding = 'utf-8'
-            
-            # 检查响应状态
-            if response.status_code != 200:
-                print(f"弹幕API响应异常，状态码: {response.status_code}")
-                return []
-            
-            # 解析XML弹幕数据
-            root = ET.fromstring(response.text)
-            danmakus = []
-            
-            for elem in root.iter('d'):
-                # 如果设置了弹幕抓取上限，达到上限则停止
-                if self.danmaku_limit and len(danmakus) >= self.danmaku_limit:
-                    break
-                    
-                # 弹幕属性在p标签中，用逗号分隔
-                try:
-                    attrs = elem.attrib['p'].split(',')
-                    if len(attrs) >= 9 and elem.text:
-                        danmaku_info = {
-                            'content': elem.text,  # 弹幕内容
-                            'time': float(attrs[0]),  # 弹幕出现时间（秒）
-                            'type': int(attrs[3]),  # 弹幕类型
-                            'fontsize': int(attrs[2]),  # 字体大小
-                            'color': int(attrs[1]),  # 颜色
-                            'timestamp': int(attrs[4]),  # 发送时间戳
-                            'pool': int(attrs[5]),  # 弹幕池
-                            'uid': attrs[6],  # 发送者UID
-                            'row_id': attrs[7]  # 弹幕ID
-                        }
-                        danmakus.append(danmaku_info)
-                except (ValueError, IndexError) as e:
-                    # 忽略格式不正确的弹幕数据
-                    continue
-            
-            return danmakus
-        except Exception as e:
-            print(f"爬取弹幕时发生异常: {e}")
-            return []
+            return decode_danmaku_segment_batch(response.content)
+        except ValueError as e:
+            raise RequestFailedError(url, 'dm_segment', f"分段弹幕解析失败: {e}")
 
     def _fetch_danmaku_from_api(self, url):
         """
-        从API获取弹幕数据
+        从API获取弹幕数据，直接填充DanmakuBatch
+        请求失败或接口返回错误码时抛出RequestFailedError
         """
-        try:
-            response = self.session.get(url)
-            data = response.json()
-            
-            # 检查响应状态
-            if data['code'] != 0:
-                print(f"弹幕API响应异常: {data['message']}")
-                return []
-            
-            danmakus = []
-            for elem in data.get('data', []):
-                # 如果设置了弹幕抓取上限，达到上限则停止
-                if self.danmaku_limit and len(danmakus) >= self.danmaku_limit:
-                    break
-                    
-                try:
-                    # 解析弹幕数据
-                    danmaku_info = {
-                        'content': elem.get('content', ''),  # 弹幕内容
-                        'time': float(elem.get('progress', 0)) / 1000,  # 弹幕出现时间（毫秒转秒）
-                        'type': elem.get('mode', 1),  # 弹幕类型
-                        'fontsize': elem.get('fontsize', 25),  # 字体大小
-                        'color': elem.get('color', 16777215),  # 颜色
-                        'timestamp': elem.get('ctime', 0),  # 发送时间戳
-                        'pool': elem.get('pool', 0),  # 弹幕池
-                        'uid': elem.get('mid_hash', ''),  # 发送者UID
-                        'row_id': elem.get('id_str', '')  # 弹幕ID
-                    }
-                    danmakus.append(danmaku_info)
-                except (ValueError, IndexError) as e:
-                    # 忽略格式不正确的弹幕数据
-                    continue
-            
-            return danmakus
-        except Exception as e:
-            print(f"爬取弹幕时发生异常: {e}")
-            return []
+        data = self._request(url, parse_json=True)
+        
+        # 检查响应状态
+        if data['code'] != 0:
+            raise RequestFailedError(url, 'dm_history', f"弹幕API响应异常: {data.get('message')}",
+                                     retryable=False)
+        
+        danmakus = DanmakuBatch()
+        for elem in data.get('data') or []:
+            # 如果设置了弹幕抓取上限，达到上限则停止
+            if self.danmaku_limit and len(danmakus) >= self.danmaku_limit:
+                break
+                
+            try:
+                values = (
+                    float(elem.get('progress', 0)) / 1000,  # 弹幕出现时间（毫秒转秒）
+                    int(elem.get('mode', 1)),  # 弹幕类型
+                    int(elem.get('fontsize', 25)),  # 字体大小
+                    int(elem.get('color', 16777215)),  # 颜色
+                    int(elem.get('ctime', 0)),  # 发送时间戳
+                    int(elem.get('pool', 0)),  # 弹幕池
+                )
+                danmakus.append(str(elem.get('content', '')), *values,
+                                str(elem.get('mid_hash', '')), str(elem.get('id_str', '')))
+            except (ValueError, TypeError):
+                # 忽略格式不正确的弹幕数据
+                continue
+        
+        return danmakus
 
-    def save_danmaku_to_csv(self, danmakus, filename):
+    def save_danmaku_to_csv(self, danmakus, filename, append=False):
         """
         将弹幕数据保存为CSV文件
+        danmakus: DanmakuBatch（按列逐行写入）或弹幕记录字典列表
+        append: 为True且文件已存在时追加写入（不重复写表头，按已有文件的表头对齐列）
+        返回是否写入成功
         """
         if not danmakus:
             print("没有弹幕数据需要保存")
-            return
+            return False
         
+        # 先写入临时文件，完成后再替换（或追加到）目标文件，失败时不破坏已有数据
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['content', 'time', 'type', 'fontsize', 'color', 'timestamp', 'pool', 'uid', 'row_id']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for danmaku in danmakus:
-                    writer.writerow(danmaku)
+            with StreamingCSVWriter(filename, DANMAKU_CSV_FIELDS, append=append) as writer:
+                writer.write(danmakus)
             
-            print(f"弹幕数据已保存至 {filename}")
+            print(f"弹幕数据已{'追加' if append else '保存'}至 {filename}")
+            return True
         except Exception as e:
             print(f"保存弹幕数据时发生异常: {e}")
+            return False
+
+    def _iter_page_batches(self, page):
+        """
+        按配置的弹幕来源分批产出某个分P的弹幕（DanmakuBatch）
+        """
+        if self.danmaku_source == 'segment':
+            return self.iter_danmaku_segment_batches(page['cid'], page['duration'])
+        return self.iter_danmaku_batches(page['cid'])
+
+    def _crawl_page(self, page, write, watermark):
+        """
+        抓取一个分P的弹幕，每收到一批弹幕调用一次write(batch)
+        watermark: 增量抓取时该cid的水位线，只写入水位线之后的弹幕；为None时全部写入
+        返回抓取条数、写入条数和写入弹幕中最大的先后顺序键
+        """
+        mark = (watermark['timestamp'], watermark['row_id']) if watermark else None
+        fetched = 0
+        written = 0
+        max_key = None
+        for batch in self._iter_page_batches(page):
+            fetched += len(batch)
+            if mark is not None:
+                batch = batch.newer_than(mark)
+            batch.set_constant('page', page['page']).set_constant('cid', page['cid'])
+            write(batch)
+            written += len(batch)
+            key = batch.max_order_key()
+            if key is not None and (max_key is None or key > max_key):
+                max_key = key
+        return {'page': page['page'], 'cid': page['cid'],
+                'fetched': fetched, 'written': written, 'max_key': max_key}
+
+    def _crawl_page_to_file(self, page, part_path, watermark):
+        """
+        抓取一个分P的弹幕，边抓取边写入该分P的临时文件（不含表头）
+        """
+        with open(part_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            return self._crawl_page(page, lambda batch: writer.writerows(batch.rows(DANMAKU_CSV_FIELDS)), watermark)
+
+    def _advance_page_watermarks(self, results, incremental):
+        """
+        所有分P都成功写入后推进各分P的水位线；全量写入时先重建水位线
+        """
+        if self.watermarks is None:
+            return
+        for result in results:
+            if not incremental:
+                self.watermarks.reset(result['cid'])
+            if result['max_key'] is not None:
+                self.watermarks.advance_to(result['cid'], result['max_key'], result['written'])
+
+    def crawl_video_pages(self, video_info, filename):
+        """
+        抓取视频所有分P的弹幕并保存到filename，解析器每产出一批弹幕就写入一批，内存占用与弹幕总量无关：
+        单P视频直接流式写入filename旁的临时文件；多P视频并发抓取，各分P边抓取边写入自己的临时文件，
+        全部成功后按分P顺序合并。写完后才原子替换（或追加到）filename，
+        任一分P失败时删除临时文件并抛出RequestFailedError，已有的CSV保持不变
+        启用后台写入时写文件、合并和提交都交给写入线程，抓取完成后立即返回
+        返回本次抓取的弹幕条数
+        """
+        bvid = video_info['bvid']
+        # 同一视频上一次的写入完成后才能判断文件是否存在以及水位线
+        self.wait_for_writes(bvid)
+        pages = video_info['pages']
+        # 所有分P都有水位线且文件存在时增量追加，否则全量重写
+        incremental = (self.watermarks is not None and os.path.exists(filename) and
+                       all(self.watermarks.get(page['cid']) is not None for page in pages))
+        
+        if len(pages) == 1:
+            results = self._crawl_page_to_csv(video_info, pages[0], filename, incremental)
+        else:
+            results = self._crawl_pages_to_file(video_info, pages, filename, incremental)
+        return sum(result['fetched'] for result in results)
+
+    def _finish_video_pages(self, video_info, filename, results, saved, incremental):
+        """
+        弹幕文件提交后推进水位线并登记到目录库
+        """
+        if saved:
+            print(f"弹幕数据已{'追加' if incremental else '保存'}至 {filename}")
+        elif incremental:
+            print(f"没有新弹幕，跳过写入 {filename}")
+        else:
+            print("没有弹幕数据需要保存")
+        
+        self._advance_page_watermarks(results, incremental)
+        if saved or incremental:
+            self._catalog_danmaku(video_info, 'csv', filename, results, append=incremental)
+
+    def _crawl_page_to_csv(self, video_info, page, filename, incremental):
+        """
+        抓取单个分P的弹幕，每批弹幕直接写入filename旁的临时文件，全部成功后提交；没有弹幕时不写文件
+        返回抓取结果列表
+        """
+        bvid = video_info['bvid']
+        writer = StreamingCSVWriter(filename, DANMAKU_CSV_FIELDS, append=incremental)
+        try:
+            result = self._crawl_page(page, lambda batch: self._submit_write(bvid, writer.write, batch),
+                                      self.watermarks.get(page['cid']) if incremental else None)
+        except BaseException:
+            self._submit_write(bvid, writer.abort)
+            raise
+        
+        def finish():
+            saved = bool(writer.rows)
+            if saved:
+                writer.commit()
+            else:
+                writer.abort()
+            self._finish_video_pages(video_info, filename, [result], saved, incremental)
+        
+        self._submit_write(bvid, finish, cleanup=writer.abort)
+        return [result]
+
+    def _crawl_pages_to_file(self, video_info, pages, filename, incremental):
+        """
+        并发抓取多个分P的弹幕，各分P边抓取边写入临时文件，全部成功后按分P顺序合并到filename
+        任一分P失败时删除临时文件并抛出异常；增量抓取没有新弹幕时不写文件
+        返回抓取结果列表
+        """
+        bvid = video_info['bvid']
+        results = []
+        error = None
+        with ThreadPoolExecutor(max_workers=min(self.page_workers, len(pages))) as executor:
+            futures = []
+            for page in pages:
+                watermark = self.watermarks.get(page['cid']) if incremental else None
+                part_path = f"{filename}.p{page['page']}.part"
+                futures.append((part_path, executor.submit(self._crawl_page_to_file, page, part_path, watermark)))
+            for part_path, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    error = error or e
+        
+        part_paths = [part_path for part_path, _ in futures]
+        
+        def remove_parts():
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+        
+        if error is not None:
+            remove_parts()
+            raise error
+        
+        def finish():
+            saved = not incremental or sum(result['written'] for result in results) > 0
+            if saved:
+                # 先写临时文件再替换（或追加），失败时不破坏已有数据
+                with StreamingCSVWriter(filename, DANMAKU_CSV_FIELDS, append=incremental) as writer:
+                    for part_path in part_paths:
+                        writer.write_csv_file(part_path, DANMAKU_CSV_FIELDS)
+            remove_parts()
+            self._finish_video_pages(video_info, filename, results, saved, incremental)
+        
+        self._submit_write(bvid, finish, cleanup=remove_parts)
+        return results
+
+    def crawl_video_pages_to_parquet(self, video_info):
+        """
+        并发抓取多P视频所有分P的弹幕，各分P边抓取边写入自己cid分区的Parquet临时文件，
+        全部成功后才提交（改名为正式文件），任一分P失败时放弃所有分P的临时文件并抛出异常
+        返回本次抓取的弹幕条数
+        """
+        store = self.parquet_store
+        bvid = video_info['bvid']
+        pages = video_info['pages']
+        incremental = (self.watermarks is not None and
+                       all(self.watermarks.get(page['cid']) is not None and store.has_danmaku(bvid, page['cid'])
+                           for page in pages))
+        
+        writers = [store.open_danmaku_writer(bvid, page['cid'], replace=not incremental) for page in pages]
+        results = []
+        error = None
+        with ThreadPoolExecutor(max_workers=min(self.page_workers, len(pages))) as executor:
+            futures = [executor.submit(self._crawl_page, page, writer.write,
+                                       self.watermarks.get(page['cid']) if incremental else None)
+                       for page, writer in zip(pages, writers)]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    error = error or e
+        
+        if error is not None:
+            for writer in writers:
+                writer.abort()
+            raise error
+        for writer, result in zip(writers, results):
+            # 增量抓取时没有新弹幕的分P不留下空文件
+            if incremental and not result['written']:
+                writer.abort()
+            else:
+                writer.commit()
+        written = sum(result['written'] for result in results)
+        if incremental and not written:
+            print(f"没有新弹幕，跳过写入 {store.danmaku_dir}")
+        else:
+            print(f"弹幕数据已{'追加' if incremental else '保存'}至 {store.danmaku_dir}（{bvid}，{len(pages)} 个分P）")
+        
+        self._advance_page_watermarks(results, incremental)
+        self._catalog_danmaku(video_info, 'parquet', None,
+                              [dict(result, path=store.danmaku_partition(bvid, result['cid'])) for result in results],
+                              append=incremental)
+        return sum(result['fetched'] for result in results)
+
+    def crawl_video_pages_to_sqlite(self, video_info):
+        """
+        并发抓取多P视频所有分P的弹幕，每收到一批弹幕就在一个事务中插入SQLite存储
+        任一分P失败时抛出异常；已插入的弹幕保留，重新抓取时按弹幕ID去重
+        返回本次抓取的弹幕条数
+        """
+        store = self.sqlite_store
+        bvid = video_info['bvid']
+        pages = video_info['pages']
+        # 每个cid只由自己分P的线程累加
+        inserted = {page['cid']: 0 for page in pages}
+        
+        def write(batch):
+            inserted[batch.constants['cid']] += store.write_danmaku(bvid, batch)
+        
+        results = []
+        error = None
+        with ThreadPoolExecutor(max_workers=min(self.page_workers, len(pages))) as executor:
+            futures = [executor.submit(self._crawl_page, page, write, None) for page in pages]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    error = error or e
+        if error is not None:
+            raise error
+        
+        for result in results:
+            result['written'] = inserted[result['cid']]
+        self._catalog_danmaku(video_info, 'sqlite', store.path, results, append=True)
+        print(f"弹幕数据已保存至 {store.path}（{bvid}，{len(pages)} 个分P，新增 {sum(inserted.values())} 条）")
+        return sum(result['fetched'] for result in results)
+
+    def crawl_and_save_danmaku(self, video_info):
+        """
+        爬取视频（含所有分P）的弹幕并保存弹幕数据和视频信息
+        请求失败时抛出RequestFailedError，返回本次抓取的弹幕条数
+        """
+        if not video_info.get('pages'):
+            video_info = dict(video_info, pages=[
+                {'page': 1, 'cid': video_info['cid'], 'duration': video_info['duration']}])
+        
+        # 各存储方式都按分P流式写入，解析器每产出一批弹幕就写入一批
+        if self.parquet_store is not None:
+            count = self.crawl_video_pages_to_parquet(video_info)
+            self.save_video_info_to_parquet(video_info)
+            return count
+        if self.sqlite_store is not None:
+            count = self.crawl_video_pages_to_sqlite(video_info)
+            self.save_video_info_to_sqlite(video_info)
+            return count
+        
+        safe_title = self.make_safe_title(video_info)
+        count = self.crawl_video_pages(video_info, f"{safe_title}_danmaku.csv")
+        info_filename = f"{safe_title}_info.csv"
+        
+        def save_info():
+            if self.save_video_info_to_csv(video_info, info_filename):
+                self._catalog_video(video_info, 'csv', info_filename)
+        
+        # 启用后台写入时排在弹幕文件的提交之后执行
+        self._submit_write(video_info['bvid'], save_info)
+        return count
 
     def save_video_info_to_csv(self, video_info, filename):
         """
         将视频信息保存为CSV文件
+        返回是否写入成功
         """
         if not video_info:
             print("没有视频信息需要保存")
-            return
+            return False
         
         try:
             with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
@@ -312,23 +1073,59 @@ class BilibiliCrawler:
                 video_info_to_save['pubdate'] = datetime.datetime.fromtimestamp(
                     video_info_to_save['pubdate']).strftime('%Y-%m-%d %H:%M:%S')
                 writer.writerow(video_info_to_save)
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
             
             print(f"视频信息已保存至 {filename}")
+            return True
         except Exception as e:
             print(f"保存视频信息时发生异常: {e}")
+            return False
 
-    def crawl_video_danmaku(self, url_or_bvid):
+    def save_video_info_to_parquet(self, video_info):
         """
-        爬取指定视频的弹幕数据和视频信息
+        将视频信息快照保存到Parquet存储的视频信息表
         """
-        print("开始获取视频信息...")
-        video_info = self.get_video_info(url_or_bvid)
-        
-        if not video_info:
-            print("无法获取视频信息，程序退出")
-            return False
+        try:
+            path = self.parquet_store.write_video_info(video_info)
+            print(f"视频信息已保存至 {self.parquet_store.video_info_dir}")
+        except Exception as e:
+            print(f"保存视频信息时发生异常: {e}")
+            return
+        self._catalog_video(video_info, 'parquet', path)
+
+    def save_video_info_to_sqlite(self, video_info):
+        """
+        将视频信息保存到SQLite存储的视频信息表
+        """
+        try:
+            self.sqlite_store.write_video_info(video_info)
+            print(f"视频信息已保存至 {self.sqlite_store.path}")
+        except sqlite3.Error as e:
+            print(f"保存视频信息时发生异常: {e}")
+            return
+        self._catalog_video(video_info, 'sqlite', self.sqlite_store.path)
+
+    def make_safe_title(self, video_info):
+        """
+        根据视频信息生成可用作文件名前缀的标题
+        如果有歌曲名称，则使用歌曲名称作为文件名前缀
+        """
+        file_title = video_info.get('song_name', video_info['title'])
         
-        # 显示视频信息
+        # 清理标题中的非法字符
+        safe_title = re.sub(r'[^\w\s\u4e00-\u9fff\-\.]', '_', file_title).strip()
+        safe_title = re.sub(r'\s+', '_', safe_title)  # 将空格替换为下划线
+        # 确保文件名不以点或空格开头/结尾
+        safe_title = safe_title.strip('. ')
+        if not safe_title:
+            safe_title = video_info['bvid']  # 如果处理后标题为空，则使用BV号
+        return safe_title
+
+    def print_video_info(self, video_info):
+        """
+        显示视频信息
+        """
         display_title = video_info.get('song_name', video_info['title'])
         print(f"视频标题: {display_title}")
         print(f"UP主: {video_info['owner']}")
@@ -341,45 +1138,47 @@ class BilibiliCrawler:
         print(f"收藏数: {video_info['favorite']}")
         print(f"转发数: {video_info['share']}")
         print(f"视频时长: {video_info['duration']}秒")
-        print("开始爬取弹幕...")
-        
-        # 爬取弹幕
-        danmakus = self.crawl_danmaku(video_info['cid'])
-        print(f"共爬取 {len(danmakus)} 条弹幕")
+
+    def crawl_video_danmaku(self, url_or_bvid):
+        """
+        爬取指定视频的弹幕数据和视频信息
+        """
+        print("开始获取视频信息...")
+        video_info = self.get_video_info(url_or_bvid)
         
-        # 保存弹幕数据，使用视频标题作为文件名前缀
-        # 如果有歌曲名称，则使用歌曲名称作为文件名前缀
-        file_title = video_info.get('song_name', video_info['title'])
+        if not video_info:
+            print("无法获取视频信息，程序退出")
+            return False
         
-        # 清理标题中的非法字符
-        safe_title = re.sub(r'[^\w\s\u4e00-\u9fff\-\.]', '_', file_title).strip()
-        safe_title = re.sub(r'\s+', '_', safe_title)  # 将空格替换为下划线
-        # 确保文件名不以点或空格开头/结尾
-        safe_title = safe_title.strip('. ')
-        if not safe_title:
-            safe_title = video_info['bvid']  # 如果处理后标题为空，则使用BV号
-            
-        danmaku_filename = f"{safe_title}_danmaku.csv"
-        self.save_danmaku_to_csv(danmakus, danmaku_filename)
+        self.print_video_info(video_info)
+        if len(video_info['pages']) > 1:
+            print(f"视频共 {len(video_info['pages'])} 个分P")
+        print("开始爬取弹幕...")
         
-        # 保存视频信息
-        video_info_filename = f"{safe_title}_info.csv"
-        self.save_video_info_to_csv(video_info, video_info_filename)
+        # 爬取弹幕并保存弹幕数据和视频信息，使用视频标题作为文件名前缀
+        try:
+            count = self.crawl_and_save_danmaku(video_info)
+        except RequestFailedError as e:
+            self.record_failure(url_or_bvid, 'danmaku', e)
+            print(f"弹幕爬取失败: {e}")
+            return False
+        except OSError as e:
+            # 磁盘已满、没有写入权限等
+            self.record_failure(url_or_bvid, 'save', e)
+            print(f"保存数据时发生异常: {e}")
+            return False
+        print(f"共爬取 {count} 条弹幕")
         
         print("弹幕数据和视频信息爬取完成！")
         return True
 
-    def crawl_batch_danmaku(self, urls_file):
+    def read_urls_file(self, urls_file):
         """
-        批量爬取弹幕数据
-        urls_file: 包含视频链接的文本文件路径
+        读取URL文件，跳过空行和注释行（以#开头的行）
+        返回URL列表，读取失败时返回None
         """
-        # 加载歌曲名称
-        self.load_song_names(urls_file)
-        
         try:
             with open(urls_file, 'r', encoding='utf-8') as f:
-                # 读取所有行，跳过空行和注释行（以#开头的行）
                 urls = []
                 for line in f:
                     line = line.strip()
@@ -388,22 +1187,65 @@ class BilibiliCrawler:
                         urls.append(line)
         except Exception as e:
             print(f"读取URL文件时发生异常: {e}")
-            return
+            return None
         
         print(f"从文件 {urls_file} 中读取到 {len(urls)} 个视频链接")
+        return urls
+
+    def crawl_batch_danmaku(self, urls_file, concurrency=8, per_host_limit=4, job_db='crawl_jobs.db'):
+        """
+        批量爬取弹幕数据
+        urls_file: 包含视频链接的文本文件路径
+        concurrency: 同时处理的视频数量上限
+        per_host_limit: 每个域名同时进行的请求数量上限
+        job_db: 任务队列位置（SQLite数据库路径或redis://地址），程序中断后重新运行会从中断处继续
+        """
+        # 加载歌曲名称
+        self.load_song_names(urls_file)
         
-        success_count = 0
-        for i, url in enumerate(urls, 1):
-            print(f"\n正在处理第 {i}/{len(urls)} 个视频: {url}")
-            try:
-                if self.crawl_video_danmaku(url):
-                    success_count += 1
-                # 添加延时，避免请求过于频繁
-                time.sleep(2)
-            except Exception as e:
-                print(f"处理视频 {url} 时发生异常: {e}")
+        urls = self.read_urls_file(urls_file)
+        if urls is None:
+            return
         
-        print(f"\n批量处理完成！成功处理 {success_count}/{len(urls)} 个视频")
+        queue = open_job_queue(job_db)
+        try:
+            # 上一批任务已全部结束时开始新一批，否则在原有任务上继续
+            if queue.has_unfinished():
+                print("检测到未完成的批量任务，从中断处继续")
+            else:
+                queue.clear()
+            
+            added = 0
+            for url in urls:
+                bvid = self.get_bvid_from_url(url) if url.startswith('http') else url
+                if not bvid:
+                    self.record_failure(url, 'video_info', ValueError("无效的B站视频URL"))
+                    continue
+                added += queue.enqueue(bvid, url, self.song_names.get(bvid))
+            requeued = queue.recover()
+            print(f"新增 {added} 个任务，重新排队 {requeued} 个中断或失败的任务")
+            
+            engine = AsyncCrawlEngine(self, concurrency=concurrency, per_host_limit=per_host_limit)
+            results = engine.run_jobs(queue)
+            success_count = sum(1 for ok in results if ok)
+            counts = queue.counts()
+        finally:
+            queue.close()
+            # 写完仍在后台写入队列中的数据
+            self.flush_writes()
+        
+        print(f"\n批量处理完成！本次成功处理 {success_count}/{len(results)} 个视频")
+        print(f"任务状态: 完成 {counts['done']}，失败 {counts['failed']}，待处理 {counts['pending']}")
+        print(f"当前请求速率: {self.rate_limiter.describe()}")
+        if len(self.session_pool.sessions) > 1:
+            for line in self.session_pool.describe():
+                print(f"  {line}")
+        
+        # 汇总失败结果，可重试的视频写入文件供下次直接重跑
+        self.print_failure_summary()
+        retry_count = self.save_failures()
+        if retry_count:
+            print(f"{retry_count} 个可重试的视频已写入 failed_urls.txt，可作为批量抓取的输入重新运行")
 
 
 def main():
@@ -418,8 +1260,8 @@ def main():
     choice = input("请选择操作 (1-3): ").strip()
     
     if choice == "1":
-        # 单个视频弹幕抓取
-        crawler = BilibiliCrawler(danmaku_limit=None)
+        # 单个视频弹幕抓取，按水位线增量写入
+        crawler = BilibiliCrawler(danmaku_limit=None, watermarks=WatermarkStore())
         # 加载歌曲名称
         crawler.load_song_names()
         video_input = input("请输入B站视频链接或BV号: ")
@@ -428,16 +1270,20 @@ def main():
             print("输入不能为空")
             return
         
-        crawler.crawl_video_danmaku(video_input)
+        if not crawler.crawl_video_danmaku(video_input):
+            crawler.print_failure_summary()
         
     elif choice == "2":
-        # 批量视频弹幕抓取
-        crawler = BilibiliCrawler(danmaku_limit=None)
+        # 批量视频弹幕抓取，按水位线增量写入，写文件在后台写入线程中进行
+        crawler = BilibiliCrawler(danmaku_limit=None, watermarks=WatermarkStore(), write_behind=True)
         urls_file = input("请输入包含视频链接的文本文件路径 (默认为 urls.txt): ").strip()
         if not urls_file:
             urls_file = "urls.txt"
         
-        crawler.crawl_batch_danmaku(urls_file)
+        try:
+            crawler.crawl_batch_danmaku(urls_file)
+        finally:
+            crawler.close()
         
     elif choice == "3":
         # 登录并获取更多弹幕
@@ -468,29 +1314,32 @@ def main():
                 if danmaku_choice == "1":
                     crawler.crawl_video_danmaku(video_input)
                 elif danmaku_choice == "2":
-                    date = input("请输入日期 (格式 YYYY-MM-DD): ").strip()
-                    if date:
-                        danmakus = crawler.crawl_historical_danmaku(video_info['cid'], date)
+                    start_date = input("请输入开始日期 (格式 YYYY-MM-DD): ").strip()
+                    end_date = input("请输入结束日期 (格式 YYYY-MM-DD，留空则与开始日期相同): ").strip()
+                    end_date = end_date or start_date
+                    if start_date:
+                        # 只抓取索引中存在历史弹幕的日期，并按row_id去重
+                        sweeper = HistoryDanmakuSweeper(crawler)
+                        danmakus = sweeper.sweep(video_info['cid'], start_date, end_date)
                         print(f"共爬取 {len(danmakus)} 条历史弹幕")
+                        crawler.print_failure_summary()
                         
                         # 保存弹幕数据
-                        file_title = video_info.get('song_name', video_info['title'])
-                        safe_title = re.sub(r'[^\w\s\u4e00-\u9fff\-\.]', '_', file_title).strip()
-                        safe_title = re.sub(r'\s+', '_', safe_title)
-                        safe_title = safe_title.strip('. ')
-                        if not safe_title:
-                            safe_title = video_info['bvid']
+                        safe_title = crawler.make_safe_title(video_info)
+                        date_label = start_date if end_date == start_date else f"{start_date}_{end_date}"
                             
-                        danmaku_filename = f"{safe_title}_{date}_danmaku.csv"
+                        danmaku_filename = f"{safe_title}_{date_label}_danmaku.csv"
                         crawler.save_danmaku_to_csv(danmakus, danmaku_filename)
                         
                         # 保存视频信息
-                        video_info_filename = f"{safe_title}_{date}_info.csv"
+                        video_info_filename = f"{safe_title}_{date_label}_info.csv"
                         crawler.save_video_info_to_csv(video_info, video_info_filename)
                     else:
                         print("日期不能为空")
                 else:
                     print("无效选择")
+            else:
+                crawler.print_failure_summary()
         else:
             print("登录失败")
     else:
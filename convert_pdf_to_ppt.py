@@ -12,7 +12,8 @@ from pptx.enum.text import PP_ALIGN
 from pptx.dml.color import RGBColor
 from pptx.enum.shapes import MSO_SHAPE
 import pandas as pd
-import glob
+
+from data_catalog import load_video_info_frame
 
 def create_presentation():
     """创建PPT演示文稿"""
@@ -138,14 +139,24 @@ def add_data_overview_slide(prs):
     title_format = title.text_frame.paragraphs[0]
     title_format.font.color.rgb = RGBColor(255, 255, 255)  # 白色
     
-    # 添加内容
-    content.text = (
-        "• 分析视频数量: 13首\n"
-        "• 平均播放量: 2,019,763次\n"
-        "• 平均弹幕数: 15,966条\n"
-        "• 平均点赞数: 79,108个\n"
-        "• 平均评论数: 9,107条"
-    )
+    # 添加内容：通过数据目录库读取各视频的统计数据，没有数据时使用报告中的数值
+    df = load_video_info_frame()
+    if not df.empty:
+        content.text = (
+            f"• 分析视频数量: {len(df)}首\n"
+            f"• 平均播放量: {df['view'].mean():,.0f}次\n"
+            f"• 平均弹幕数: {df['danmaku'].mean():,.0f}条\n"
+            f"• 平均点赞数: {df['like'].mean():,.0f}个\n"
+            f"• 平均评论数: {df['comment'].mean():,.0f}条"
+        )
+    else:
+        content.text = (
+            "• 分析视频数量: 13首\n"
+            "• 平均播放量: 2,019,763次\n"
+            "• 平均弹幕数: 15,966条\n"
+            "• 平均点赞数: 79,108个\n"
+            "• 平均评论数: 9,107条"
+        )
     
     # 设置内容样式
     for i, paragraph in enumerate(content.text_frame.paragraphs):
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫多进程/多节点工作模式
+功能：多个工作进程（可以分布在多台机器上）从共享任务队列中领取视频并抓取弹幕；
+      单机使用SQLite队列，多台机器使用Redis队列。工作进程通过心跳为任务续约，
+      进程崩溃后其任务在租约过期后由其他工作进程重新领取
+
+用法：
+  python crawl_worker.py enqueue urls.txt --queue redis://host:6379/0
+  python crawl_worker.py work --queue redis://host:6379/0 --processes 4
+  python crawl_worker.py status --queue redis://host:6379/0
+"""
+
+import argparse
+import multiprocessing
+
+from bilibili_crawler import BilibiliCrawler
+from async_crawler import AsyncCrawlEngine
+from danmaku_parser import XML_BACKENDS
+from data_catalog import DEFAULT_CATALOG_PATH
+from sqlite_store import DEFAULT_SQLITE_PATH
+from write_behind import DEFAULT_WRITE_QUEUE_SIZE
+from job_queue import DEFAULT_LEASE_SECONDS, default_worker_id, open_job_queue
+from rate_limiter import AdaptiveRateLimiter, DEFAULT_BUDGETS
+
+
+def scaled_budgets(share):
+    """
+    按比例缩小默认限速预算，使同一台机器上所有工作进程的总请求速率不超过单进程的预算
+    """
+    return {name: {key: value * share for key, value in budget.items()}
+            for name, budget in DEFAULT_BUDGETS.items()}
+
+
+def enqueue_urls(queue_location, urls_file, fresh=False):
+    """
+    把URL文件中的视频添加到共享队列，并让可重试的失败任务重新排队
+    fresh: 是否先清空队列中的全部任务
+    """
+    crawler = BilibiliCrawler()
+    crawler.load_song_names(urls_file)
+    urls = crawler.read_urls_file(urls_file)
+    if urls is None:
+        return
+    queue = open_job_queue(queue_location)
+    try:
+        if fresh:
+            queue.clear()
+        added = 0
+        for url in urls:
+            bvid = crawler.get_bvid_from_url(url) if url.startswith('http') else url
+            if not bvid:
+                print(f"无效的B站视频URL: {url}")
+                continue
+            added += queue.enqueue(bvid, url, crawler.song_names.get(bvid))
+        retried = queue.retry_failed()
+        print(f"新增 {added} 个任务，重新排队 {retried} 个可重试的失败任务")
+    finally:
+        queue.close()
+
+
+def run_worker(queue_location, index, options):
+    """
+    单个工作进程：创建自己的爬虫和队列连接，处理任务直到队列为空
+    返回(成功数, 处理数)
+    """
+    budgets = scaled_budgets(options['rate_share'])
+    crawler = BilibiliCrawler(api_base=options['api_base'], comment_base=options['comment_base'],
+                              danmaku_source=options['danmaku_source'],
+                              xml_backend=options.get('xml_backend'),
+                              storage=options.get('storage', 'csv'),
+                              parquet_dir=options.get('parquet_dir', 'danmaku_parquet'),
+                              catalog_path=options.get('catalog', DEFAULT_CATALOG_PATH),
+                              sqlite_path=options.get('sqlite_path', DEFAULT_SQLITE_PATH),
+                              write_behind=options.get('write_queue', 0) > 0,
+                              write_queue_size=options.get('write_queue') or DEFAULT_WRITE_QUEUE_SIZE,
+                              rate_limiter=AdaptiveRateLimiter(budgets))
+    # 第一个cookies用于默认会话，其余cookies和代理各自作为会话池中的新会话
+    cookies = list(options['cookies'])
+    if cookies:
+        crawler.set_cookies(cookies.pop(0))
+    for cookies_str in cookies:
+        crawler.add_session(cookies_str, rate_limiter=AdaptiveRateLimiter(budgets))
+    for proxy in options['proxies']:
+        crawler.add_session(proxy=proxy, rate_limiter=AdaptiveRateLimiter(budgets))
+    queue = open_job_queue(queue_location, lease_seconds=options['lease_seconds'])
+    worker_id = f'{default_worker_id()}:{index}'
+    try:
+        engine = AsyncCrawlEngine(crawler, concurrency=options['concurrency'],
+                                  per_host_limit=options['per_host_limit'])
+        results = engine.run_jobs(queue, worker_id)
+    finally:
+        queue.close()
+        crawler.close()
+    success_count = sum(1 for ok in results if ok)
+    print(f"[{worker_id}] 处理 {len(results)} 个视频，成功 {success_count} 个")
+    return success_count, len(results)
+
+
+def run_workers(queue_location, processes, options):
+    """
+    启动processes个工作进程，全部结束后打印队列状态
+    """
+    processes = max(1, int(processes))
+    if processes == 1:
+        results = [run_worker(queue_location, 0, options)]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(run_worker, [(queue_location, index, options)
+                                                for index in range(processes)])
+    success_count = sum(success for success, _ in results)
+    total = sum(count for _, count in results)
+    print(f"\n本机 {processes} 个工作进程共处理 {total} 个视频，成功 {success_count} 个")
+    print_status(queue_location)
+
+
+def print_status(queue_location):
+    """
+    打印队列中各状态的任务数量和失败任务
+    """
+    queue = open_job_queue(queue_location)
+    try:
+        counts = queue.counts()
+        failed = queue.failed_jobs()
+    finally:
+        queue.close()
+    print(f"任务状态: 完成 {counts['done']}，失败 {counts['failed']}，"
+          f"处理中 {counts['running']}，待处理 {counts['pending']}")
+    for job in failed:
+        retry = "可重试" if job['retryable'] else "不可重试"
+        print(f"  #{job['id']} {job['bvid']}（尝试 {job['attempts']} 次，{retry}）: {job['last_error']}")
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili弹幕爬虫多进程/多节点工作模式")
+    parser.add_argument('--queue', default='crawl_jobs.db',
+                        help="任务队列：SQLite数据库路径（单机）或 redis://host:port/db（多节点）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help="把URL文件中的视频添加到队列")
+    enqueue_parser.add_argument('urls_file')
+    enqueue_parser.add_argument('--fresh', action='store_true', help="先清空队列中的全部任务")
+
+    work_parser = subparsers.add_parser('work', help="启动工作进程处理队列中的任务")
+    work_parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    work_parser.add_argument('--concurrency', type=int, default=8, help="每个进程同时处理的视频数")
+    work_parser.add_argument('--per-host-limit', type=int, default=4, help="每个进程每个域名的并发请求数")
+    work_parser.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS)
+    work_parser.add_argument('--danmaku-source', choices=('xml', 'segment'), default='xml')
+    work_parser.add_argument('--xml-backend', choices=tuple(XML_BACKENDS), default=None,
+                             help="弹幕XML解析后端，默认安装了lxml时使用lxml")
+    work_parser.add_argument('--storage', choices=('csv', 'parquet', 'sqlite'), default='csv',
+                             help="弹幕和视频信息的存储方式，parquet需要安装pyarrow")
+    work_parser.add_argument('--parquet-dir', default='danmaku_parquet', help="Parquet存储目录")
+    work_parser.add_argument('--sqlite-path', default=DEFAULT_SQLITE_PATH, help="SQLite存储的数据库路径")
+    work_parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH,
+                             help="数据目录库路径，所有工作进程共享（SQLite，WAL模式）")
+    work_parser.add_argument('--write-queue', type=int, default=DEFAULT_WRITE_QUEUE_SIZE,
+                             help="后台写入队列长度，CSV写文件与网络请求重叠；0表示在抓取线程中直接写入")
+    work_parser.add_argument('--cookies', action='append', default=[],
+                             help="登录cookies字符串，可重复指定多个身份")
+    work_parser.add_argument('--proxy', action='append', default=[], help="代理地址，可重复指定，每个代理一个会话")
+    work_parser.add_argument('--api-base', default='https://api.bilibili.com')
+    work_parser.add_argument('--comment-base', default='https://comment.bilibili.com')
+
+    subparsers.add_parser('status', help="查看队列状态")
+
+    args = parser.parse_args()
+    if args.command == 'enqueue':
+        enqueue_urls(args.queue, args.urls_file, fresh=args.fresh)
+    elif args.command == 'work':
+        options = {
+            'concurrency': args.concurrency,
+            'per_host_limit': args.per_host_limit,
+            'lease_seconds': args.lease_seconds,
+            'danmaku_source': args.danmaku_source,
+            'xml_backend': args.xml_backend,
+            'storage': args.storage,
+            'parquet_dir': args.parquet_dir,
+            'catalog': args.catalog,
+            'sqlite_path': args.sqlite_path,
+            'write_queue': args.write_queue,
+            'cookies': args.cookies,
+            'proxies': args.proxy,
+            'api_base': args.api_base,
+            'comment_base': args.comment_base,
+            # 本机所有工作进程平分单进程的限速预算
+            'rate_share': 1.0 / max(1, args.processes),
+        }
+        run_workers(args.queue, args.processes, options)
+    else:
+        print_status(args.queue)
+
+
+if __name__ == "__main__":
+    main()
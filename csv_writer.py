@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+流式CSV写入器
+功能：解析器每产出一批弹幕就写入一批，不在内存中累积整个视频的弹幕；
+      数据先写入目标文件旁的临时文件，每累计一定行数刷新一次缓冲区，全部写完后fsync并原子改名，
+      抓取失败时删除临时文件，已有的CSV文件不会被写了一半的数据替换；
+      追加前在日志文件中记录目标文件原来的长度，追加中途崩溃时下次打开会截断回原来的长度
+"""
+
+import csv
+import os
+import shutil
+
+from danmaku_batch import DanmakuBatch
+
+
+def recover_append(filename):
+    """
+    检查上一次追加是否中途中断：日志文件存在时把目标文件截断回追加前的长度并删除日志
+    返回是否进行了恢复
+    """
+    journal_path = f"{filename}.append"
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        size = f.read().strip()
+    if size and os.path.exists(filename):
+        with open(filename, 'r+b') as f:
+            f.truncate(int(size))
+            os.fsync(f.fileno())
+    os.remove(journal_path)
+    return True
+
+
+def _write_journal(journal_path, size):
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        f.write(str(size))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class StreamingCSVWriter:
+    def __init__(self, filename, fieldnames, append=False, flush_rows=8192):
+        """
+        filename: 目标CSV文件
+        fieldnames: 列顺序；追加到已有文件时使用已有文件的表头
+        append: 为True且目标文件已存在时，commit把新行追加到目标文件末尾（不重复写表头）
+        flush_rows: 每写入这么多行刷新一次文件缓冲区
+        """
+        self.filename = filename
+        recover_append(filename)
+        self.append = append and os.path.exists(filename)
+        self.fieldnames = list(fieldnames)
+        if self.append:
+            # 追加时按已有文件的表头对齐列
+            with open(filename, 'r', newline='', encoding='utf-8') as f:
+                self.fieldnames = next(csv.reader(f), self.fieldnames)
+        self.flush_rows = max(1, int(flush_rows))
+        self.tmp_path = f"{filename}.tmp"
+        self.rows = 0
+        self._unflushed = 0
+        self._file = open(self.tmp_path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if not self.append:
+            self._writer.writerow(self.fieldnames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def write(self, danmakus):
+        """
+        写入一批弹幕：DanmakuBatch按列逐行输出，弹幕记录字典按列名取值（缺少的列为空）
+        """
+        if isinstance(danmakus, DanmakuBatch):
+            count = len(danmakus)
+            self._writer.writerows(danmakus.rows(self.fieldnames))
+        else:
+            count = 0
+            for danmaku in danmakus:
+                self._writer.writerow([danmaku.get(name, '') for name in self.fieldnames])
+                count += 1
+        self.rows += count
+        self._unflushed += count
+        if self._unflushed >= self.flush_rows:
+            self._file.flush()
+            self._unflushed = 0
+
+    def write_csv_file(self, path, fieldnames):
+        """
+        写入另一个不含表头的CSV文件（列顺序为fieldnames）的全部行，例如分P临时文件；
+        列顺序相同时直接复制文本，不逐行解析
+        """
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            if list(fieldnames) == self.fieldnames:
+                self._file.flush()
+                shutil.copyfileobj(f, self._file)
+                return
+            for row in csv.DictReader(f, fieldnames=fieldnames):
+                self._writer.writerow([row.get(name) or '' for name in self.fieldnames])
+
+    def commit(self):
+        """
+        把临时文件写入磁盘后改名为目标文件，返回写入的弹幕条数
+        追加时先在日志文件中记录目标文件的长度，再把临时文件的内容追加到目标文件，
+        写入磁盘后才删除日志；中途崩溃时由recover_append截断掉写了一半的行
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self.append:
+            journal_path = f"{self.filename}.append"
+            _write_journal(journal_path, os.path.getsize(self.filename))
+            try:
+                with open(self.tmp_path, 'rb') as src, open(self.filename, 'ab') as out:
+                    shutil.copyfileobj(src, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+            except BaseException:
+                # 追加失败（如磁盘已满）时立即截断回原来的长度
+                recover_append(self.filename)
+                os.remove(self.tmp_path)
+                raise
+            os.remove(journal_path)
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, self.filename)
+        return self.rows
+
+    def abort(self):
+        """
+        放弃写入，删除临时文件，目标文件保持不变
+        """
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
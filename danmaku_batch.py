@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕列式批次
+功能：按列保存一批弹幕，数值字段（出现时间、类型、字号、颜色、发送时间戳、弹幕池）保存在
+      定长类型数组中，字符串字段（内容、发送者UID、弹幕ID）保存为 偏移量数组 + UTF-8字节缓冲区，
+      不为每条弹幕创建字典；解析器直接填充批次，写入CSV时按列逐行输出，
+      转换为numpy/pandas/Arrow时数值列不经过Python对象
+"""
+
+from array import array
+
+import numpy as np
+
+try:
+    import pyarrow
+except ImportError:  # pyarrow为可选依赖，只有to_arrow需要
+    pyarrow = None
+
+
+# 弹幕记录的字段顺序，与CSV列顺序一致
+DANMAKU_FIELDS = ['content', 'time', 'type', 'fontsize', 'color', 'timestamp', 'pool', 'uid', 'row_id']
+
+# 数值列 -> array类型码
+NUMERIC_COLUMNS = {
+    'time': 'd',       # 弹幕出现时间（秒）
+    'type': 'i',       # 弹幕类型
+    'fontsize': 'i',   # 字体大小
+    'color': 'q',      # 颜色
+    'timestamp': 'q',  # 发送时间戳
+    'pool': 'i',       # 弹幕池
+}
+
+# 字符串列
+STRING_COLUMNS = ['content', 'uid', 'row_id']
+
+
+class StringColumn:
+    """
+    变长字符串列：第i个字符串为 data[offsets[i]:offsets[i + 1]] 的UTF-8解码结果
+    偏移量为64位整数，与Arrow的large_string布局一致
+    """
+
+    def __init__(self):
+        self.offsets = array('q', [0])
+        self.data = bytearray()
+
+    @classmethod
+    def from_buffer(cls, offsets, data):
+        """
+        直接用偏移量（numpy int64数组，首项为0）和UTF-8字节构造
+        """
+        column = cls()
+        column.offsets = array('q', np.ascontiguousarray(offsets, dtype=np.int64).tobytes())
+        column.data = bytearray(data)
+        return column
+
+    @classmethod
+    def from_strings(cls, values):
+        """
+        批量编码字符串列表，values中的字符串不能包含NUL字符
+        """
+        encoded = '\x00'.join(values).encode('utf-8')
+        separators = np.flatnonzero(np.frombuffer(encoded, dtype=np.uint8) == 0)
+        offsets = np.empty(len(values) + 1, dtype=np.int64)
+        offsets[0] = 0
+        # 去掉分隔符后，第i个分隔符之前的字节数即第i个字符串的结束位置
+        offsets[1:-1] = separators - np.arange(len(separators))
+        offsets[-1] = len(encoded) - len(separators)
+        return cls.from_buffer(offsets, encoded.replace(b'\x00', b''))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def append(self, value):
+        self.data += value.encode('utf-8')
+        self.offsets.append(len(self.data))
+
+    def extend(self, other):
+        base = len(self.data)
+        self.data += other.data
+        self.offsets.frombytes((np.frombuffer(other.offsets, dtype=np.int64)[1:] + base).tobytes())
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def to_list(self):
+        data = bytes(self.data)
+        offsets = self.offsets
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+    def take(self, indices):
+        column = StringColumn()
+        data = self.data
+        offsets = self.offsets
+        for i in indices:
+            column.data += data[offsets[i]:offsets[i + 1]]
+            column.offsets.append(len(column.data))
+        return column
+
+
+class DanmakuBatch:
+    def __init__(self):
+        self.numeric = {name: array(code) for name, code in NUMERIC_COLUMNS.items()}
+        self.strings = {name: StringColumn() for name in STRING_COLUMNS}
+        # 整批取值相同的附加列（如所属分P和cid），只保存一个值
+        self.constants = {}
+
+    def __len__(self):
+        return len(self.numeric['time'])
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        """
+        逐条产出弹幕记录字典，兼容按记录处理弹幕的旧代码；批量处理时应使用列接口
+        """
+        return iter(self.records())
+
+    def append(self, content, time, type, fontsize, color, timestamp, pool, uid, row_id):
+        """
+        追加一条弹幕；参数必须已转换为正确的类型，避免转换失败时各列长度不一致
+        数值超出列类型的范围时不追加并抛出ValueError
+        """
+        numeric = self.numeric
+        size = len(self)
+        try:
+            numeric['time'].append(time)
+            numeric['type'].append(type)
+            numeric['fontsize'].append(fontsize)
+            numeric['color'].append(color)
+            numeric['timestamp'].append(timestamp)
+            numeric['pool'].append(pool)
+        except OverflowError as e:
+            for column in numeric.values():
+                del column[size:]
+            raise ValueError(f"弹幕字段超出范围: {e}")
+        strings = self.strings
+        strings['content'].append(content)
+        strings['uid'].append(uid)
+        strings['row_id'].append(row_id)
+
+    def append_record(self, record):
+        self.append(record['content'], float(record['time']), int(record['type']), int(record['fontsize']),
+                    int(record['color']), int(record['timestamp']), int(record['pool']),
+                    str(record['uid']), str(record['row_id']))
+
+    @classmethod
+    def from_columns(cls, numeric, strings):
+        """
+        用已解析好的整列数据构造批次
+        numeric: {数值列名: numpy数组}，按NUMERIC_COLUMNS的类型转换
+        strings: {字符串列名: StringColumn}
+        """
+        batch = cls()
+        for name, typecode in NUMERIC_COLUMNS.items():
+            batch.numeric[name] = array(typecode, np.asarray(numeric[name], dtype=typecode).tobytes())
+        for name in STRING_COLUMNS:
+            batch.strings[name] = strings[name]
+        return batch
+
+    @classmethod
+    def from_records(cls, records):
+        batch = cls()
+        for record in records:
+            batch.append_record(record)
+        return batch
+
+    def set_constant(self, name, value):
+        self.constants[name] = value
+        return self
+
+    def extend(self, other):
+        for name, column in self.numeric.items():
+            column.extend(other.numeric[name])
+        for name, column in self.strings.items():
+            column.extend(other.strings[name])
+
+    @classmethod
+    def concat(cls, batches):
+        """
+        按顺序合并多个批次；所有批次的附加列取值相同时保留附加列
+        """
+        batches = list(batches)
+        result = cls()
+        for batch in batches:
+            result.extend(batch)
+        if batches and all(batch.constants == batches[0].constants for batch in batches):
+            result.constants = dict(batches[0].constants)
+        return result
+
+    def column(self, name):
+        """
+        返回一列：数值列为共享内存的numpy数组（只读视图，持有期间不能再追加），
+        字符串列为str列表，附加列为重复的numpy数组
+        """
+        if name in self.numeric:
+            return np.frombuffer(self.numeric[name], dtype=self.numeric[name].typecode)
+        if name in self.strings:
+            return self.strings[name].to_list()
+        if name in self.constants:
+            return np.full(len(self), self.constants[name])
+        raise KeyError(name)
+
+    def take(self, indices):
+        """
+        按下标（整数数组）或布尔掩码选出部分弹幕，返回新的批次
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        batch = DanmakuBatch()
+        for name, column in self.numeric.items():
+            selected = np.frombuffer(column, dtype=column.typecode)[indices]
+            batch.numeric[name] = array(column.typecode, selected.tobytes())
+        positions = indices.tolist()
+        for name, column in self.strings.items():
+            batch.strings[name] = column.take(positions)
+        batch.constants = dict(self.constants)
+        return batch
+
+    def head(self, limit):
+        """
+        返回前limit条弹幕；limit为None或不小于批次长度时返回自身
+        """
+        if limit is None or limit >= len(self):
+            return self
+        return self.take(np.arange(limit))
+
+    def sort_by(self, name):
+        """
+        按数值列稳定排序，返回新的批次
+        """
+        return self.take(np.argsort(self.column(name), kind='stable'))
+
+    def order_keys(self):
+        """
+        返回每条弹幕的先后顺序键 (发送时间戳, 弹幕ID) 的两个数组：先比较发送时间戳，同一秒内再比较弹幕ID，
+        非数字的弹幕ID记为0；水位线（WatermarkStore）中保存的就是这个键
+        """
+        row_ids = np.array([int(row_id) if row_id.isdigit() else 0
+                            for row_id in self.strings['row_id'].to_list()], dtype=np.int64)
+        return self.column('timestamp'), row_ids
+
+    def newer_than(self, mark):
+        """
+        返回先后顺序键大于mark (时间戳, 弹幕ID) 的弹幕
+        """
+        timestamps, row_ids = self.order_keys()
+        mark_timestamp, mark_row_id = mark
+        mask = (timestamps > mark_timestamp) | ((timestamps == mark_timestamp) & (row_ids > mark_row_id))
+        return self.take(mask)
+
+    def max_order_key(self):
+        """
+        返回批次中最大的先后顺序键，空批次返回None
+        """
+        if not len(self):
+            return None
+        timestamps, row_ids = self.order_keys()
+        latest = timestamps.max()
+        return int(latest), int(row_ids[timestamps == latest].max())
+
+    def rows(self, fieldnames):
+        """
+        按fieldnames的列顺序逐行产出元组，供csv.writer.writerows使用；
+        不在批次中的列输出空值
+        """
+        count = len(self)
+        columns = []
+        for name in fieldnames:
+            if name in self.numeric:
+                columns.append(self.numeric[name].tolist())
+            elif name in self.strings:
+                columns.append(self.strings[name].to_list())
+            else:
+                columns.append([self.constants.get(name, '')] * count)
+        return zip(*columns)
+
+    def records(self):
+        """
+        转换为弹幕记录字典列表（字段与 DANMAKU_FIELDS 一致，另含附加列）
+        """
+        fieldnames = DANMAKU_FIELDS + list(self.constants)
+        return [dict(zip(fieldnames, row)) for row in self.rows(fieldnames)]
+
+    def to_numpy(self):
+        """
+        返回 {列名: numpy数组}，数值列与批次共享内存
+        """
+        columns = {name: self.column(name) for name in NUMERIC_COLUMNS}
+        for name in STRING_COLUMNS:
+            columns[name] = np.array(self.strings[name].to_list(), dtype=object)
+        return columns
+
+    def to_pandas(self):
+        """
+        转换为pandas DataFrame，列顺序与 DANMAKU_FIELDS 一致；数值列只复制一次，
+        DataFrame与批次不共享内存，转换后批次仍可继续追加
+        """
+        import pandas as pd
+        columns = {}
+        for name in DANMAKU_FIELDS:
+            if name in self.numeric:
+                columns[name] = self.column(name).copy()
+            else:
+                columns[name] = np.array(self.strings[name].to_list(), dtype=object)
+        for name, value in self.constants.items():
+            columns[name] = np.full(len(self), value)
+        return pd.DataFrame(columns, copy=False)
+
+    def to_arrow(self):
+        """
+        转换为pyarrow.Table：字符串列直接使用偏移量和字节缓冲区构造large_string数组，不逐条解码
+        需要安装pyarrow
+        """
+        if pyarrow is None:
+            raise ImportError("to_arrow需要安装pyarrow: pip install pyarrow")
+        arrays = []
+        for name in DANMAKU_FIELDS:
+            if name in self.numeric:
+                arrays.append(pyarrow.array(self.column(name).copy()))
+            else:
+                column = self.strings[name]
+                arrays.append(pyarrow.Array.from_buffers(
+                    pyarrow.large_string(), len(column),
+                    [None, pyarrow.py_buffer(column.offsets.tobytes()), pyarrow.py_buffer(bytes(column.data))]))
+        names = list(DANMAKU_FIELDS)
+        for name, value in self.constants.items():
+            arrays.append(pyarrow.array(np.full(len(self), value)))
+            names.append(name)
+        return pyarrow.Table.from_arrays(arrays, names=names)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕XML流式解析器
+功能：边接收边解析弹幕XML，分批产出弹幕，已处理的元素立即释放，
+      内存占用与XML总大小无关；达到数量上限后立即停止解析。
+      解析结果保存为列式批次（DanmakuBatch）：先收集一批<d>元素的原始p属性和文本，
+      再把所有数值字段一次性向量化转换，格式错误的弹幕通过掩码剔除。
+      安装了lxml时使用lxml解析（恢复模式，容忍弹幕内容中的非法字符），否则使用标准库
+"""
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml为可选依赖，未安装时使用标准库解析器
+    lxml_etree = None
+
+from danmaku_batch import DanmakuBatch, StringColumn, DANMAKU_FIELDS
+
+
+# p属性中的字段数量：出现时间,类型,字号,颜色,发送时间戳,弹幕池,发送者UID哈希,弹幕ID,屏蔽等级
+P_FIELD_COUNT = 9
+
+_COMMA, _NEWLINE, _DOT, _MINUS, _ZERO = b',\n.-0'
+# int64能精确表示的最大十进制位数；位数更多的数值视为格式错误
+_MAX_DIGITS = 18
+# 字节缓冲区前后的填充字节数，按固定宽度取字段时不会越界
+_PADDING = _MAX_DIGITS + 1
+_POW10 = 10 ** np.arange(_MAX_DIGITS + 1, dtype=np.int64)
+_INT32_MIN, _INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+# 流式解析时每累积这么多条弹幕整体转换一次；批次越大向量化转换越快，但占用内存越多
+BULK_ROWS = 8192
+
+# lxml恢复模式下仍视为解析失败的错误：文档被截断或为空，重新抓取可能成功
+_LXML_FATAL_ERRORS = {'ERR_TAG_NOT_FINISHED', 'ERR_DOCUMENT_EMPTY'}
+
+
+def append_danmaku_element(batch, p, text):
+    """
+    将<d>元素的p属性和文本解析后追加到批次，返回是否追加
+    所有字段转换成功后才写入批次，格式不正确时不追加
+    """
+    if not p or not text:
+        return False
+    attrs = p.split(',')
+    if len(attrs) < 9:
+        return False
+    try:
+        values = (float(attrs[0]), int(attrs[1]), int(attrs[2]), int(attrs[3]), int(attrs[4]), int(attrs[5]))
+        batch.append(text, *values, attrs[6], attrs[7])
+    except ValueError:
+        return False
+    return True
+
+
+def _field_chars(buf, starts, ends, width, align_right=False):
+    """
+    把每个字段 buf[starts:ends] 的字节排成 (行数, width) 的uint8矩阵，字段之外的位置为0
+    align_right为True时右对齐（每一列对应固定的十进制位），否则左对齐
+    buf前后须各留至少width个填充字节，取字节时不会越界
+    返回(字节矩阵, 是否属于字段的掩码)
+    """
+    if align_right:
+        index = ends[:, None] - width + np.arange(width)
+        inside = index >= starts[:, None]
+    else:
+        index = starts[:, None] + np.arange(width)
+        inside = index < ends[:, None]
+    chars = buf[index]
+    chars *= inside
+    return chars, inside
+
+
+def _field_width(starts, ends):
+    return max(1, min(int((ends - starts).max()) if len(starts) else 1, _MAX_DIGITS + 1))
+
+
+def _parse_int(buf, starts, ends):
+    """
+    批量解析十进制整数字段 buf[starts:ends]（可带负号），返回(值, 是否有效)
+    字段右对齐后每一列对应固定的十进制位，整列校验字符后与10的幂做一次点积
+    """
+    negative = (ends > starts) & (buf[starts] == _MINUS)
+    starts = starts + negative
+    ok = (ends > starts) & (ends - starts <= _MAX_DIGITS)
+    width = _field_width(starts, ends)
+    chars, inside = _field_chars(buf, starts, ends, width, align_right=True)
+    # uint8减法会回绕，非数字字符都大于9；字段之外的位置置为0
+    digits = chars - _ZERO
+    digits *= inside
+    ok &= np.all(digits <= 9, axis=1)
+    values = digits.astype(np.int64) @ _POW10[width - 1::-1]
+    return np.where(negative, -values, values), ok
+
+
+def _parse_decimal(buf, starts, ends):
+    """
+    批量解析形如 -12.345 的十进制小数字段，返回(值, 是否有效)
+    整列校验字符（数字、最多一个小数点、可选的前导负号）后由numpy整列转换为float64，与float()结果一致
+    """
+    ok = (ends > starts) & (ends - starts <= _MAX_DIGITS)
+    width = _field_width(starts, ends)
+    chars, inside = _field_chars(buf, starts, ends, width)
+    is_digit = chars - _ZERO <= 9
+    is_dot = chars == _DOT
+    is_minus = chars == _MINUS
+    is_minus[:, 1:] = False
+    ok &= np.all(~inside | is_digit | is_dot | is_minus, axis=1)
+    ok &= (is_dot.sum(axis=1) <= 1) & (is_digit.any(axis=1))
+    # 格式错误的行替换为"0"，整列转换不会失败
+    chars[~ok] = 0
+    chars[~ok, 0] = _ZERO
+    values = np.ascontiguousarray(chars).view(f'S{width}').ravel().astype(np.float64)
+    return values, ok
+
+
+def _gather_strings(buf, starts, ends):
+    """
+    把多个字段 buf[starts:ends] 拼接为StringColumn，不逐条创建字符串
+    """
+    lengths = ends - starts
+    offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return StringColumn.from_buffer(offsets, buf[index].tobytes())
+
+
+def parse_danmaku_bulk(ps, texts):
+    """
+    一次性解析一批<d>元素的p属性和文本，返回DanmakuBatch
+    所有p属性拼接为一个字节缓冲区，按分隔符位置切出各字段，数值字段整列转换；
+    字段不足、数值格式错误、内容为空的弹幕通过掩码剔除，不逐条捕获异常
+    ps: p属性字符串列表（可含None）
+    texts: 弹幕内容列表（可含None），与ps一一对应
+    """
+    count = len(ps)
+    if not count:
+        return DanmakuBatch()
+    if None in ps:
+        ps = [p or '' for p in ps]
+    if None in texts:
+        texts = [text or '' for text in texts]
+    padding = b'\x00' * _PADDING
+    buf = np.frombuffer(padding + ('\n'.join(ps) + '\n').encode('utf-8') + padding, dtype=np.uint8)
+
+    # 所有分隔符（逗号和换行符）的位置；newlines[i]为第i行的换行符在separators中的下标，
+    # first_separators[i]为第i行第一个分隔符在separators中的下标，两者之差即该行的逗号数
+    separators = np.flatnonzero((buf == _COMMA) | (buf == _NEWLINE))
+    newlines = np.flatnonzero(buf[separators] == _NEWLINE)
+    if len(newlines) != count:
+        # p属性中含有换行符（来自字符引用）时无法按行切分，逐条解析
+        batch = DanmakuBatch()
+        for p, text in zip(ps, texts):
+            append_danmaku_element(batch, p, text)
+        return batch
+    first_separators = np.concatenate(([0], newlines[:-1] + 1))
+    line_starts = np.concatenate(([_PADDING], separators[newlines[:-1]] + 1))
+    text_lengths = np.fromiter(map(len, texts), dtype=np.int64, count=count)
+    valid = (newlines - first_separators >= P_FIELD_COUNT - 1) & (text_lengths > 0)
+
+    # 只需要前8个字段，第k个字段为 buf[starts[k]:ends[k]]
+    rows = np.flatnonzero(valid)
+    first = first_separators[rows]
+    starts = [line_starts[rows]] + [separators[first + k] + 1 for k in range(P_FIELD_COUNT - 2)]
+    ends = [separators[first + k] for k in range(P_FIELD_COUNT - 1)]
+
+    time, ok = _parse_decimal(buf, starts[0], ends[0])
+    numeric = {'time': time}
+    for index, name in enumerate(['type', 'fontsize', 'color', 'timestamp', 'pool'], start=1):
+        values, field_ok = _parse_int(buf, starts[index], ends[index])
+        if name in ('type', 'fontsize', 'pool'):
+            field_ok &= (values >= _INT32_MIN) & (values <= _INT32_MAX)
+        numeric[name] = values
+        ok &= field_ok
+
+    keep = np.flatnonzero(ok)
+    numeric = {name: values[keep] for name, values in numeric.items()}
+    if len(keep) < count:
+        texts = [texts[i] for i in rows[keep].tolist()]
+    strings = {
+        'content': StringColumn.from_strings(texts),
+        'uid': _gather_strings(buf, starts[6][keep], ends[6][keep]),
+        'row_id': _gather_strings(buf, starts[7][keep], ends[7][keep]),
+    }
+    return DanmakuBatch.from_columns(numeric, strings)
+
+
+def _read_elements_stdlib(chunks):
+    """
+    用标准库的XMLPullParser解析字节块，每块产出一次 (p属性列表, 文本列表)
+    XML格式错误时抛出xml.etree.ElementTree.ParseError
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+
+    def read():
+        nonlocal root
+        ps = []
+        texts = []
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == 'd':
+                ps.append(elem.get('p'))
+                texts.append(elem.text)
+        # 释放已处理完的子元素，根节点不再持有整棵树
+        if root is not None:
+            root.clear()
+        return ps, texts
+
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            yield read()
+    parser.close()
+    yield read()
+
+
+def _read_elements_lxml(chunks):
+    """
+    用lxml的XMLPullParser（与iterparse相同的libxml2解析器，按块送入数据）解析字节块，
+    每块产出一次 (p属性列表, 文本列表)
+    根节点<i>下已解析完的<d>元素的p属性和文本由XPath在C中一次取出，不为每条弹幕创建元素对象。
+    开启恢复模式，跳过弹幕内容中的非法控制字符、未转义的&等局部错误，
+    但文档不完整（传输被截断）或为空时仍抛出xml.etree.ElementTree.ParseError
+    """
+    # 去掉注释和处理指令后，<d>元素至多有一个文本节点
+    parser = lxml_etree.XMLPullParser(events=('start',), tag='i', huge_tree=True, recover=True,
+                                      remove_comments=True, remove_pis=True, collect_ids=False)
+    # 最后一个<d>元素可能仍在解析中，文档结束前不读取
+    selectors = {
+        final: tuple(lxml_etree.XPath(expression.format(path), smart_strings=False)
+                     for expression in ('count({})', '{}/@p', '{}/text()', '{}'))
+        for final, path in ((True, 'd'), (False, 'd[position() < last()]'))
+    }
+    root = None
+
+    def read(final):
+        nonlocal root
+        for _, elem in parser.read_events():
+            if root is None:
+                root = elem
+        if root is None:
+            return [], []
+        done = len(root) if final or not len(root) or root[-1].tag != 'd' else len(root) - 1
+        if not done:
+            return [], []
+        count_elements, select_ps, select_texts, select_elements = selectors[final or done == len(root)]
+        ps = select_ps(root)
+        texts = select_texts(root)
+        if not len(ps) == len(texts) == count_elements(root):
+            # 有空弹幕或缺少p属性时两个列表无法一一对应，逐个元素读取
+            elements = select_elements(root)
+            ps = [elem.get('p') for elem in elements]
+            texts = [elem.text for elem in elements]
+        # 释放已处理完的子元素
+        del root[:done]
+        return ps, texts
+
+    try:
+        for chunk in chunks:
+            if chunk:
+                parser.feed(chunk)
+                yield read(False)
+        parser.close()
+    except lxml_etree.XMLSyntaxError as e:
+        raise ET.ParseError(str(e)) from e
+    yield read(True)
+    for error in parser.feed_error_log:
+        if error.type_name in _LXML_FATAL_ERRORS:
+            raise ET.ParseError(f"{error.message.strip()}: line {error.line}, column {error.column}")
+
+
+# 可用的XML解析后端，未指定时优先使用lxml
+XML_BACKENDS = {
+    'lxml': _read_elements_lxml,
+    'stdlib': _read_elements_stdlib,
+}
+
+
+def available_xml_backends():
+    """
+    返回当前环境中可用的XML解析后端名称
+    """
+    return [name for name in XML_BACKENDS if name != 'lxml' or lxml_etree is not None]
+
+
+def resolve_xml_backend(backend=None):
+    """
+    检查并返回XML解析后端名称；backend为None时安装了lxml则使用lxml，否则使用标准库
+    后端名称未知或lxml未安装时抛出ValueError
+    """
+    if backend is None:
+        return 'lxml' if lxml_etree is not None else 'stdlib'
+    if backend not in XML_BACKENDS:
+        raise ValueError(f"未知的XML解析后端: {backend}（可选 {', '.join(XML_BACKENDS)}）")
+    if backend == 'lxml' and lxml_etree is None:
+        raise ValueError("XML解析后端lxml需要安装lxml: pip install lxml")
+    return backend
+
+
+def iter_danmaku_xml_batches(chunks, limit=None, backend=None):
+    """
+    从字节块迭代器（如response.iter_content()）中流式解析弹幕，逐批产出DanmakuBatch
+    chunks: 已解压的XML字节块
+    limit: 最多产出的弹幕数量，None表示不限制
+    backend: XML解析后端（'lxml' 或 'stdlib'），None表示自动选择
+    各块中<d>元素的原始p属性和文本先累积到BULK_ROWS条（或即将达到limit）再整体转换
+    XML格式错误时抛出xml.etree.ElementTree.ParseError
+    """
+    read_elements = XML_BACKENDS[resolve_xml_backend(backend)]
+    count = 0
+    ps = []
+    texts = []
+
+    for chunk_ps, chunk_texts in read_elements(chunks):
+        ps += chunk_ps
+        texts += chunk_texts
+        if len(ps) < BULK_ROWS and not (limit and count + len(ps) >= limit):
+            continue
+
+        batch = parse_danmaku_bulk(ps, texts)
+        ps = []
+        texts = []
+        if limit and count + len(batch) >= limit:
+            yield batch.head(limit - count)
+            return
+        count += len(batch)
+        if batch:
+            yield batch
+
+    batch = parse_danmaku_bulk(ps, texts)
+    if batch:
+        yield batch.head(limit - count if limit else None)
+
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili分段弹幕protobuf编解码
+功能：解析 x/v2/dm/web/seg.so 接口返回的 DmSegMobileReply 消息，
+      转换为与XML弹幕相同结构的弹幕记录；同时提供编码函数用于生成测试数据
+说明：消息结构固定，这里按字段号预先生成解码表直接解析wire格式，
+      不依赖protobuf运行库和.proto编译
+"""
+
+from danmaku_batch import DanmakuBatch
+
+
+# 每个分段覆盖的视频时长（秒）
+SEGMENT_SECONDS = 360
+
+# wire类型
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LEN = 2
+WIRE_FIXED32 = 5
+
+# DanmakuElem 字段号 -> (字段名, 是否为字符串)
+DANMAKU_ELEM_FIELDS = {
+    1: ('id', False),
+    2: ('progress', False),   # 出现时间（毫秒）
+    3: ('mode', False),       # 弹幕类型
+    4: ('fontsize', False),
+    5: ('color', False),
+    6: ('mid_hash', True),    # 发送者UID哈希
+    7: ('content', True),
+    8: ('ctime', False),      # 发送时间戳
+    9: ('weight', False),
+    10: ('action', True),
+    11: ('pool', False),
+    12: ('id_str', True),
+    13: ('attr', False),
+}
+
+# DmSegMobileReply 中 elems 的字段号
+SEG_REPLY_ELEMS_FIELD = 1
+
+
+def segment_count(duration):
+    """
+    根据视频时长（秒）计算分段数量，每段6分钟
+    """
+    return max(1, (int(duration) + SEGMENT_SECONDS - 1) // SEGMENT_SECONDS)
+
+
+def _read_varint(data, pos):
+    """
+    从pos处读取一个varint，返回(值, 新位置)
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise ValueError("varint过长")
+
+
+def _skip_field(data, pos, wire_type):
+    """
+    跳过未知字段，返回新位置
+    """
+    if wire_type == WIRE_VARINT:
+        return _read_varint(data, pos)[1]
+    if wire_type == WIRE_FIXED64:
+        return pos + 8
+    if wire_type == WIRE_LEN:
+        length, pos = _read_varint(data, pos)
+        return pos + length
+    if wire_type == WIRE_FIXED32:
+        return pos + 4
+    raise ValueError(f"不支持的wire类型: {wire_type}")
+
+
+def _decode_elem(data, pos, end):
+    """
+    解析一条DanmakuElem消息，返回字段字典
+    """
+    fields = {}
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        field_number = key >> 3
+        wire_type = key & 0x07
+        spec = DANMAKU_ELEM_FIELDS.get(field_number)
+        if spec is None:
+            pos = _skip_field(data, pos, wire_type)
+            continue
+        name, is_string = spec
+        if is_string:
+            length, pos = _read_varint(data, pos)
+            fields[name] = str(data[pos:pos + length], 'utf-8', 'replace')
+            pos += length
+        else:
+            value, pos = _read_varint(data, pos)
+            # int32/int64负数以64位补码编码
+            if value >= 1 << 63:
+                value -= 1 << 64
+            fields[name] = value
+    if pos != end:
+        raise ValueError("DanmakuElem长度不匹配")
+    return fields
+
+
+def append_elem(batch, fields):
+    """
+    将DanmakuElem字段转换为与XML弹幕一致的字段并追加到批次
+    """
+    batch.append(
+        fields.get('content', ''),  # 弹幕内容
+        fields.get('progress', 0) / 1000,  # 弹幕出现时间（毫秒转秒）
+        fields.get('mode', 1),  # 弹幕类型
+        fields.get('fontsize', 25),  # 字体大小
+        fields.get('color', 16777215),  # 颜色
+        fields.get('ctime', 0),  # 发送时间戳
+        fields.get('pool', 0),  # 弹幕池
+        fields.get('mid_hash', ''),  # 发送者UID
+        fields.get('id_str') or str(fields.get('id', '')),  # 弹幕ID
+    )
+
+
+def decode_danmaku_segment_batch(data):
+    """
+    解析一个分段的DmSegMobileReply消息，返回DanmakuBatch
+    内容为空的弹幕会被忽略；消息格式错误时抛出ValueError
+    """
+    data = memoryview(data)
+    batch = DanmakuBatch()
+    pos = 0
+    end = len(data)
+    try:
+        while pos < end:
+            key, pos = _read_varint(data, pos)
+            field_number = key >> 3
+            wire_type = key & 0x07
+            if field_number == SEG_REPLY_ELEMS_FIELD and wire_type == WIRE_LEN:
+                length, pos = _read_varint(data, pos)
+                if pos + length > end:
+                    raise ValueError("消息被截断")
+                fields = _decode_elem(data, pos, pos + length)
+                pos += length
+                if fields.get('content'):
+                    try:
+                        append_elem(batch, fields)
+                    except ValueError:
+                        # 字段超出范围的弹幕与内容为空的弹幕一样忽略
+                        continue
+            else:
+                pos = _skip_field(data, pos, wire_type)
+    except IndexError:
+        raise ValueError("消息被截断")
+    return batch
+
+
+def decode_danmaku_segment(data):
+    """
+    解析一个分段的DmSegMobileReply消息，返回弹幕记录字典列表
+    """
+    return decode_danmaku_segment_batch(data).records()
+
+
+def _encode_varint(value):
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _encode_field(field_number, value, is_string):
+    if is_string:
+        raw = value.encode('utf-8')
+        return _encode_varint((field_number << 3) | WIRE_LEN) + _encode_varint(len(raw)) + raw
+    return _encode_varint((field_number << 3) | WIRE_VARINT) + _encode_varint(value)
+
+
+def encode_danmaku_segment(danmakus):
+    """
+    将弹幕记录编码为DmSegMobileReply消息，用于生成模拟服务器数据和测试用例
+    """
+    out = bytearray()
+    for danmaku in danmakus:
+        fields = {
+            'id': int(danmaku['row_id']) if str(danmaku['row_id']).isdigit() else 0,
+            'progress': int(round(float(danmaku['time']) * 1000)),
+            'mode': int(danmaku['type']),
+            'fontsize': int(danmaku['fontsize']),
+            'color': int(danmaku['color']),
+            'mid_hash': str(danmaku['uid']),
+            'content': str(danmaku['content']),
+            'ctime': int(danmaku['timestamp']),
+            'pool': int(danmaku['pool']),
+            'id_str': str(danmaku['row_id']),
+        }
+        elem = bytearray()
+        for field_number, (name, is_string) in DANMAKU_ELEM_FIELDS.items():
+            if name in fields:
+                elem += _encode_field(field_number, fields[name], is_string)
+        out += _encode_varint((SEG_REPLY_ELEMS_FIELD << 3) | WIRE_LEN)
+        out += _encode_varint(len(elem))
+        out += elem
+    return bytes(out)
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili抓取数据目录库
+功能：用SQLite记录每个视频已保存的数据集（BV号、cid、标题、歌曲名称、视频信息和弹幕的文件位置、
+      弹幕条数、最近抓取时间、内容哈希），爬虫每次写入后更新目录库；
+      分析、报告脚本通过带索引的查询找到数据文件，不再扫描目录、按文件名过滤和拼接文件名
+
+用法：
+  python data_catalog.py list
+  python data_catalog.py show BV1xx411c7mD
+  python data_catalog.py index                  # 把目录库建立之前保存的CSV/Parquet数据登记到目录库
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+# 默认目录库路径
+DEFAULT_CATALOG_PATH = 'data_catalog.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    bvid TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    title TEXT,
+    song_name TEXT,
+    info_path TEXT NOT NULL,
+    crawled_at INTEGER NOT NULL,
+    content_hash TEXT,
+    PRIMARY KEY (bvid, storage)
+);
+CREATE INDEX IF NOT EXISTS idx_videos_storage ON videos (storage, crawled_at);
+CREATE INDEX IF NOT EXISTS idx_videos_song_name ON videos (song_name);
+CREATE TABLE IF NOT EXISTS danmaku_files (
+    bvid TEXT NOT NULL,
+    cid INTEGER NOT NULL,
+    storage TEXT NOT NULL,
+    page INTEGER,
+    path TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    crawled_at INTEGER NOT NULL,
+    content_hash TEXT,
+    data_size INTEGER,
+    PRIMARY KEY (bvid, storage, cid)
+);
+CREATE INDEX IF NOT EXISTS idx_danmaku_files_cid ON danmaku_files (cid);
+"""
+
+
+def content_hash(paths, start=0):
+    """
+    按顺序计算一个或多个文件内容的SHA-256，文件不存在时返回None
+    start: 跳过拼接后内容的前start个字节，只计算其后的部分
+    """
+    if paths is None:
+        return None
+    if isinstance(paths, str):
+        paths = [paths]
+    digest = hashlib.sha256()
+    try:
+        for path in paths:
+            with open(path, 'rb') as f:
+                if start:
+                    size = os.fstat(f.fileno()).st_size
+                    if start >= size:
+                        start -= size
+                        continue
+                    f.seek(start)
+                    start = 0
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def data_size(paths):
+    """
+    一个或多个文件的总字节数，文件不存在时返回None
+    """
+    try:
+        return sum(os.path.getsize(path) for path in paths)
+    except OSError:
+        return None
+
+
+class DataCatalog:
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        """
+        path: 目录库路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(danmaku_files)')}
+        if 'data_size' not in columns:
+            # 早期版本的目录库没有data_size列
+            self._conn.execute('ALTER TABLE danmaku_files ADD COLUMN data_size INTEGER')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record_video(self, video_info, storage, info_path, crawled_at=None):
+        """
+        登记一个视频的视频信息文件（同一存储方式下只保留最近一次）
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO videos '
+                '(bvid, storage, title, song_name, info_path, crawled_at, content_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (video_info['bvid'], storage, video_info.get('title'), video_info.get('song_name'),
+                 info_path, int(crawled_at or time.time()),
+                 content_hash(None if storage == 'sqlite' else info_path)))
+
+    def record_danmaku(self, bvid, storage, entries, append=False, crawled_at=None):
+        """
+        在一个事务中登记一个视频各分P的弹幕文件
+        entries: [{'cid', 'page', 'path', 'rows'}]，rows为本次写入的条数；
+                 同一文件的分P只计算一次内容哈希
+        append: 为True时条数累加到已有记录（增量追加），否则替换该视频在该存储方式下的全部记录；
+                增量追加时没有写入新弹幕、且已登记过的文件内容不变，不重新计算哈希也不更新；
+                有新弹幕时只读取追加的部分，与原来的哈希串联（见_chained_hash）
+        """
+        crawled_at = int(crawled_at or time.time())
+        previous = {}
+        if append:
+            with self._lock:
+                registered = self._conn.execute(
+                    'SELECT cid, path, content_hash, data_size FROM danmaku_files '
+                    'WHERE bvid = ? AND storage = ?', (bvid, storage)).fetchall()
+            previous = {row['path']: (row['content_hash'], row['data_size']) for row in registered}
+            registered_cids = {row['cid'] for row in registered}
+            changed = {entry['path'] for entry in entries
+                       if entry['rows'] or entry['cid'] not in registered_cids}
+            entries = [entry for entry in entries if entry['path'] in changed]
+            if not entries:
+                return
+        hashes = {}
+        rows = []
+        for entry in entries:
+            path = entry['path']
+            if path not in hashes:
+                hashes[path] = self._chained_hash(storage, path, previous.get(path))
+            rows.append((bvid, entry['cid'], storage, entry.get('page'), path,
+                         int(entry['rows']), crawled_at) + hashes[path])
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                if not append:
+                    self._conn.execute('DELETE FROM danmaku_files WHERE bvid = ? AND storage = ?', (bvid, storage))
+                self._conn.executemany(
+                    'INSERT INTO danmaku_files '
+                    '(bvid, cid, storage, page, path, row_count, crawled_at, content_hash, data_size) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (bvid, storage, cid) DO UPDATE SET '
+                    'page = excluded.page, path = excluded.path, '
+                    'row_count = danmaku_files.row_count + excluded.row_count, '
+                    'crawled_at = excluded.crawled_at, content_hash = excluded.content_hash, '
+                    'data_size = excluded.data_size', rows)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _chained_hash(self, storage, path, previous=None):
+        """
+        计算弹幕数据的内容哈希，返回 (哈希, 数据总字节数)
+        previous: 增量追加前登记的 (哈希, 字节数)。CSV只在末尾追加，Parquet分区按抓取日期和写入时间
+                  命名的文件排序后新文件在最后，因此追加前的内容是现在内容的前缀：
+                  只计算新增字节的SHA-256，与原来的哈希串联为 SHA-256(原哈希 + 新增部分的哈希)；
+                  没有原来的记录或数据变短（被重写）时计算全部内容
+        """
+        files = self._data_files(storage, path)
+        if files is None:
+            return None, None
+        size = data_size(files)
+        if size is None:
+            return None, None
+        old_hash, old_size = previous if previous else (None, None)
+        if old_hash is None or old_size is None or size < old_size:
+            return content_hash(files), size
+        appended = content_hash(files, start=old_size)
+        if appended is None:
+            return None, None
+        return hashlib.sha256((old_hash + appended).encode('ascii')).hexdigest(), size
+
+    @staticmethod
+    def _data_files(storage, path):
+        """
+        弹幕数据的实际文件：CSV为文件本身，Parquet为分P分区目录下各抓取日期的文件；
+        SQLite存储由弹幕ID的唯一约束去重，所有视频共用一个数据库文件，不计算内容哈希
+        """
+        if storage == 'sqlite':
+            return None
+        if storage == 'parquet':
+            return sorted(glob.glob(os.path.join(path, '*', '*.parquet')))
+        return [path]
+
+    def videos(self, storage=None, bvids=None, song_name=None):
+        """
+        查询已登记的视频，每个视频附带其弹幕文件列表（按分P排序）
+        storage: 只返回该存储方式（'csv' / 'parquet' / 'sqlite'）的记录
+        bvids / song_name: 按BV号 / 歌曲名称查找
+        返回字典列表，按最近抓取时间排序
+        """
+        conditions = []
+        params = []
+        if storage is not None:
+            conditions.append('v.storage = ?')
+            params.append(storage)
+        if bvids is not None:
+            bvids = list(bvids)
+            if not bvids:
+                return []
+            conditions.append(f'v.bvid IN ({", ".join("?" * len(bvids))})')
+            params.extend(bvids)
+        if song_name is not None:
+            conditions.append('v.song_name = ?')
+            params.append(song_name)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self._lock:
+            videos = [dict(row) for row in self._conn.execute(
+                f'SELECT v.* FROM videos v {where} ORDER BY v.crawled_at, v.bvid', params).fetchall()]
+            files = self._conn.execute(
+                f'SELECT d.* FROM danmaku_files d JOIN videos v ON d.bvid = v.bvid AND d.storage = v.storage '
+                f'{where} ORDER BY d.page, d.cid', params).fetchall()
+        by_video = {}
+        for row in files:
+            by_video.setdefault((row['bvid'], row['storage']), []).append(dict(row))
+        for video in videos:
+            video['danmaku_files'] = by_video.get((video['bvid'], video['storage']), [])
+            video['danmaku_paths'] = list(dict.fromkeys(entry['path'] for entry in video['danmaku_files']))
+            video['row_count'] = sum(entry['row_count'] for entry in video['danmaku_files'])
+        return videos
+
+    def video(self, bvid, storage=None):
+        """
+        返回一个视频最近一次登记的记录，没有时返回None
+        """
+        videos = self.videos(storage=storage, bvids=[bvid])
+        return videos[-1] if videos else None
+
+    def remove(self, bvid, storage=None):
+        """
+        删除一个视频的登记（不删除数据文件）
+        """
+        condition = 'bvid = ?' + (' AND storage = ?' if storage else '')
+        params = (bvid, storage) if storage else (bvid,)
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute(f'DELETE FROM videos WHERE {condition}', params)
+            self._conn.execute(f'DELETE FROM danmaku_files WHERE {condition}', params)
+            self._conn.execute('COMMIT')
+
+
+def open_catalog(path=DEFAULT_CATALOG_PATH):
+    """
+    打开已存在的目录库；目录库不存在时返回None（不创建空库），由调用方退回到扫描目录
+    """
+    if not path or not os.path.exists(path):
+        return None
+    return DataCatalog(path)
+
+
+def legacy_info_files():
+    """
+    目录库建立之前的查找方式：扫描当前目录下的所有 *_info.csv
+    """
+    return glob.glob('*_info.csv')
+
+
+def uncatalogued_info_files(catalogued_paths):
+    """
+    当前目录下没有登记到目录库的 *_info.csv（例如引入目录库之前保存的文件）
+    catalogued_paths: 目录库中登记的信息文件路径
+    """
+    catalogued = {os.path.abspath(path) for path in catalogued_paths if path}
+    return [path for path in legacy_info_files() if os.path.abspath(path) not in catalogued]
+
+
+def load_video_info_frame(catalog_path=DEFAULT_CATALOG_PATH):
+    """
+    读取每个视频的视频信息为pandas DataFrame（每个视频一行，同一视频有多条记录时保留播放量最高的一条）
+    通过目录库定位CSV文件、Parquet快照文件和SQLite数据库，并加上当前目录下没有登记到目录库的CSV文件
+    """
+    import pandas as pd
+    paths = []
+    catalog = open_catalog(catalog_path)
+    if catalog is not None:
+        try:
+            paths = [(video['bvid'], video['storage'], video['info_path']) for video in catalog.videos()]
+        finally:
+            catalog.close()
+    csv_paths = [path for _, storage, path in paths if storage == 'csv']
+    paths += [(None, 'csv', path) for path in uncatalogued_info_files(csv_paths)]
+    rows = {}
+    for bvid, storage, path in paths:
+        try:
+            if storage == 'parquet':
+                import pyarrow.parquet
+                df = pyarrow.parquet.read_table(path).to_pandas()
+                df['bvid'] = bvid
+                # 与CSV一致：有歌曲名称时用歌曲名称作为标题
+                df['title'] = df['song_name'].fillna(df['title'])
+            elif storage == 'sqlite':
+                with sqlite3.connect(path) as conn:
+                    df = pd.read_sql_query('SELECT * FROM videos WHERE bvid = ?', conn, params=(bvid,))
+                df['title'] = df['song_name'].fillna(df['title'])
+            else:
+                df = pd.read_csv(path)
+        except Exception as e:
+            print(f"加载文件 {path} 时出错: {e}")
+            continue
+        if not df.empty:
+            row = df.iloc[0]
+            # 同一视频有多个信息文件或多种存储方式时保留播放量最高的记录
+            if row['bvid'] not in rows or rows[row['bvid']]['view'] < row['view']:
+                rows[row['bvid']] = row
+    return pd.DataFrame(list(rows.values())).reset_index(drop=True)
+
+
+def _count_csv_pages(path):
+    """
+    统计弹幕CSV中各分P的条数，返回 {(cid, page): 条数}；旧文件没有cid、page列时记为 (0, 1)
+    """
+    counts = {}
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        cid_index = header.index('cid') if 'cid' in header else None
+        page_index = header.index('page') if 'page' in header else None
+        def value(row, index, default):
+            return int(row[index]) if index is not None and index < len(row) and row[index] else default
+        for row in reader:
+            key = (value(row, cid_index, 0), value(row, page_index, 1))
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def index_csv_files(catalog, song_names=None):
+    """
+    把当前目录下目录库建立之前保存的CSV数据登记到目录库，返回登记的视频数量
+    song_names: {bvid: 歌曲名称}
+    """
+    import pandas as pd
+    song_names = song_names or {}
+    count = 0
+    for info_file in sorted(legacy_info_files()):
+        try:
+            info = pd.read_csv(info_file)
+        except Exception as e:
+            print(f"加载文件 {info_file} 时出错: {e}")
+            continue
+        if info.empty:
+            continue
+        row = info.iloc[0]
+        bvid = row['bvid']
+        crawled_at = os.path.getmtime(info_file)
+        catalog.record_video({'bvid': bvid, 'title': row['title'], 'song_name': song_names.get(bvid)},
+                             'csv', info_file, crawled_at=crawled_at)
+        danmaku_file = info_file[:-len('_info.csv')] + '_danmaku.csv'
+        if os.path.exists(danmaku_file):
+            entries = [{'cid': cid, 'page': page, 'path': danmaku_file, 'rows': rows}
+                       for (cid, page), rows in sorted(_count_csv_pages(danmaku_file).items())]
+            catalog.record_danmaku(bvid, 'csv', entries, crawled_at=os.path.getmtime(danmaku_file))
+        count += 1
+    return count
+
+
+def index_parquet_store(catalog, parquet_dir='danmaku_parquet'):
+    """
+    把Parquet存储中已有的视频信息快照和弹幕分区登记到目录库，返回登记的视频数量
+    """
+    import pyarrow.parquet
+    from parquet_store import ParquetDanmakuStore
+    store = ParquetDanmakuStore(parquet_dir)
+    count = 0
+    for video_dir in sorted(glob.glob(os.path.join(store.video_info_dir, 'bvid=*'))):
+        bvid = os.path.basename(video_dir)[len('bvid='):]
+        # 文件名按写入时间排序，取最近一次快照
+        snapshots = glob.glob(os.path.join(video_dir, 'crawl_date=*', '*.parquet'))
+        if not snapshots:
+            continue
+        info_path = max(snapshots, key=os.path.basename)
+        snapshot = pyarrow.parquet.read_table(info_path, columns=['title', 'song_name', 'crawled_at']).to_pylist()[0]
+        catalog.record_video({'bvid': bvid, 'title': snapshot['title'], 'song_name': snapshot['song_name']},
+                             'parquet', info_path, crawled_at=snapshot['crawled_at'].timestamp())
+        entries = []
+        for cid_dir in sorted(glob.glob(os.path.join(store.danmaku_dir, f'bvid={bvid}', 'cid=*'))):
+            files = sorted(glob.glob(os.path.join(cid_dir, '*', '*.parquet')))
+            if not files:
+                continue
+            pages = pyarrow.parquet.read_table(files[0], columns=['page']).column('page')
+            entries.append({'cid': int(os.path.basename(cid_dir)[len('cid='):]),
+                            'page': pages[0].as_py() if len(pages) else 1, 'path': cid_dir,
+                            'rows': sum(pyarrow.parquet.ParquetFile(path).metadata.num_rows for path in files)})
+        catalog.record_danmaku(bvid, 'parquet', entries)
+        count += 1
+    return count
+
+
+def print_video(video):
+    crawled_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(video['crawled_at']))
+    print(f"{video['bvid']}  [{video['storage']}]  {video['song_name'] or video['title']}  "
+          f"{video['row_count']} 条弹幕  {crawled_at}")
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili抓取数据目录库")
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH, help="目录库路径")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    list_parser = subparsers.add_parser('list', help="列出已登记的视频")
+    list_parser.add_argument('--storage', choices=('csv', 'parquet', 'sqlite'), default=None)
+    list_parser.add_argument('--song', default=None, help="按歌曲名称查找")
+    show_parser = subparsers.add_parser('show', help="显示一个视频的数据文件")
+    show_parser.add_argument('bvid')
+    index_parser = subparsers.add_parser('index', help="登记目录库建立之前保存的数据")
+    index_parser.add_argument('--urls-file', default='urls.txt', help="读取歌曲名称的URL文件")
+    index_parser.add_argument('--parquet-dir', default='danmaku_parquet', help="Parquet存储目录")
+    args = parser.parse_args()
+
+    catalog = DataCatalog(args.catalog)
+    try:
+        if args.command == 'list':
+            videos = catalog.videos(storage=args.storage, song_name=args.song)
+            for video in videos:
+                print_video(video)
+            print(f"共 {len(videos)} 个视频")
+        elif args.command == 'show':
+            videos = catalog.videos(bvids=[args.bvid])
+            if not videos:
+                print(f"目录库中没有 {args.bvid}")
+            for video in videos:
+                print_video(video)
+                print(f"  视频信息: {video['info_path']}（{video['content_hash']}）")
+                for entry in video['danmaku_files']:
+                    print(f"  P{entry['page']} cid={entry['cid']}: {entry['path']}，{entry['row_count']} 条（{entry['content_hash']}）")
+        elif args.command == 'index':
+            song_names = {}
+            if os.path.exists(args.urls_file):
+                with open(args.urls_file, 'r', encoding='utf-8') as f:
+                    lines = [line.strip() for line in f]
+                for comment, url in zip(lines, lines[1:]):
+                    match = re.search(r'BV[A-Za-z0-9]+', url)
+                    if comment.startswith('#') and match and not url.startswith('#'):
+                        song_names[match.group()] = comment[1:].strip()
+            count = index_csv_files(catalog, song_names)
+            print(f"登记了 {count} 个CSV视频")
+            if os.path.isdir(args.parquet_dir):
+                print(f"登记了 {index_parquet_store(catalog, args.parquet_dir)} 个Parquet视频")
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,36 +6,25 @@
 功能：生成最终的分析总结报告
 """
 
-import pandas as pd
-import glob
 import os
 
+from data_catalog import load_video_info_frame
+
 def generate_summary():
     """生成分析总结报告"""
     print("=" * 60)
     print("单依纯《歌手》节目数据分析总结报告")
     print("=" * 60)
     
-    # 加载数据
-    info_files = glob.glob('*_info.csv')
-    video_data = []
-    
-    for info_file in info_files:
-        try:
-            df = pd.read_csv(info_file)
-            if not df.empty:
-                video_data.append(df.iloc[0])
-        except Exception as e:
-            print(f"加载文件 {info_file} 时出错: {e}")
+    # 加载数据：通过数据目录库找到每个视频的信息文件
+    df = load_video_info_frame()
     
-    if not video_data:
+    if df.empty:
         print("没有找到数据文件")
         return
     
-    df = pd.DataFrame(video_data)
-    
     # 数据统计
-    total_videos = len(video_data)
+    total_videos = len(df)
     avg_view = df['view'].mean()
     max_view = df['view'].max()
     min_view = df['view'].min()
@@ -13,10 +13,11 @@ from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import pandas as pd
-import glob
 import os
 import re
 
+from data_catalog import load_video_info_frame
+
 # 尝试注册中文字体
 font_registered = False
 try:
@@ -115,24 +116,18 @@ def create_pdf_report():
     story.append(time_text)
     story.append(Spacer(1, 20))
     
-    # 加载数据
-    info_files = glob.glob('*_info.csv')
+    # 加载数据：通过数据目录库找到每个视频的信息文件
+    info_df = load_video_info_frame()
     
     # 为每个BV号保留播放量最高的记录
     video_dict = {}
-    for info_file in info_files:  # 处理所有文件
-        try:
-            df = pd.read_csv(info_file)
-            if not df.empty:
-                row = df.iloc[0]
-                bvid = row['bvid']
-                view_count = row['view']
-                
-                # 如果这个BV号还没有记录，或者当前记录的播放量更高，则更新
-                if bvid not in video_dict or video_dict[bvid]['view'] < view_count:
-                    video_dict[bvid] = row
-        except Exception as e:
-            print(f"加载文件 {info_file} 时出错: {e}")
+    for _, row in info_df.iterrows():
+        bvid = row['bvid']
+        view_count = row['view']
+        
+        # 如果这个BV号还没有记录，或者当前记录的播放量更高，则更新
+        if bvid not in video_dict or video_dict[bvid]['view'] < view_count:
+            video_dict[bvid] = row
     
     # 转换为列表
     video_data = list(video_dict.values())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili历史弹幕按日期范围抓取
+功能：先通过按月的历史弹幕索引接口查询哪些日期有弹幕，只抓取这些日期，
+      多个日期并发抓取（共用爬虫的限速器），边抓取边按row_id去重
+"""
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from danmaku_batch import DanmakuBatch
+from http_resilience import RequestFailedError
+
+
+def parse_date(value):
+    """
+    将 'YYYY-MM-DD' 字符串转换为date
+    """
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def months_between(start_date, end_date):
+    """
+    返回start_date到end_date之间（含两端）的所有月份，格式为 'YYYY-MM'
+    """
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append(f'{year:04d}-{month:02d}')
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return months
+
+
+class HistoryDanmakuSweeper:
+    def __init__(self, crawler, max_workers=4):
+        """
+        crawler: 已设置cookies的BilibiliCrawler实例
+        max_workers: 同时抓取的日期数量
+        """
+        self.crawler = crawler
+        self.max_workers = max(1, int(max_workers))
+
+    def history_index_url(self, oid, month):
+        return f'{self.crawler.api_base}/x/v2/dm/history/index?type=1&oid={oid}&month={month}'
+
+    def fetch_history_dates(self, oid, month):
+        """
+        查询某个月中有历史弹幕的日期列表
+        请求失败时抛出RequestFailedError
+        """
+        url = self.history_index_url(oid, month)
+        data = self.crawler._request(url, parse_json=True)
+        if data['code'] != 0:
+            raise RequestFailedError(url, 'dm_history', f"历史弹幕索引响应异常: {data.get('message')}",
+                                     retryable=False)
+        return data.get('data') or []
+
+    def list_dates(self, oid, start_date, end_date):
+        """
+        返回日期范围内有历史弹幕的日期（升序）
+        """
+        start, end = parse_date(start_date), parse_date(end_date)
+        dates = []
+        for month in months_between(start, end):
+            for date in self.fetch_history_dates(oid, month):
+                if start <= parse_date(date) <= end:
+                    dates.append(date)
+        return sorted(set(dates))
+
+    def iter_sweep(self, oid, start_date, end_date):
+        """
+        抓取日期范围内的全部历史弹幕，按日期完成顺序产出(日期, 新弹幕DanmakuBatch)
+        同一条弹幕会出现在多个日期的结果中，这里只产出此前未出现过的弹幕
+        同时进行中的日期不超过max_workers个，已产出的结果不在内部保留
+        """
+        crawler = self.crawler
+        if not crawler.logged_in:
+            print("需要登录才能获取历史弹幕，请先设置cookies")
+            return
+        try:
+            dates = self.list_dates(oid, start_date, end_date)
+        except RequestFailedError as e:
+            crawler.record_failure(oid, 'history_index', e)
+            return
+        print(f"{start_date} 至 {end_date} 共有 {len(dates)} 天存在历史弹幕")
+
+        seen_row_ids = set()
+        pending = {}
+        remaining = iter(dates)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit_next():
+                date = next(remaining, None)
+                if date is not None:
+                    future = executor.submit(crawler.crawl_historical_danmaku, oid, date, True)
+                    pending[future] = date
+
+            for _ in range(self.max_workers):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    date = pending.pop(future)
+                    submit_next()
+                    try:
+                        danmakus = future.result()
+                    except RequestFailedError as e:
+                        crawler.record_failure(f'{oid}@{date}', 'history', e)
+                        continue
+
+                    new_mask = np.zeros(len(danmakus), dtype=bool)
+                    for index, row_id in enumerate(danmakus.column('row_id')):
+                        if row_id not in seen_row_ids:
+                            seen_row_ids.add(row_id)
+                            new_mask[index] = True
+                    new_danmakus = danmakus.take(new_mask)
+                    yield date, new_danmakus
+
+    def sweep(self, oid, start_date, end_date):
+        """
+        抓取日期范围内的全部历史弹幕，返回去重后的DanmakuBatch（按出现时间排序）
+        """
+        batches = []
+        for date, new_danmakus in self.iter_sweep(oid, start_date, end_date):
+            print(f"{date}: 新增 {len(new_danmakus)} 条历史弹幕")
+            batches.append(new_danmakus)
+        return DanmakuBatch.concat(batches).sort_by('time')
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫HTTP容错组件
+功能：提供带指数退避和随机抖动的重试策略、按接口划分的熔断器，
+      以及描述请求失败原因的结构化异常
+"""
+
+import random
+import threading
+import time
+
+
+# 可以重试的HTTP状态码：限流和服务端错误
+RETRYABLE_STATUS_CODES = {412, 429, 500, 502, 503, 504}
+# 可以重试的B站接口返回码：限流
+RETRYABLE_API_CODES = {-412, -509}
+
+
+class RequestFailedError(Exception):
+    def __init__(self, url, endpoint, reason, attempts=1, retryable=True):
+        """
+        url: 失败的请求地址
+        endpoint: 接口类别（与限速器的预算名称一致）
+        reason: 失败原因描述
+        attempts: 已尝试次数
+        retryable: 稍后重新运行是否有可能成功
+        """
+        super().__init__(f"{reason} (接口: {endpoint}, 尝试 {attempts} 次)")
+        self.url = url
+        self.endpoint = endpoint
+        self.reason = reason
+        self.attempts = attempts
+        self.retryable = retryable
+
+
+class CircuitOpenError(RequestFailedError):
+    def __init__(self, url, endpoint):
+        super().__init__(url, endpoint, "接口熔断中，暂停请求", attempts=0, retryable=True)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0,
+                 connect_timeout=3.05, read_timeout=20.0):
+        """
+        max_attempts: 最多尝试次数（含第一次）
+        base_delay: 第一次重试前的基准等待时间（秒），之后按2的幂增长
+        max_delay: 单次等待时间上限（秒）
+        connect_timeout / read_timeout: 连接超时和读取超时（秒）
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = (connect_timeout, read_timeout)
+
+    def backoff(self, attempt):
+        """
+        计算第attempt次失败后的等待时间，使用全抖动（full jitter）避免并发请求同时重试
+        """
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def sleep(self, attempt):
+        time.sleep(self.backoff(attempt))
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        failure_threshold: 连续失败多少次后熔断
+        reset_timeout: 熔断后经过多少秒放行一个试探请求
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        判断当前是否允许发出请求
+        半开状态下同一时刻只放行一个试探请求
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class CircuitBreakerRegistry:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        按接口类别懒创建熔断器
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        with self._lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫持久化任务队列
+功能：保存批量抓取任务，每个视频一条任务，记录状态（pending/running/done/failed）、
+      尝试次数和最近一次错误；进程中断后重新运行会从中断处继续，只重试失败的任务。
+      领取任务时附带租约，工作进程通过心跳续约，租约过期的任务可以被其他工作进程重新领取，
+      因此多个进程（或多台机器）可以共用同一个队列：
+      - CrawlJobQueue: SQLite（WAL模式），依靠数据库文件锁在单机的多个进程间共享
+      - RedisJobQueue: Redis协议，在多台机器间共享
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from resp_client import RedisClient
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 默认租约时长（秒）：工作进程超过这个时间没有心跳，其任务会被重新领取
+DEFAULT_LEASE_SECONDS = 120
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bvid TEXT NOT NULL UNIQUE,
+    cid INTEGER,
+    url TEXT NOT NULL,
+    song_name TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retryable INTEGER NOT NULL DEFAULT 1,
+    last_error TEXT,
+    worker_id TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id);
+"""
+
+# 旧版本数据库中没有的列
+_ADDED_COLUMNS = {
+    'song_name': 'TEXT',
+    'worker_id': 'TEXT',
+    'lease_expires': 'REAL',
+}
+
+_LEASE_EXHAUSTED = '租约过期且已达到最大尝试次数'
+
+
+def default_worker_id():
+    """
+    当前进程的工作进程标识：主机名:进程号
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def open_job_queue(location, **kwargs):
+    """
+    根据位置创建任务队列：redis:// 开头使用RedisJobQueue，否则视为SQLite数据库路径
+    """
+    if location.startswith('redis://'):
+        return RedisJobQueue(location, **kwargs)
+    return CrawlJobQueue(location, **kwargs)
+
+
+class CrawlJobQueue:
+    def __init__(self, path='crawl_jobs.db', max_attempts=3, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        path: SQLite数据库文件路径
+        max_attempts: 每个任务最多尝试次数，超过后不再自动重试
+        lease_seconds: 领取任务的租约时长（秒）
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        # 连接在爬虫的多个线程间共享，由self._lock串行化访问；
+        # 多个进程之间由SQLite的文件锁串行化写事务，timeout为等待锁的时间
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        for name, column_type in _ADDED_COLUMNS.items():
+            if name not in columns:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {column_type}')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def has_unfinished(self):
+        """
+        是否存在未完成的任务：pending、running，或可重试且未超过尝试次数的failed
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE state IN (?, ?) '
+                'OR (state = ? AND retryable = 1 AND attempts < ?)',
+                (PENDING, RUNNING, FAILED, self.max_attempts)).fetchone()
+        return row[0] > 0
+
+    def clear(self):
+        """
+        删除所有任务，开始新一批抓取
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs')
+
+    def enqueue(self, bvid, url, song_name=None):
+        """
+        添加任务，同一个BV号只保留一条任务
+        返回是否为新任务
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO jobs (bvid, url, song_name, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (bvid, url, song_name, now, now))
+            return cursor.rowcount == 1
+
+    def recover(self):
+        """
+        单进程抓取启动时调用：上次运行中断时遗留的running任务重新置为pending，
+        可重试且未超过尝试次数的failed任务也重新排队
+        有其他工作进程正在使用队列时不要调用，应依靠租约过期回收任务
+        返回重新排队的任务数量
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            interrupted = self._conn.execute(
+                'UPDATE jobs SET state = ?, worker_id = NULL, lease_expires = NULL, updated_at = ? '
+                'WHERE state = ?',
+                (PENDING, now, RUNNING)).rowcount
+            self._conn.execute('COMMIT')
+        return interrupted + self.retry_failed()
+
+    def retry_failed(self):
+        """
+        可重试且未超过尝试次数的failed任务重新排队，返回重新排队的任务数量
+        """
+        with self._lock:
+            return self._conn.execute(
+                'UPDATE jobs SET state = ?, updated_at = ? '
+                'WHERE state = ? AND retryable = 1 AND attempts < ?',
+                (PENDING, time.time(), FAILED, self.max_attempts)).rowcount
+
+    def claim(self, worker_id=None):
+        """
+        领取一个任务并置为running，租约过期的running任务也可以被重新领取
+        没有任务时返回None
+        """
+        worker_id = worker_id or default_worker_id()
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            # 反复租约过期（如每次都导致工作进程崩溃）的任务不再重新领取
+            self._conn.execute(
+                'UPDATE jobs SET state = ?, retryable = 0, last_error = ?, updated_at = ? '
+                'WHERE state = ? AND lease_expires < ? AND attempts >= ?',
+                (FAILED, _LEASE_EXHAUSTED, now, RUNNING, now, self.max_attempts))
+            row = self._conn.execute(
+                'SELECT * FROM jobs WHERE state = ? OR (state = ? AND lease_expires < ?) '
+                'ORDER BY id LIMIT 1', (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                self._conn.execute('COMMIT')
+                return None
+            self._conn.execute(
+                'UPDATE jobs SET state = ?, attempts = attempts + 1, worker_id = ?, lease_expires = ?, '
+                'updated_at = ? WHERE id = ?',
+                (RUNNING, worker_id, now + self.lease_seconds, now, row['id']))
+            self._conn.execute('COMMIT')
+        job = dict(row)
+        job.update(state=RUNNING, attempts=job['attempts'] + 1, worker_id=worker_id,
+                   lease_expires=now + self.lease_seconds)
+        return job
+
+    def heartbeat(self, job_id, worker_id=None):
+        """
+        为正在处理的任务续约；任务已被其他工作进程重新领取时返回False
+        """
+        worker_id = worker_id or default_worker_id()
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET lease_expires = ?, updated_at = ? '
+                'WHERE id = ? AND state = ? AND worker_id = ?',
+                (now + self.lease_seconds, now, job_id, RUNNING, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, cid=None, worker_id=None):
+        """
+        标记任务完成；指定worker_id时只有仍持有该任务的工作进程才能更新
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET state = ?, cid = COALESCE(?, cid), last_error = NULL, '
+                'lease_expires = NULL, updated_at = ? '
+                'WHERE id = ? AND (? IS NULL OR worker_id = ?)',
+                (DONE, cid, time.time(), job_id, worker_id, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, error, retryable=True, worker_id=None):
+        """
+        标记任务失败；指定worker_id时只有仍持有该任务的工作进程才能更新
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET state = ?, retryable = ?, last_error = ?, lease_expires = NULL, '
+                'updated_at = ? WHERE id = ? AND (? IS NULL OR worker_id = ?)',
+                (FAILED, int(bool(retryable)), error, time.time(), job_id, worker_id, worker_id))
+            return cursor.rowcount == 1
+
+    def counts(self):
+        """
+        返回各状态的任务数量
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update({state: count for state, count in rows})
+        return counts
+
+    def failed_jobs(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM jobs WHERE state = ? ORDER BY id', (FAILED,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+class RedisJobQueue:
+    """
+    基于Redis协议的任务队列，键的布局（prefix默认为 bilibili:jobs）：
+    - {prefix}:next_id     自增任务ID
+    - {prefix}:ids         哈希，BV号 -> 任务ID（去重）
+    - {prefix}:job:{id}    哈希，任务字段
+    - {prefix}:schedule    有序集合，待处理和处理中的任务；分数为可领取的时间：
+                           pending任务为入队时间，running任务为租约到期时间，
+                           因此租约过期的任务会自然地重新变为可领取
+    - {prefix}:done / failed / retry   集合，完成、失败、可重试的失败任务
+    """
+
+    _INT_FIELDS = ('id', 'cid', 'attempts', 'retryable')
+    _FLOAT_FIELDS = ('lease_expires', 'created_at', 'updated_at')
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', max_attempts=3,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, prefix='bilibili:jobs', max_claim_retries=50):
+        """
+        url: Redis服务器地址，如 redis://:password@host:6379/0
+        max_attempts: 每个任务最多尝试次数，超过后不再自动重试
+        lease_seconds: 领取任务的租约时长（秒）
+        prefix: 键名前缀，不同的批量任务可以使用不同前缀共用一个Redis
+        max_claim_retries: 领取任务时与其他工作进程冲突的最大重试次数
+        """
+        self.url = url
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.prefix = prefix
+        self.max_claim_retries = max_claim_retries
+        self._client = RedisClient.from_url(url)
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(part) for part in parts))
+
+    def _execute(self, *args):
+        return self._client.execute(*args)
+
+    def _load_job(self, job_id):
+        values = self._execute('HGETALL', self._key('job', job_id))
+        if not values:
+            return None
+        job = dict(zip(values[::2], values[1::2]))
+        for field in self._INT_FIELDS:
+            job[field] = int(job[field]) if job.get(field) not in (None, '') else None
+        for field in self._FLOAT_FIELDS:
+            job[field] = float(job[field]) if job.get(field) not in (None, '') else None
+        for field in ('song_name', 'last_error', 'worker_id'):
+            job[field] = job.get(field) or None
+        return job
+
+    def close(self):
+        self._client.close()
+
+    def has_unfinished(self):
+        """
+        是否存在未完成的任务：待处理、处理中或可重试的失败任务
+        """
+        with self._client.lock:
+            return (self._execute('ZCARD', self._key('schedule')) > 0
+                    or self._execute('SCARD', self._key('retry')) > 0)
+
+    def clear(self):
+        """
+        删除所有任务，开始新一批抓取
+        """
+        with self._client.lock:
+            job_ids = self._execute('HVALS', self._key('ids'))
+            keys = [self._key('job', job_id) for job_id in job_ids]
+            keys += [self._key(name) for name in ('next_id', 'ids', 'schedule', 'done', 'failed', 'retry')]
+            self._execute('DEL', *keys)
+
+    def enqueue(self, bvid, url, song_name=None):
+        """
+        添加任务，同一个BV号只保留一条任务
+        返回是否为新任务
+        """
+        with self._client.lock:
+            if self._execute('HGET', self._key('ids'), bvid) is not None:
+                return False
+            job_id = self._execute('INCR', self._key('next_id'))
+            if not self._execute('HSETNX', self._key('ids'), bvid, job_id):
+                # 其他节点同时添加了同一个视频
+                return False
+            now = time.time()
+            self._execute('HSET', self._key('job', job_id),
+                          'id', job_id, 'bvid', bvid, 'url', url, 'song_name', song_name or '',
+                          'state', PENDING, 'attempts', 0, 'retryable', 1,
+                          'created_at', now, 'updated_at', now)
+            self._execute('ZADD', self._key('schedule'), now, job_id)
+            return True
+
+    def recover(self):
+        """
+        与CrawlJobQueue.recover相同：单进程抓取启动时把遗留的处理中任务和可重试的失败任务重新排队
+        返回重新排队的任务数量
+        """
+        now = time.time()
+        with self._client.lock:
+            running = self._execute('ZRANGEBYSCORE', self._key('schedule'), f'({now}', '+inf')
+            for job_id in running:
+                self._execute('ZADD', self._key('schedule'), now, job_id)
+                self._execute('HSET', self._key('job', job_id), 'state', PENDING, 'worker_id', '',
+                              'updated_at', now)
+        return len(running) + self.retry_failed()
+
+    def retry_failed(self):
+        """
+        可重试且未超过尝试次数的failed任务重新排队，返回重新排队的任务数量
+        """
+        now = time.time()
+        with self._client.lock:
+            job_ids = self._execute('SMEMBERS', self._key('retry'))
+            for job_id in job_ids:
+                self._execute('SREM', self._key('retry'), job_id)
+                self._execute('SREM', self._key('failed'), job_id)
+                self._execute('HSET', self._key('job', job_id), 'state', PENDING, 'updated_at', now)
+                self._execute('ZADD', self._key('schedule'), now, job_id)
+        return len(job_ids)
+
+    def claim(self, worker_id=None):
+        """
+        领取一个可领取的任务（pending或租约已过期）并置为running，没有任务时返回None
+        通过WATCH/MULTI/EXEC乐观锁保证同一任务只被一个工作进程领取
+        """
+        worker_id = worker_id or default_worker_id()
+        schedule = self._key('schedule')
+        for _ in range(self.max_claim_retries):
+            with self._client.lock:
+                now = time.time()
+                self._execute('WATCH', schedule)
+                job_ids = self._execute('ZRANGEBYSCORE', schedule, '-inf', now, 'LIMIT', 0, 1)
+                if not job_ids:
+                    self._execute('UNWATCH')
+                    return None
+                job = self._load_job(job_ids[0])
+                job_key = self._key('job', job['id'])
+                self._execute('MULTI')
+                if job['state'] == RUNNING and job['attempts'] >= self.max_attempts:
+                    # 反复租约过期的任务不再重新领取
+                    self._execute('ZREM', schedule, job['id'])
+                    self._execute('SADD', self._key('failed'), job['id'])
+                    self._execute('HSET', job_key, 'state', FAILED, 'retryable', 0,
+                                  'last_error', _LEASE_EXHAUSTED, 'updated_at', now)
+                    self._execute('EXEC')
+                    continue
+                lease_expires = now + self.lease_seconds
+                self._execute('ZADD', schedule, lease_expires, job['id'])
+                self._execute('HSET', job_key, 'state', RUNNING, 'attempts', job['attempts'] + 1,
+                              'worker_id', worker_id, 'lease_expires', lease_expires, 'updated_at', now)
+                if self._execute('EXEC') is None:
+                    # 其他工作进程抢先修改了队列，重新领取
+                    continue
+            job.update(state=RUNNING, attempts=job['attempts'] + 1, worker_id=worker_id,
+                       lease_expires=lease_expires)
+            return job
+        return None
+
+    def _update_owned(self, job_id, worker_id, update):
+        """
+        仍由worker_id持有任务时在事务中执行update，返回是否更新成功
+        """
+        job_key = self._key('job', job_id)
+        with self._client.lock:
+            self._execute('WATCH', job_key)
+            owner = self._execute('HGET', job_key, 'worker_id')
+            state = self._execute('HGET', job_key, 'state')
+            if state != RUNNING or (worker_id is not None and owner != worker_id):
+                self._execute('UNWATCH')
+                return False
+            self._execute('MULTI')
+            update(job_key)
+            return self._execute('EXEC') is not None
+
+    def heartbeat(self, job_id, worker_id=None):
+        """
+        为正在处理的任务续约；任务已被其他工作进程重新领取时返回False
+        """
+        worker_id = worker_id or default_worker_id()
+        now = time.time()
+
+        def update(job_key):
+            self._execute('ZADD', self._key('schedule'), 'XX', now + self.lease_seconds, job_id)
+            self._execute('HSET', job_key, 'lease_expires', now + self.lease_seconds, 'updated_at', now)
+        return self._update_owned(job_id, worker_id, update)
+
+    def complete(self, job_id, cid=None, worker_id=None):
+        now = time.time()
+
+        def update(job_key):
+            self._execute('ZREM', self._key('schedule'), job_id)
+            self._execute('SADD', self._key('done'), job_id)
+            fields = ['state', DONE, 'last_error', '', 'lease_expires', '', 'updated_at', now]
+            if cid is not None:
+                fields += ['cid', cid]
+            self._execute('HSET', job_key, *fields)
+        return self._update_owned(job_id, worker_id, update)
+
+    def fail(self, job_id, error, retryable=True, worker_id=None):
+        now = time.time()
+        job = self._load_job(job_id)
+        retry = retryable and job is not None and job['attempts'] < self.max_attempts
+
+        def update(job_key):
+            self._execute('ZREM', self._key('schedule'), job_id)
+            self._execute('SADD', self._key('failed'), job_id)
+            if retry:
+                self._execute('SADD', self._key('retry'), job_id)
+            self._execute('HSET', job_key, 'state', FAILED, 'retryable', int(bool(retryable)),
+                          'last_error', error, 'lease_expires', '', 'updated_at', now)
+        return self._update_owned(job_id, worker_id, update)
+
+    def counts(self):
+        """
+        返回各状态的任务数量；租约已过期、等待重新领取的任务计为pending
+        """
+        now = time.time()
+        with self._client.lock:
+            return {
+                PENDING: self._execute('ZCOUNT', self._key('schedule'), '-inf', now),
+                RUNNING: self._execute('ZCOUNT', self._key('schedule'), f'({now}', '+inf'),
+                DONE: self._execute('SCARD', self._key('done')),
+                FAILED: self._execute('SCARD', self._key('failed')),
+            }
+
+    def failed_jobs(self):
+        with self._client.lock:
+            job_ids = self._execute('SMEMBERS', self._key('failed'))
+            jobs = [self._load_job(job_id) for job_id in job_ids]
+        return sorted((job for job in jobs if job), key=lambda job: job['id'])
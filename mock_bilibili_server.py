@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟Bilibili服务器
+功能：在本机提供视频信息接口、弹幕XML接口、分段弹幕接口、历史弹幕接口和评论接口，
+      数据来自固定数据文件、录制的流量或合成生成器；可注入响应延迟、随机错误和412限流，
+      用于离线测试和性能基准测试
+"""
+
+import argparse
+import calendar
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+from danmaku_protobuf import SEGMENT_SECONDS, encode_danmaku_segment
+from traffic_replay import TrafficCassette
+
+
+def fake_cid(bvid):
+    """
+    根据BV号生成稳定的cid
+    """
+    return zlib.crc32(bvid.encode('utf-8')) % 100000000 + 1000
+
+
+def build_video_view(bvid, num_danmaku=1000, num_pages=1, elapsed=0.0):
+    """
+    生成与 x/web-interface/view 接口结构一致的视频信息
+    num_pages: 分P数量，各分P的cid依次递增
+    elapsed: 服务器已运行的秒数，统计数据随时间增长，约十分之一的视频增长很快
+    """
+    cid = fake_cid(bvid)
+    seed = cid % 9973
+    duration = 240 + seed % 120
+    views_per_second = 50.0 if seed % 10 == 0 else (seed % 7) / 10
+    return {
+        'code': 0,
+        'message': '0',
+        'data': {
+            'bvid': bvid,
+            'aid': cid * 3,
+            'title': f'模拟视频 {bvid}',
+            'desc': '本地模拟服务器生成的视频',
+            'duration': duration * num_pages,
+            'pubdate': 1735689600 + seed * 60,
+            'owner': {'name': '模拟UP主'},
+            'cid': cid,
+            'pages': [{'cid': cid + i, 'page': i + 1, 'part': f'P{i + 1}', 'duration': duration}
+                      for i in range(num_pages)],
+            'stat': {
+                'view': 100000 + seed * 17 + int(elapsed * views_per_second),
+                'danmaku': num_danmaku,
+                'reply': 500 + seed % 300 + int(elapsed * views_per_second / 100),
+                'like': 8000 + seed + int(elapsed * views_per_second / 20),
+                'coin': 3000 + seed % 1000,
+                'favorite': 2000 + seed % 700,
+                'share': 400 + seed % 200,
+            },
+        },
+    }
+
+
+def build_danmaku_xml(cid, num_danmaku=1000):
+    """
+    生成与 comment.bilibili.com/{cid}.xml 结构一致的弹幕XML
+    """
+    parts = ['<?xml version="1.0" encoding="UTF-8"?><i>',
+             f'<chatserver>chat.bilibili.com</chatserver><chatid>{cid}</chatid>']
+    for i in range(num_danmaku):
+        p = f'{i * 0.25:.3f},1,25,16777215,{1735689600 + i},0,{i % 5000:08x},{cid * 100000 + i},11'
+        parts.append(f'<d p="{p}">{escape(f"弹幕{i}")}</d>')
+    parts.append('</i>')
+    return ''.join(parts).encode('utf-8')
+
+
+def build_danmaku_segment(cid, segment_index, num_danmaku=1000):
+    """
+    生成与 x/v2/dm/web/seg.so 结构一致的分段弹幕（protobuf）
+    弹幕与build_danmaku_xml相同，按出现时间落入对应的6分钟分段
+    """
+    start = (segment_index - 1) * SEGMENT_SECONDS
+    first = max(0, start * 4)
+    last = min(num_danmaku, (start + SEGMENT_SECONDS) * 4)
+    danmakus = [{
+        'content': f'弹幕{i}',
+        'time': i * 0.25,
+        'type': 1,
+        'fontsize': 25,
+        'color': 16777215,
+        'timestamp': 1735689600 + i,
+        'pool': 0,
+        'uid': f'{i % 5000:08x}',
+        'row_id': str(cid * 100000 + i),
+    } for i in range(first, last)]
+    return encode_danmaku_segment(danmakus)
+
+
+def build_history_index(cid, month):
+    """
+    生成与 x/v2/dm/history/index 结构一致的响应：当月存在历史弹幕的日期
+    """
+    year, mon = (int(part) for part in month.split('-'))
+    days = calendar.monthrange(year, mon)[1]
+    dates = [f'{year:04d}-{mon:02d}-{day:02d}' for day in range(1, days + 1) if (day + cid) % 3 == 0]
+    return {'code': 0, 'message': '0', 'data': dates}
+
+
+def build_history_danmaku(cid, date, per_day=50, window_days=5):
+    """
+    生成与 x/v2/dm/history 结构一致的响应
+    每天返回最近window_days天发送的弹幕，相邻日期的结果有重叠，用于验证去重
+    """
+    day_number = datetime.date.fromisoformat(date).toordinal()
+    first = (day_number - window_days + 1) * per_day
+    elems = []
+    for i in range(first, (day_number + 1) * per_day):
+        elems.append({
+            'id_str': str(cid * 10000000 + i % 10000000),
+            'content': f'历史弹幕{i}',
+            'progress': (i % 3600) * 100,
+            'mode': 1,
+            'fontsize': 25,
+            'color': 16777215,
+            'ctime': (i // per_day - 719163) * 86400 + i % per_day,
+            'pool': 0,
+            'mid_hash': f'{i % 5000:08x}',
+        })
+    return {'code': 0, 'message': '0', 'data': elems}
+
+
+def reply_count(rpid):
+    """
+    顶层评论的楼中楼回复数：每50条评论中有一条回复很多，需要翻页抓取
+    """
+    return 45 if rpid % 50 == 0 else rpid % 7
+
+
+def build_reply(aid, rpid, root, ctime, rcount=0, replies=None):
+    return {
+        'rpid': rpid,
+        'oid': aid,
+        'root': root,
+        'parent': root,
+        'mid': rpid % 100000,
+        'ctime': ctime,
+        'like': rpid % 97,
+        'rcount': rcount,
+        'member': {'mid': str(rpid % 100000), 'uname': f'用户{rpid % 100000}'},
+        'content': {'message': f'模拟评论 {rpid}'},
+        'replies': replies,
+    }
+
+
+def build_sub_replies(aid, root, first, last):
+    """
+    楼中楼回复：第j条回复的rpid为 root * 100 + j，按发送时间升序
+    """
+    root_ctime = 1735689600 + (root % 1000000) * 60
+    return [build_reply(aid, root * 100 + j, root, root_ctime + j * 10)
+            for j in range(first, min(last, reply_count(root)) + 1)]
+
+
+def build_reply_main(aid, cursor=0, page_size=20, num_replies=200):
+    """
+    生成与 x/v2/reply/main（mode=2，按时间倒序）结构一致的响应
+    第i条顶层评论的rpid为 aid * 1000000 + i，cursor为翻页游标（从0开始）；
+    每条评论附带最多3条楼中楼回复预览
+    """
+    newest = num_replies - cursor * page_size
+    replies = []
+    for index in range(newest, max(0, newest - page_size), -1):
+        rpid = aid * 1000000 + index
+        replies.append(build_reply(aid, rpid, 0, 1735689600 + index * 60, reply_count(rpid),
+                                   build_sub_replies(aid, rpid, 1, 3)))
+    return {'code': 0, 'message': '0', 'data': {
+        'cursor': {'is_begin': cursor == 0, 'is_end': newest - page_size <= 0,
+                   'next': cursor + 1, 'all_count': num_replies},
+        'replies': replies,
+    }}
+
+
+def build_reply_thread(aid, root, page=1, page_size=20):
+    """
+    生成与 x/v2/reply/reply 结构一致的响应：某条评论的楼中楼回复，按页码翻页（从1开始）
+    """
+    first = (page - 1) * page_size + 1
+    return {'code': 0, 'message': '0', 'data': {
+        'page': {'num': page, 'size': page_size, 'count': reply_count(root)},
+        'replies': build_sub_replies(aid, root, first, first + page_size - 1),
+    }}
+
+
+class MockBilibiliHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # 基准测试时不输出访问日志
+        pass
+
+    def _send(self, status, body, content_type, content_encoding=None, extra_headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data):
+        body = data if isinstance(data, bytes) else json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._send(200, body, 'application/json; charset=utf-8')
+
+    def _send_recorded(self, meta):
+        """
+        返回录制的响应；录制的弹幕XML是解压后的内容，按需重新压缩
+        """
+        server = self.server
+        body = server.cassette.read_body(meta)
+        headers = {k: v for k, v in meta['headers'].items()
+                   if k.lower() not in ('content-type', 'content-length', 'content-encoding')}
+        content_type = meta['headers'].get('Content-Type', 'application/octet-stream')
+        encoding = None
+        if server.compress and 'xml' in content_type:
+            body, encoding = deflate(body), 'deflate'
+        self._send(meta['status_code'], body, content_type, encoding, headers)
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + (server.random_uniform(0, server.latency_jitter) if server.latency_jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        # 按配置注入限流（HTTP 412）和服务端错误
+        fault = server.record_request()
+        if fault == 412:
+            body = json.dumps({'code': -412, 'message': '请求被拦截'}, ensure_ascii=False)
+            self._send(412, body.encode('utf-8'), 'application/json; charset=utf-8')
+            return
+        if fault:
+            self._send(fault, b'', 'text/plain')
+            return
+
+        if server.cassette is not None:
+            meta = server.cassette.next_response(self.path)
+            if meta is not None:
+                self._send_recorded(meta)
+                return
+
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+
+        if parsed.path == '/x/web-interface/view':
+            bvid = params.get('bvid', [''])[0]
+            fixture = server.fixture(f'view_{bvid}.json')
+            if fixture is not None:
+                self._send_json(fixture)
+                return
+            self._send_json(build_video_view(bvid, server.num_danmaku, server.num_pages,
+                                             time.time() - server.started_at))
+        elif parsed.path.endswith('.xml'):
+            try:
+                cid = int(parsed.path.strip('/')[:-len('.xml')])
+            except ValueError:
+                self._send(404, b'', 'text/plain')
+                return
+            body = server.danmaku_xml(cid)
+            # 支持条件请求：内容未变化时返回304
+            etag = f'"{zlib.crc32(body):08x}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            # B站弹幕XML以raw deflate压缩传输
+            self._send(200, body, 'text/xml; charset=utf-8',
+                       'deflate' if server.compress else None, {'ETag': etag})
+        elif parsed.path == '/x/v2/dm/history/index':
+            cid = int(params.get('oid', ['0'])[0])
+            month = params.get('month', ['1970-01'])[0]
+            fixture = server.fixture(f'history_index_{cid}_{month}.json')
+            self._send_json(fixture if fixture is not None else build_history_index(cid, month))
+        elif parsed.path == '/x/v2/dm/history':
+            cid = int(params.get('oid', ['0'])[0])
+            date = params.get('date', ['1970-01-01'])[0]
+            fixture = server.fixture(f'history_{cid}_{date}.json')
+            self._send_json(fixture if fixture is not None else build_history_danmaku(cid, date))
+        elif parsed.path in ('/x/v2/reply/main', '/x/v2/reply/reply'):
+            try:
+                aid = int(params.get('oid', [''])[0])
+                page_size = min(int(params.get('ps', ['20'])[0]), 49)
+                if parsed.path == '/x/v2/reply/main':
+                    cursor = int(params.get('next', ['0'])[0])
+                    data = build_reply_main(aid, cursor, page_size, server.num_replies)
+                else:
+                    root = int(params.get('root', [''])[0])
+                    data = build_reply_thread(aid, root, int(params.get('pn', ['1'])[0]), page_size)
+            except ValueError:
+                self._send(400, b'', 'text/plain')
+                return
+            self._send_json(data)
+        elif parsed.path == '/x/v2/dm/web/seg.so':
+            try:
+                cid = int(params.get('oid', [''])[0])
+                segment_index = int(params.get('segment_index', ['1'])[0])
+            except ValueError:
+                self._send(400, b'', 'text/plain')
+                return
+            self._send(200, server.danmaku_segment(cid, segment_index), 'application/octet-stream')
+        else:
+            self._send(404, b'', 'text/plain')
+
+
+def deflate(body):
+    """
+    以raw deflate压缩（与B站弹幕XML的传输编码一致）
+    """
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class MockBilibiliServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, num_danmaku=1000, compress=True,
+                 fixtures_dir=None, num_pages=1, latency_jitter=0.0, error_rate=0.0,
+                 throttle_rate=None, cassette_dir=None, seed=None, num_replies=200):
+        """
+        latency: 每个请求注入的延迟（秒）
+        num_danmaku: 每个视频返回的弹幕数量
+        compress: 是否像线上一样以deflate压缩弹幕XML
+        fixtures_dir: 固定数据目录，存在对应文件时优先返回文件内容，否则由生成器合成：
+                      view_{bvid}.json、{cid}.xml、{cid}_{segment_index}.pb、
+                      history_index_{cid}_{month}.json、history_{cid}_{date}.json
+        num_pages: 每个视频的分P数量
+        latency_jitter: 在latency基础上再随机增加0到latency_jitter秒的延迟
+        error_rate: 随机返回500/503错误的请求比例
+        throttle_rate: 每秒允许的请求数，超出时返回HTTP 412（与B站的风控限流一致），None表示不限流
+        cassette_dir: TrafficCassette录制目录，存在录制的请求按录制顺序返回录制的响应
+        seed: 随机数种子，用于复现同样的延迟和错误序列
+        num_replies: 每个视频的顶层评论数量，运行中增大该值可模拟新评论
+        port为0时由系统分配空闲端口
+        """
+        super().__init__((host, port), MockBilibiliHandler)
+        self.latency = latency
+        self.num_danmaku = num_danmaku
+        self.compress = compress
+        self.fixtures_dir = fixtures_dir
+        self.num_pages = num_pages
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.cassette = TrafficCassette(cassette_dir) if cassette_dir else None
+        self.num_replies = num_replies
+        self.request_count = 0
+        self.error_count = 0
+        self.throttle_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._xml_cache = {}
+        self._throttle_tokens = throttle_rate or 0.0
+        self._throttle_refill = time.monotonic()
+        self.started_at = time.time()
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # 客户端达到弹幕上限后提前断开连接属于正常情况，不输出异常
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def random_uniform(self, low, high):
+        with self._lock:
+            return self._random.uniform(low, high)
+
+    def record_request(self):
+        """
+        记录一次请求并决定是否注入故障：返回412（限流）、500/503（服务端错误）或None（正常响应）
+        """
+        with self._lock:
+            self.request_count += 1
+            if self.throttle_rate:
+                now = time.monotonic()
+                self._throttle_tokens = min(self.throttle_rate, self._throttle_tokens +
+                                            (now - self._throttle_refill) * self.throttle_rate)
+                self._throttle_refill = now
+                if self._throttle_tokens < 1.0:
+                    self.throttle_count += 1
+                    return 412
+                self._throttle_tokens -= 1.0
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.error_count += 1
+                return self._random.choice((500, 503))
+        return None
+
+    def fixture(self, name):
+        """
+        读取固定数据文件，不存在时返回None
+        """
+        if not self.fixtures_dir:
+            return None
+        path = os.path.join(self.fixtures_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def danmaku_xml(self, cid):
+        with self._lock:
+            body = self._xml_cache.get(cid)
+        if body is None:
+            body = self.fixture(f'{cid}.xml')
+            if body is None:
+                body = build_danmaku_xml(cid, self.num_danmaku)
+            if self.compress:
+                body = deflate(body)
+            with self._lock:
+                self._xml_cache[cid] = body
+        return body
+
+    def danmaku_segment(self, cid, segment_index):
+        fixture = self.fixture(f'{cid}_{segment_index}.pb')
+        if fixture is not None:
+            return fixture
+        return build_danmaku_segment(cid, segment_index, self.num_danmaku)
+
+    def start(self):
+        """
+        在后台线程中启动服务器
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """
+    主函数 - 单独启动模拟服务器
+    """
+    parser = argparse.ArgumentParser(description="本地模拟Bilibili服务器")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.05, help="每个请求的延迟（秒）")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="随机附加延迟的上限（秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="随机返回500/503的请求比例")
+    parser.add_argument('--throttle-rate', type=float, default=None, help="每秒允许的请求数，超出返回412")
+    parser.add_argument('--num-danmaku', type=int, default=1000, help="每个视频合成的弹幕数量")
+    parser.add_argument('--num-replies', type=int, default=200, help="每个视频合成的顶层评论数量")
+    parser.add_argument('--fixtures', default=None, help="固定数据目录")
+    parser.add_argument('--cassette', default=None, help="录制的流量目录")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockBilibiliServer(port=args.port, latency=args.latency, num_danmaku=args.num_danmaku,
+                                fixtures_dir=args.fixtures, latency_jitter=args.latency_jitter,
+                                error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                                cassette_dir=args.cassette, seed=args.seed, num_replies=args.num_replies)
+    print(f"模拟Bilibili服务器已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("服务器已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟Redis服务器
+功能：在本机实现Redis协议（RESP2）中多节点任务队列用到的命令子集
+      （字符串、哈希、集合、有序集合以及WATCH/MULTI/EXEC事务），
+      不需要安装Redis即可测试多进程、多节点抓取
+"""
+
+import socketserver
+import threading
+
+from resp_client import RedisError, read_reply
+
+
+def _encode(value):
+    """
+    把命令结果编码为RESP回复
+    """
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, RedisError):
+        return b'-%s\r\n' % str(value).encode('utf-8')
+    if isinstance(value, bool):
+        return b':%d\r\n' % int(value)
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, _Status):
+        return b'+%s\r\n' % value.encode('utf-8')
+    if isinstance(value, (list, tuple)):
+        return b'*%d\r\n' % len(value) + b''.join(_encode(item) for item in value)
+    data = str(value).encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+class _Status(str):
+    """
+    简单字符串回复（如OK、QUEUED）
+    """
+
+
+class _ZSet(dict):
+    """
+    有序集合：成员到分数的映射
+    """
+
+
+OK = _Status('OK')
+QUEUED = _Status('QUEUED')
+_NULL_ARRAY = object()
+
+
+def _format_score(score):
+    return repr(score) if score != int(score) else str(int(score))
+
+
+def _parse_bound(value):
+    """
+    解析ZRANGEBYSCORE/ZCOUNT的分数边界，返回(分数, 是否开区间)
+    """
+    exclusive = value.startswith('(')
+    if exclusive:
+        value = value[1:]
+    return float(value), exclusive
+
+
+def _in_range(score, low, high):
+    (low_value, low_open), (high_value, high_open) = low, high
+    above = score > low_value if low_open else score >= low_value
+    below = score < high_value if high_open else score <= high_value
+    return above and below
+
+
+class MockRedisHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.watched = None
+        self.queued = None
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            name = command[0].upper()
+            args = command[1:]
+            reply = self.dispatch(server, name, args)
+            if reply is _NULL_ARRAY:
+                data = b'*-1\r\n'
+            else:
+                data = _encode(reply)
+            try:
+                self.wfile.write(data)
+            except OSError:
+                return
+
+    def dispatch(self, server, name, args):
+        if name == 'MULTI':
+            self.queued = []
+            return OK
+        if name == 'DISCARD':
+            self.queued = None
+            self.watched = None
+            return OK
+        if name == 'EXEC':
+            return self.exec_transaction(server)
+        if name == 'WATCH':
+            with server.lock:
+                self.watched = self.watched or {}
+                for key in args:
+                    self.watched[key] = server.versions.get(key, 0)
+            return OK
+        if name == 'UNWATCH':
+            self.watched = None
+            return OK
+        if self.queued is not None:
+            self.queued.append((name, args))
+            return QUEUED
+        with server.lock:
+            return server.execute(name, args)
+
+    def exec_transaction(self, server):
+        queued, watched = self.queued, self.watched
+        self.queued = None
+        self.watched = None
+        if queued is None:
+            return RedisError('ERR EXEC without MULTI')
+        with server.lock:
+            # 被WATCH的键在事务提交前被修改时放弃整个事务
+            if watched and any(server.versions.get(key, 0) != version
+                               for key, version in watched.items()):
+                return _NULL_ARRAY
+            return [server.execute(name, args) for name, args in queued]
+
+
+class MockRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        """
+        port为0时由系统分配空闲端口
+        """
+        super().__init__((host, port), MockRedisHandler)
+        self.lock = threading.Lock()
+        self.data = {}
+        self.versions = {}
+        self.command_count = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'redis://{host}:{port}/0'
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key, kind):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise RedisError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def _get_or_create(self, key, kind):
+        value = self._get(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        return value
+
+    def execute(self, name, args):
+        """
+        执行单条命令（调用方持有self.lock）
+        """
+        self.command_count += 1
+        handler = getattr(self, 'cmd_' + name.lower(), None)
+        if handler is None:
+            return RedisError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except RedisError as e:
+            return e
+        except (TypeError, ValueError):
+            return RedisError(f"ERR wrong arguments for '{name}' command")
+
+    # ---- 通用 ----
+    def cmd_ping(self, *args):
+        return args[0] if args else _Status('PONG')
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_auth(self, *args):
+        return OK
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                removed += 1
+                self._touch(key)
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    def cmd_flushdb(self):
+        for key in list(self.data):
+            self._touch(key)
+        self.data.clear()
+        return OK
+
+    # ---- 字符串 ----
+    def cmd_get(self, key):
+        return self._get(key, str)
+
+    def cmd_set(self, key, value):
+        self.data[key] = value
+        self._touch(key)
+        return OK
+
+    def cmd_incr(self, key):
+        value = int(self._get(key, str) or 0) + 1
+        self.data[key] = str(value)
+        self._touch(key)
+        return value
+
+    # ---- 哈希 ----
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ValueError
+        table = self._get_or_create(key, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in table
+            table[field] = value
+        self._touch(key)
+        return added
+
+    def cmd_hsetnx(self, key, field, value):
+        table = self._get_or_create(key, dict)
+        if field in table:
+            return 0
+        table[field] = value
+        self._touch(key)
+        return 1
+
+    def cmd_hget(self, key, field):
+        table = self._get(key, dict)
+        return table.get(field) if table else None
+
+    def cmd_hgetall(self, key):
+        table = self._get(key, dict) or {}
+        return [item for pair in table.items() for item in pair]
+
+    def cmd_hvals(self, key):
+        return list((self._get(key, dict) or {}).values())
+
+    def cmd_hincrby(self, key, field, amount):
+        table = self._get_or_create(key, dict)
+        value = int(table.get(field, 0)) + int(amount)
+        table[field] = str(value)
+        self._touch(key)
+        return value
+
+    # ---- 集合 ----
+    def cmd_sadd(self, key, *members):
+        members_set = self._get_or_create(key, set)
+        added = len(set(members) - members_set)
+        members_set.update(members)
+        self._touch(key)
+        return added
+
+    def cmd_srem(self, key, *members):
+        members_set = self._get(key, set)
+        if not members_set:
+            return 0
+        removed = len(members_set & set(members))
+        members_set.difference_update(members)
+        if not members_set:
+            del self.data[key]
+        self._touch(key)
+        return removed
+
+    def cmd_smembers(self, key):
+        return sorted(self._get(key, set) or ())
+
+    def cmd_scard(self, key):
+        return len(self._get(key, set) or ())
+
+    # ---- 有序集合 ----
+    def cmd_zadd(self, key, *args):
+        args = list(args)
+        only_existing = only_new = False
+        while args and args[0].upper() in ('XX', 'NX', 'CH'):
+            option = args.pop(0).upper()
+            only_existing |= option == 'XX'
+            only_new |= option == 'NX'
+        if not args or len(args) % 2:
+            raise ValueError
+        zset = self._get_or_create(key, _ZSet)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            exists = member in zset
+            if (only_existing and not exists) or (only_new and exists):
+                continue
+            added += not exists
+            zset[member] = float(score)
+        if not zset:
+            del self.data[key]
+        self._touch(key)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        zset = self._get(key, _ZSet)
+        if not zset:
+            return 0
+        removed = sum(1 for member in members if zset.pop(member, None) is not None)
+        if not zset:
+            del self.data[key]
+        self._touch(key)
+        return removed
+
+    def cmd_zscore(self, key, member):
+        zset = self._get(key, _ZSet) or {}
+        return _format_score(zset[member]) if member in zset else None
+
+    def cmd_zcard(self, key):
+        return len(self._get(key, _ZSet) or ())
+
+    def cmd_zcount(self, key, low, high):
+        low, high = _parse_bound(low), _parse_bound(high)
+        return sum(1 for score in (self._get(key, _ZSet) or {}).values() if _in_range(score, low, high))
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        low, high = _parse_bound(low), _parse_bound(high)
+        items = sorted(((score, member) for member, score in (self._get(key, _ZSet) or {}).items()
+                        if _in_range(score, low, high)))
+        members = [member for _, member in items]
+        options = [option.upper() for option in options]
+        if 'LIMIT' in options:
+            index = options.index('LIMIT')
+            offset, count = int(options[index + 1]), int(options[index + 2])
+            members = members[offset:] if count < 0 else members[offset:offset + count]
+        return members
+
+    def start(self):
+        """
+        在后台线程中启动服务器
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """
+    主函数 - 单独启动模拟Redis服务器
+    """
+    server = MockRedisServer(port=6379)
+    print(f"模拟Redis服务器已启动: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("服务器已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
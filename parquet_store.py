@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕Parquet分区存储
+功能：把弹幕按 bvid/cid/抓取日期 分区写入压缩的Parquet文件，列带有固定类型；
+      视频信息每次抓取保存一份快照，写入按 bvid/抓取日期 分区的伴随表。
+      读取时只打开所需视频的分区目录、只解码所需的列，不需要重新解析文本和推断类型。
+      每个文件先写入隐藏的临时文件，完成后再改名，读取方不会看到写了一半的文件
+
+目录结构：
+  {root}/danmaku/bvid={bvid}/cid={cid}/crawl_date={YYYY-MM-DD}/part-*.parquet
+  {root}/video_info/bvid={bvid}/crawl_date={YYYY-MM-DD}/part-*.parquet
+
+需要安装pyarrow
+"""
+
+import datetime
+import glob
+import os
+import time
+import uuid
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:  # pyarrow为可选依赖，只有Parquet存储需要
+    pyarrow = None
+
+from danmaku_batch import DANMAKU_FIELDS
+
+
+# 弹幕文件的列（分区列bvid、cid、crawl_date由目录名给出，不写入文件）
+DANMAKU_PARQUET_FIELDS = DANMAKU_FIELDS + ['page']
+
+# 视频信息快照的列（分区列bvid、crawl_date由目录名给出，不写入文件）
+VIDEO_INFO_PARQUET_FIELDS = ['aid', 'cid', 'title', 'song_name', 'owner', 'pubdate', 'duration',
+                             'view', 'danmaku', 'comment', 'like', 'coin', 'favorite', 'share',
+                             'desc', 'crawled_at']
+
+
+def _schemas():
+    """
+    各表的列类型，导入pyarrow后才能构造
+    """
+    danmaku = pyarrow.schema([
+        ('content', pyarrow.large_string()),
+        ('time', pyarrow.float64()),
+        ('type', pyarrow.int32()),
+        ('fontsize', pyarrow.int32()),
+        ('color', pyarrow.int64()),
+        ('timestamp', pyarrow.int64()),
+        ('pool', pyarrow.int32()),
+        ('uid', pyarrow.large_string()),
+        ('row_id', pyarrow.large_string()),
+        ('page', pyarrow.int32()),
+    ])
+    video_info = pyarrow.schema([
+        ('aid', pyarrow.int64()),
+        ('cid', pyarrow.int64()),
+        ('title', pyarrow.string()),
+        ('song_name', pyarrow.string()),
+        ('owner', pyarrow.string()),
+        ('pubdate', pyarrow.timestamp('s')),
+        ('duration', pyarrow.int32()),
+        ('view', pyarrow.int64()),
+        ('danmaku', pyarrow.int64()),
+        ('comment', pyarrow.int64()),
+        ('like', pyarrow.int64()),
+        ('coin', pyarrow.int64()),
+        ('favorite', pyarrow.int64()),
+        ('share', pyarrow.int64()),
+        ('desc', pyarrow.string()),
+        ('crawled_at', pyarrow.timestamp('s')),
+    ])
+    danmaku_partitioning = pyarrow.dataset.partitioning(pyarrow.schema([
+        ('bvid', pyarrow.string()), ('cid', pyarrow.int64()), ('crawl_date', pyarrow.string())]), flavor='hive')
+    video_info_partitioning = pyarrow.dataset.partitioning(pyarrow.schema([
+        ('bvid', pyarrow.string()), ('crawl_date', pyarrow.string())]), flavor='hive')
+    return danmaku, video_info, danmaku_partitioning, video_info_partitioning
+
+
+def today():
+    return datetime.date.today().isoformat()
+
+
+def _part_name():
+    # 同一分区可以有多个文件（增量抓取追加），文件名按写入时间排序
+    return f'part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet'
+
+
+class ParquetPartitionWriter:
+    """
+    向一个分区写入一个Parquet文件：先写入同目录下的隐藏临时文件，commit时改名为正式文件
+    replace为True时，commit后删除同一bvid/cid在其他抓取日期下的旧文件（全量重写）
+    """
+
+    def __init__(self, directory, schema, compression, replace_root=None):
+        self.directory = directory
+        self.schema = schema
+        self.replace_root = replace_root
+        os.makedirs(directory, exist_ok=True)
+        name = _part_name()
+        self.path = os.path.join(directory, name)
+        # 以.开头的文件不会被pyarrow.dataset读取
+        self.tmp_path = os.path.join(directory, f'.{name}.tmp')
+        self.rows = 0
+        self._writer = pyarrow.parquet.ParquetWriter(self.tmp_path, schema, compression=compression)
+
+    def write(self, batch):
+        """
+        写入一个DanmakuBatch（作为一个行组）
+        """
+        if not batch:
+            return
+        table = batch.to_arrow()
+        if 'page' not in table.column_names:
+            table = table.append_column('page', pyarrow.repeat(1, len(batch)))
+        self.write_table(table)
+
+    def write_table(self, table):
+        """
+        写入一个pyarrow.Table，按本文件的列选择并转换类型
+        """
+        self._writer.write_table(table.select(self.schema.names).cast(self.schema))
+        self.rows += table.num_rows
+
+    def commit(self):
+        """
+        关闭临时文件并改名为正式文件；全量重写时删除旧文件
+        """
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        if self.replace_root is not None:
+            for path in glob.glob(os.path.join(self.replace_root, '*', '*.parquet')):
+                if path != self.path:
+                    os.remove(path)
+            for directory in glob.glob(os.path.join(self.replace_root, '*')):
+                if directory != self.directory and not os.listdir(directory):
+                    os.rmdir(directory)
+        return self.path
+
+    def abort(self):
+        """
+        放弃写入，删除临时文件
+        """
+        self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class ParquetDanmakuStore:
+    def __init__(self, root='danmaku_parquet', compression='zstd'):
+        """
+        root: 存储根目录
+        compression: Parquet压缩算法
+        未安装pyarrow时抛出ImportError
+        """
+        if pyarrow is None:
+            raise ImportError("Parquet存储需要安装pyarrow: pip install pyarrow")
+        self.root = root
+        self.compression = compression
+        self.danmaku_dir = os.path.join(root, 'danmaku')
+        self.video_info_dir = os.path.join(root, 'video_info')
+        (self.danmaku_schema, self.video_info_schema,
+         self.danmaku_partitioning, self.video_info_partitioning) = _schemas()
+
+    def danmaku_partition(self, bvid, cid, crawl_date=None):
+        """
+        某个视频分P在某个抓取日期的分区目录；crawl_date为None时返回该分P所有日期分区的上级目录
+        """
+        directory = os.path.join(self.danmaku_dir, f'bvid={bvid}', f'cid={cid}')
+        return directory if crawl_date is None else os.path.join(directory, f'crawl_date={crawl_date}')
+
+    def has_danmaku(self, bvid, cid):
+        """
+        是否已保存过该分P的弹幕
+        """
+        return bool(glob.glob(os.path.join(self.danmaku_partition(bvid, cid), '*', '*.parquet')))
+
+    def open_danmaku_writer(self, bvid, cid, replace=True, crawl_date=None):
+        """
+        打开一个弹幕文件写入器，写入今天（或crawl_date）的分区
+        replace: 为True时commit后删除该分P之前写入的全部文件，否则作为增量追加
+        """
+        return ParquetPartitionWriter(
+            self.danmaku_partition(bvid, cid, crawl_date or today()), self.danmaku_schema,
+            self.compression, replace_root=self.danmaku_partition(bvid, cid) if replace else None)
+
+    def write_danmaku(self, bvid, cid, batch, replace=True):
+        """
+        把一个DanmakuBatch写入该分P的分区，返回写入条数
+        """
+        writer = self.open_danmaku_writer(bvid, cid, replace=replace)
+        try:
+            writer.write(batch)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+        return writer.rows
+
+    def write_video_info(self, video_info):
+        """
+        保存一份视频信息快照（包含抓取时间），同一视频每次抓取追加一个文件
+        """
+        crawled_at = int(time.time())
+        row = {name: video_info.get(name) for name in VIDEO_INFO_PARQUET_FIELDS}
+        row['crawled_at'] = crawled_at
+        # 时间列先按Unix时间戳（秒）构造，写入时再转换为timestamp类型
+        epoch_schema = pyarrow.schema([
+            pyarrow.field(field.name, pyarrow.int64()) if pyarrow.types.is_timestamp(field.type) else field
+            for field in self.video_info_schema])
+        directory = os.path.join(self.video_info_dir, f"bvid={video_info['bvid']}",
+                                 f"crawl_date={datetime.date.fromtimestamp(crawled_at).isoformat()}")
+        writer = ParquetPartitionWriter(directory, self.video_info_schema, self.compression)
+        try:
+            writer.write_table(pyarrow.Table.from_pylist([row], schema=epoch_schema))
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def _files(self, base_dir, levels):
+        """
+        按分区目录通配出Parquet文件；levels为各级分区 (列名, 取值列表或None) 列表，
+        None表示该级的所有分区。只列出所需分区的目录，不遍历整个存储
+        """
+        patterns = [base_dir]
+        for name, values in levels:
+            if values is None:
+                patterns = [os.path.join(pattern, f'{name}=*') for pattern in patterns]
+            else:
+                patterns = [os.path.join(pattern, f'{name}={value}') for pattern in patterns for value in values]
+        files = []
+        for pattern in patterns:
+            files.extend(glob.glob(os.path.join(pattern, '*.parquet')))
+        return sorted(files)
+
+    def _read(self, files, base_dir, partitioning, schema, columns, filter_expression):
+        if not files:
+            import pandas as pd
+            return pd.DataFrame(columns=columns or schema.names + partitioning.schema.names)
+        dataset = pyarrow.dataset.dataset(files, schema=pyarrow.unify_schemas([schema, partitioning.schema]),
+                                          format='parquet', partitioning=partitioning,
+                                          partition_base_dir=base_dir)
+        return dataset.to_table(columns=columns, filter=filter_expression).to_pandas()
+
+    def read_danmaku(self, columns=None, bvids=None, cids=None, since=None, until=None):
+        """
+        读取弹幕为pandas DataFrame
+        columns: 需要的列（可包含分区列bvid、cid、crawl_date），None表示全部
+        bvids / cids: 只读取这些视频 / 分P的分区
+        since / until: 只读取该抓取日期范围内（'YYYY-MM-DD'，含两端）的分区
+        """
+        files = self._files(self.danmaku_dir, [
+            ('bvid', bvids), ('cid', cids), ('crawl_date', None)])
+        field = pyarrow.dataset.field
+        expression = None
+        if since is not None:
+            expression = field('crawl_date') >= since
+        if until is not None:
+            expression = (field('crawl_date') <= until) if expression is None else expression & (field('crawl_date') <= until)
+        return self._read(files, self.danmaku_dir, self.danmaku_partitioning, self.danmaku_schema,
+                          columns, expression)
+
+    def read_video_info(self, columns=None, bvids=None, latest=True):
+        """
+        读取视频信息快照为pandas DataFrame
+        columns: 需要的列（可包含分区列bvid、crawl_date），None表示全部
+        bvids: 只读取这些视频的分区
+        latest: 为True时每个视频只保留最近一次抓取的快照
+        """
+        files = self._files(self.video_info_dir, [('bvid', bvids), ('crawl_date', None)])
+        read_columns = columns
+        if latest and columns is not None:
+            read_columns = list(dict.fromkeys(list(columns) + ['bvid', 'crawled_at']))
+        df = self._read(files, self.video_info_dir, self.video_info_partitioning, self.video_info_schema,
+                        read_columns, None)
+        if latest and not df.empty:
+            df = df.sort_values('crawled_at', kind='stable').drop_duplicates('bvid', keep='last')
+            df = df.sort_values('bvid', kind='stable').reset_index(drop=True)
+        return df[columns] if columns is not None else df
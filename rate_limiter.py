@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫自适应限速器
+功能：为不同接口分别维护令牌桶，并根据响应结果按AIMD（加性增、乘性减）
+      策略自动调整请求速率：正常响应时缓慢提速，遇到412/-412等限流信号时速率减半；
+      另外可按域名限制同时进行的HTTP请求数
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# 各接口的默认速率预算（请求/秒）
+DEFAULT_BUDGETS = {
+    'view': {'rate': 4.0, 'min_rate': 0.5, 'max_rate': 20.0},         # x/web-interface/view
+    'comment_xml': {'rate': 8.0, 'min_rate': 1.0, 'max_rate': 40.0},  # comment.bilibili.com/*.xml
+    'dm_history': {'rate': 2.0, 'min_rate': 0.2, 'max_rate': 10.0},   # x/v2/dm/history
+    'dm_segment': {'rate': 8.0, 'min_rate': 1.0, 'max_rate': 40.0},   # x/v2/dm/web/seg.so
+    'reply': {'rate': 4.0, 'min_rate': 0.5, 'max_rate': 20.0},        # x/v2/reply
+    'default': {'rate': 4.0, 'min_rate': 0.5, 'max_rate': 20.0},      # 其他接口
+}
+
+# 表示被限流的HTTP状态码和B站接口返回码
+THROTTLE_STATUS_CODES = {412, 429}
+THROTTLE_API_CODES = {-412, -509}
+
+
+def classify_endpoint(url):
+    """
+    根据URL路径判断请求属于哪个速率预算
+    只看路径不看域名，便于指向本地模拟服务器时复用同一套预算
+    """
+    path = urlparse(url).path
+    if path.startswith('/x/web-interface/view'):
+        return 'view'
+    if path.startswith('/x/v2/dm/history'):
+        return 'dm_history'
+    if path.startswith('/x/v2/dm/web/seg.so'):
+        return 'dm_segment'
+    if path.startswith('/x/v2/reply'):
+        return 'reply'
+    if path.endswith('.xml'):
+        return 'comment_xml'
+    return 'default'
+
+
+class TokenBucket:
+    def __init__(self, rate, min_rate, max_rate, increase_step=0.25,
+                 decrease_factor=0.5, cooldown=1.0):
+        """
+        rate: 初始速率（请求/秒），桶容量为1秒的令牌量
+        increase_step: 每次正常响应后增加的速率
+        decrease_factor: 遇到限流时速率乘以的系数
+        cooldown: 两次降速之间的最小间隔（秒），避免同一波并发请求重复降速
+        """
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.throttle_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def reserve(self):
+        """
+        预订一个令牌，返回需要等待的秒数（令牌可以透支，由等待时间偿还）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1.0
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """
+        阻塞直到获得一个令牌
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        """
+        加性增：正常响应后缓慢提高速率
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self):
+        """
+        乘性减：被限流后速率减半，并清空已积攒的令牌
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttle_count += 1
+            if now - self.last_decrease < self.cooldown:
+                return
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+            self.last_decrease = now
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, budgets=None):
+        """
+        budgets: 覆盖默认预算的字典，例如 {'view': {'rate': 2.0, 'max_rate': 10.0}}
+        """
+        merged = {name: dict(budget) for name, budget in DEFAULT_BUDGETS.items()}
+        for name, budget in (budgets or {}).items():
+            merged.setdefault(name, dict(DEFAULT_BUDGETS['default'])).update(budget)
+        self.buckets = {name: TokenBucket(**budget) for name, budget in merged.items()}
+
+    def bucket_for(self, url):
+        return self.buckets.get(classify_endpoint(url), self.buckets['default'])
+
+    def acquire(self, url):
+        """
+        请求发出前调用，按接口预算等待令牌
+        """
+        self.bucket_for(url).acquire()
+
+    def feedback(self, url, status_code, api_code=None):
+        """
+        请求完成后调用，根据HTTP状态码和接口返回码调整该接口的速率
+        5xx等服务端错误既不提速也不降速
+        """
+        bucket = self.bucket_for(url)
+        if status_code in THROTTLE_STATUS_CODES or api_code in THROTTLE_API_CODES:
+            bucket.on_throttle()
+        elif 200 <= status_code < 400:
+            bucket.on_success()
+
+    def describe(self):
+        """
+        返回各接口当前速率的简要描述
+        """
+        return ', '.join(f"{name}: {bucket.rate:.2f}/s (限流{bucket.throttle_count}次)"
+                         for name, bucket in self.buckets.items())
+
+
+class HostConcurrencyLimiter:
+    def __init__(self, limit):
+        """
+        limit: 每个域名同时进行的HTTP请求数上限
+        """
+        self.limit = max(1, int(limit))
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """
+        占用URL所在域名的一个请求名额，名额用完时阻塞等待
+        返回释放名额的函数（重复调用只释放一次）
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+        semaphore.acquire()
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                semaphore.release()
+        return release
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili视频评论抓取
+功能：按游标从新到旧翻页抓取视频的顶层评论，楼中楼回复较多的评论另行按页抓取，
+      多条评论的楼中楼并发抓取（共用爬虫的限速器和会话池）；抓到的评论边抓取边写入CSV，
+      内存中只保留正在进行的几页，十万条以上评论的视频也能以固定内存抓取。
+      增量抓取时按最新顶层评论的水位线只抓取新评论
+
+用法：
+  python reply_crawler.py urls.txt --workers 4
+  python reply_crawler.py urls.txt --incremental
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from bilibili_crawler import BilibiliCrawler
+from http_resilience import RequestFailedError
+from watermarks import WatermarkStore
+
+
+# 评论CSV的列
+REPLY_CSV_FIELDS = ['rpid', 'oid', 'root', 'parent', 'mid', 'uname', 'ctime', 'like', 'rcount', 'message']
+
+
+def parse_reply(reply):
+    """
+    把评论接口返回的一条评论转换为扁平的记录
+    """
+    return {
+        'rpid': reply['rpid'],
+        'oid': reply['oid'],
+        'root': reply.get('root', 0),
+        'parent': reply.get('parent', 0),
+        'mid': reply.get('mid'),
+        'uname': (reply.get('member') or {}).get('uname', ''),
+        'ctime': reply['ctime'],
+        'like': reply.get('like', 0),
+        'rcount': reply.get('rcount', 0),
+        'message': (reply.get('content') or {}).get('message', ''),
+    }
+
+
+def reply_order_key(record):
+    """
+    评论的先后顺序：先比较发送时间，同一秒内再比较rpid
+    """
+    return int(record['ctime']), int(record['rpid'])
+
+
+class ReplyCrawler:
+    def __init__(self, crawler, max_workers=4, page_size=20, watermarks=None):
+        """
+        crawler: BilibiliCrawler实例，所有请求经过其限速器、熔断器和会话池
+        max_workers: 同时抓取的楼中楼数量
+        page_size: 每页评论数量（接口上限为20）
+        watermarks: 增量抓取水位线（WatermarkStore，按aid记录），为None时每次全量抓取
+        """
+        self.crawler = crawler
+        self.max_workers = max(1, int(max_workers))
+        self.page_size = page_size
+        self.watermarks = watermarks
+
+    def reply_main_url(self, aid, cursor):
+        """
+        顶层评论按时间倒序（mode=2）的翻页地址，cursor为上一页返回的游标
+        """
+        return (f'{self.crawler.api_base}/x/v2/reply/main?type=1&oid={aid}&mode=2'
+                f'&next={cursor}&ps={self.page_size}')
+
+    def reply_thread_url(self, aid, root, page):
+        """
+        某条评论的楼中楼回复的翻页地址，page从1开始
+        """
+        return (f'{self.crawler.api_base}/x/v2/reply/reply?type=1&oid={aid}&root={root}'
+                f'&pn={page}&ps={self.page_size}')
+
+    def _get(self, url):
+        data = self.crawler._request(url, parse_json=True)
+        if data['code'] != 0:
+            raise RequestFailedError(url, 'reply', f"评论接口响应异常: {data.get('message')}", retryable=False)
+        return data.get('data') or {}
+
+    def fetch_main_page(self, aid, cursor):
+        """
+        抓取一页顶层评论，返回(评论列表, 下一页游标, 是否最后一页)
+        评论列表中的每一项为 (记录, 楼中楼预览记录列表)
+        请求失败时抛出RequestFailedError
+        """
+        data = self._get(self.reply_main_url(aid, cursor))
+        replies = data.get('replies') or []
+        page = [(parse_reply(reply), [parse_reply(sub) for sub in reply.get('replies') or []])
+                for reply in replies]
+        page_cursor = data.get('cursor') or {}
+        return page, page_cursor.get('next', cursor), bool(page_cursor.get('is_end')) or not replies
+
+    def fetch_thread(self, aid, root):
+        """
+        抓取一条评论的全部楼中楼回复
+        请求失败时抛出RequestFailedError
+        """
+        records = []
+        page = 1
+        while True:
+            data = self._get(self.reply_thread_url(aid, root, page))
+            replies = data.get('replies') or []
+            records.extend(parse_reply(reply) for reply in replies)
+            count = (data.get('page') or {}).get('count', 0)
+            if not replies or page * self.page_size >= count:
+                return records
+            page += 1
+
+    def iter_replies(self, aid, watermark=None):
+        """
+        从新到旧抓取视频的评论，按完成顺序产出记录列表（一页顶层评论或一条评论的楼中楼）
+        watermark: 只抓取该水位线之后发表的顶层评论及其楼中楼
+        楼中楼预览已包含全部回复时直接使用预览，否则交给线程池抓取；
+        进行中的楼中楼不超过max_workers的两倍，超出时先等待已提交的楼中楼完成再翻下一页
+        返回值通过StopIteration传出：本次抓取中最新的顶层评论的先后顺序键和失败次数
+        """
+        crawler = self.crawler
+        mark = (watermark['timestamp'], watermark['row_id']) if watermark else None
+        newest_key = None
+        oldest_key = None
+        failures = 0
+        pending = {}
+        cursor = 0
+        is_end = False
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def drain(block_until):
+                nonlocal failures
+                while len(pending) > block_until:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        root = pending.pop(future)
+                        try:
+                            yield future.result()
+                        except RequestFailedError as e:
+                            crawler.record_failure(f'{aid}#{root}', 'reply', e)
+                            failures += 1
+
+            while not is_end:
+                yield from drain(self.max_workers * 2 - 1)
+                try:
+                    page, cursor, is_end = self.fetch_main_page(aid, cursor)
+                except RequestFailedError as e:
+                    crawler.record_failure(aid, 'reply', e)
+                    failures += 1
+                    break
+
+                records = []
+                for record, preview in page:
+                    key = reply_order_key(record)
+                    if mark is not None and key <= mark:
+                        # 按时间倒序翻页，之后的评论都已抓取过
+                        is_end = True
+                        break
+                    # 翻页过程中出现新评论会让后面的页面整体后移，跳过重复的评论
+                    if oldest_key is not None and key >= oldest_key:
+                        continue
+                    oldest_key = key
+                    if newest_key is None:
+                        newest_key = key
+                    records.append(record)
+                    if len(preview) >= record['rcount']:
+                        records.extend(preview)
+                    else:
+                        pending[executor.submit(self.fetch_thread, aid, record['rpid'])] = record['rpid']
+                if records:
+                    yield records
+            yield from drain(0)
+        return newest_key, failures
+
+    def crawl_replies(self, aid, filename):
+        """
+        抓取视频的评论并边抓取边写入CSV
+        增量抓取时（有水位线且文件存在）只把新评论追加到filename，否则全量写入；
+        全部请求成功时才推进水位线，有失败时下次仍从原水位线开始，
+        增量抓取有失败时本次结果不写入filename，避免重复追加
+        返回本次写入的评论条数（含楼中楼）
+        """
+        watermark = None
+        if self.watermarks is not None and os.path.exists(filename):
+            watermark = self.watermarks.get(aid)
+        part_path = f'{filename}.part'
+        written = 0
+        replies = self.iter_replies(aid, watermark)
+        with open(part_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=REPLY_CSV_FIELDS, extrasaction='ignore')
+            if watermark is None:
+                writer.writeheader()
+            while True:
+                try:
+                    records = next(replies)
+                except StopIteration as stop:
+                    newest_key, failures = stop.value
+                    break
+                writer.writerows(records)
+                written += len(records)
+
+        if watermark is None:
+            os.replace(part_path, filename)
+            if self.watermarks is not None:
+                self.watermarks.reset(aid)
+        elif failures:
+            os.remove(part_path)
+            return 0
+        else:
+            with open(filename, 'a', newline='', encoding='utf-8') as dst, \
+                    open(part_path, 'r', newline='', encoding='utf-8') as src:
+                for line in src:
+                    dst.write(line)
+            os.remove(part_path)
+        if self.watermarks is not None and not failures and newest_key is not None:
+            self.watermarks.advance_to(aid, newest_key, written)
+        return written
+
+    def crawl_video_replies(self, url_or_bvid):
+        """
+        抓取视频的评论，保存为 {标题}_replies.csv，返回是否成功
+        """
+        crawler = self.crawler
+        video_info = crawler.get_video_info(url_or_bvid)
+        if not video_info:
+            print(f"无法获取视频信息: {url_or_bvid}")
+            return False
+        filename = f"{crawler.make_safe_title(video_info)}_replies.csv"
+        failures_before = len(crawler.failures)
+        count = self.crawl_replies(video_info['aid'], filename)
+        ok = len(crawler.failures) == failures_before
+        print(f"{video_info['title']}: 写入 {count} 条评论至 {filename}" + ("" if ok else "（部分失败）"))
+        return ok
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili视频评论抓取")
+    parser.add_argument('urls_file', nargs='?', default='urls.txt')
+    parser.add_argument('--workers', type=int, default=4, help="同时抓取的楼中楼数量")
+    parser.add_argument('--incremental', action='store_true', help="按水位线只抓取新评论")
+    parser.add_argument('--watermarks', default='reply_watermarks.json', help="评论水位线文件")
+    parser.add_argument('--cookies', default=None, help="登录cookies字符串")
+    parser.add_argument('--api-base', default='https://api.bilibili.com')
+    args = parser.parse_args()
+
+    crawler = BilibiliCrawler(api_base=args.api_base)
+    if args.cookies:
+        crawler.set_cookies(args.cookies)
+    crawler.load_song_names(args.urls_file)
+    urls = crawler.read_urls_file(args.urls_file)
+    if urls is None:
+        return
+    watermarks = WatermarkStore(args.watermarks) if args.incremental else None
+    reply_crawler = ReplyCrawler(crawler, max_workers=args.workers, watermarks=watermarks)
+    success = sum(1 for url in urls if reply_crawler.crawl_video_replies(url))
+    print(f"\n共处理 {len(urls)} 个视频，成功 {success} 个")
+    crawler.print_failure_summary()
+    crawler.save_failures()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+精简的Redis协议（RESP2）客户端
+功能：只依赖标准库，通过TCP发送命令并解析回复，供多节点任务队列使用；
+      可以连接真实的Redis服务器，也可以连接本地的mock_redis_server
+"""
+
+import socket
+import threading
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    """
+    服务器返回的错误回复（以'-'开头）
+    """
+
+
+class RedisClient:
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, timeout=10):
+        """
+        host/port: 服务器地址
+        db: 数据库编号
+        password: 密码，None表示不需要认证
+        timeout: 套接字超时（秒）
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        # 同一连接上的命令必须串行执行，事务（WATCH/MULTI/EXEC）期间由调用方持有此锁
+        self.lock = threading.RLock()
+        self._sock = None
+        self._reader = None
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """
+        从 redis://[:password@]host:port/db 形式的URL创建客户端
+        """
+        parsed = urlparse(url)
+        db = parsed.path.lstrip('/')
+        return cls(host=parsed.hostname or '127.0.0.1', port=parsed.port or 6379,
+                   db=int(db) if db else 0, password=parsed.password, **kwargs)
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def close(self):
+        with self.lock:
+            if self._sock is not None:
+                self._reader.close()
+                self._sock.close()
+                self._sock = None
+                self._reader = None
+
+    def execute(self, *args):
+        """
+        执行一条命令并返回回复：
+        简单字符串和批量字符串返回str，整数返回int，数组返回list，空回复返回None
+        服务器返回错误时抛出RedisError，连接中断时抛出OSError
+        """
+        with self.lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                return self._call(*args)
+            except OSError:
+                # 连接已不可用，下次调用时重新连接
+                self.close()
+                raise
+
+    def _call(self, *args):
+        self._sock.sendall(encode_command(args))
+        reply = read_reply(self._reader)
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+
+def encode_command(args):
+    """
+    把命令编码为RESP数组
+    """
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, float):
+            data = repr(arg).encode('ascii')
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def read_reply(reader):
+    """
+    从文件对象中读取一个RESP回复；错误回复以RedisError对象返回（不抛出），
+    便于EXEC结果中单条命令的错误与其他结果一起返回
+    """
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("Redis连接已关闭")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b'+':
+        return payload.decode('utf-8')
+    if prefix == b'-':
+        return RedisError(payload.decode('utf-8'))
+    if prefix == b':':
+        return int(payload)
+    if prefix == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Redis连接已关闭")
+        return data[:-2].decode('utf-8')
+    if prefix == b'*':
+        count = int(payload)
+        if count < 0:
+            return None
+        return [read_reply(reader) for _ in range(count)]
+    raise RedisError(f"无法解析的回复: {line!r}")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫磁盘响应缓存
+功能：以requests传输适配器的形式挂载到session上，按URL（含查询参数）把响应体缓存到磁盘；
+      缓存未过期时直接返回，过期后携带If-None-Match/If-Modified-Since做条件请求，
+      服务器返回304时继续使用缓存。各接口的缓存有效期可以分别配置；
+      返回码不为0的JSON响应（限流、错误、未登录）不缓存，需要登录的接口按登录身份分别缓存
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from rate_limiter import classify_endpoint
+from session_pool import parse_cookies
+
+
+# 各接口的缓存有效期（秒），0表示不缓存
+DEFAULT_CACHE_TTLS = {
+    'view': 600,              # 视频信息中的统计数据变化较快
+    'comment_xml': 3600,
+    'dm_segment': 3600,
+    'dm_history': 86400,      # 过去日期的历史弹幕基本不会变化
+    'reply': 0,               # 评论翻页游标和增量抓取依赖最新数据，不缓存
+    'default': 0,
+}
+
+# 需要登录的接口：不同身份的响应不同，缓存键中加入会话的登录身份
+IDENTITY_ENDPOINTS = {'dm_history'}
+
+# 缓存响应时不保存的响应头：缓存的是解压后的响应体
+_DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def cache_key(request):
+    """
+    返回请求的缓存键：一般为URL；需要登录的接口在URL后加上由登录cookie得到的身份标识
+    （以URL片段的形式附加，不影响按路径判断接口类型）
+    """
+    url = request.url
+    if classify_endpoint(url) not in IDENTITY_ENDPOINTS:
+        return url
+    cookies = parse_cookies(request.headers.get('Cookie', ''))
+    identity = cookies.get('SESSDATA') or request.headers.get('Cookie', '')
+    digest = hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16] if identity else 'anonymous'
+    return f"{url}#session={digest}"
+
+
+def is_cacheable_body(body_path):
+    """
+    判断响应体能否缓存：JSON响应只有返回码为0时缓存，非JSON响应（XML、protobuf）完整读完即可缓存
+    """
+    with open(body_path, 'rb') as f:
+        head = f.read(64).lstrip()
+        if not head.startswith(b'{'):
+            return True
+        f.seek(0)
+        try:
+            data = json.load(f)
+        except ValueError:
+            return False
+    return isinstance(data, dict) and data.get('code') == 0
+
+
+class ResponseCache:
+    def __init__(self, cache_dir='.http_cache', ttls=None):
+        """
+        cache_dir: 缓存目录
+        ttls: 覆盖默认有效期的字典，例如 {'view': 60}
+        """
+        self.cache_dir = cache_dir
+        self.ttls = dict(DEFAULT_CACHE_TTLS)
+        self.ttls.update(ttls or {})
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def ttl_for(self, url):
+        return self.ttls.get(classify_endpoint(url), self.ttls['default'])
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        directory = os.path.join(self.cache_dir, key[:2])
+        return directory, os.path.join(directory, key + '.body'), os.path.join(directory, key + '.json')
+
+    def lookup(self, url):
+        """
+        返回缓存的元数据（不存在或已损坏时返回None）
+        """
+        _, body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(body_path):
+            return None
+        meta['body_path'] = body_path
+        return meta
+
+    def is_fresh(self, url, meta=None):
+        """
+        判断URL的缓存是否仍在有效期内
+        """
+        ttl = self.ttl_for(url)
+        if ttl <= 0:
+            return False
+        meta = meta if meta is not None else self.lookup(url)
+        return meta is not None and time.time() - meta['stored_at'] < ttl
+
+    def open_body_writer(self, url):
+        """
+        创建写入响应体的临时文件，写完后通过commit原子替换
+        """
+        directory, _, _ = self._paths(url)
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False)
+
+    def commit(self, url, tmp_file, status_code, headers):
+        """
+        把写完的临时文件和元数据写入缓存；返回码不为0的JSON响应直接丢弃
+        """
+        directory, body_path, meta_path = self._paths(url)
+        tmp_file.close()
+        if not is_cacheable_body(tmp_file.name):
+            os.remove(tmp_file.name)
+            return
+        os.replace(tmp_file.name, body_path)
+        meta = {
+            'url': url,
+            'status_code': status_code,
+            'headers': {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS},
+            'stored_at': time.time(),
+        }
+        self._write_meta(meta_path, meta)
+
+    def touch(self, url, meta):
+        """
+        条件请求返回304后刷新缓存时间
+        """
+        _, _, meta_path = self._paths(url)
+        meta = {k: v for k, v in meta.items() if k != 'body_path'}
+        meta['stored_at'] = time.time()
+        self._write_meta(meta_path, meta)
+
+    def _write_meta(self, meta_path, meta):
+        tmp_path = f'{meta_path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def describe(self):
+        return f"命中 {self.hits} 次, 304重新验证 {self.revalidated} 次, 未命中 {self.misses} 次"
+
+
+class _CachingRawResponse:
+    """
+    包装urllib3响应：调用方读取响应体的同时写入缓存临时文件，
+    完整读完后才提交缓存；中途关闭（如达到弹幕上限）则丢弃
+    """
+
+    def __init__(self, raw, cache, url, status_code, headers):
+        self._raw = raw
+        self._cache = cache
+        self._url = url
+        self._status_code = status_code
+        self._headers = headers
+        self._file = cache.open_body_writer(url)
+        self._done = False
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=True):
+            self._file.write(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = self._raw.read(amt, decode_content=True)
+        self._file.write(data)
+        if amt is None or not data:
+            self._finish()
+        return data
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._cache.commit(self._url, self._file, self._status_code, self._headers)
+
+    def _abort(self):
+        if not self._done:
+            self._done = True
+            self._file.close()
+            try:
+                os.remove(self._file.name)
+            except OSError:
+                pass
+
+    def close(self):
+        self._abort()
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class CachingHTTPAdapter(HTTPAdapter):
+    def __init__(self, cache, **kwargs):
+        """
+        cache: ResponseCache实例；其余参数传给HTTPAdapter（如pool_maxsize）
+        """
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def _cached_response(self, request, meta):
+        """
+        用缓存内容构造Response
+        """
+        response = Response()
+        response.status_code = meta['status_code']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.headers['X-Cache'] = 'HIT'
+        response.encoding = get_encoding_from_headers(response.headers)
+        with open(meta['body_path'], 'rb') as f:
+            response.raw = io.BytesIO(f.read())
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET' or self.cache.ttl_for(request.url) <= 0:
+            return super().send(request, stream=stream, **kwargs)
+        url = cache_key(request)
+
+        meta = self.cache.lookup(url)
+        if meta is not None and self.cache.is_fresh(url, meta):
+            self.cache.record('hits')
+            return self._cached_response(request, meta)
+
+        # 缓存过期：携带验证信息发送条件请求
+        if meta is not None:
+            headers = {k.lower(): v for k, v in meta['headers'].items()}
+            if 'etag' in headers:
+                request.headers['If-None-Match'] = headers['etag']
+            if 'last-modified' in headers:
+                request.headers['If-Modified-Since'] = headers['last-modified']
+
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and meta is not None:
+            response.close()
+            self.cache.touch(url, meta)
+            self.cache.record('revalidated')
+            return self._cached_response(request, meta)
+
+        self.cache.record('misses')
+        if response.status_code == 200:
+            response.raw = _CachingRawResponse(response.raw, self.cache, url,
+                                               response.status_code, response.headers)
+            # 缓存中保存的是解压后的内容
+            response.headers.pop('Content-Encoding', None)
+        return response
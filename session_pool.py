@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫会话池
+功能：持有多个requests.Session，每个会话有自己的cookies（登录身份）、连接池和可选代理，
+      按成功率和响应延迟为每个会话打分，请求总是交给当前最健康的会话；
+      某个身份被限流时暂时冷却，其余会话继续工作，不会拖慢整个批量任务
+"""
+
+import threading
+import time
+
+
+def parse_cookies(cookies_str):
+    """
+    把浏览器中复制的cookies字符串解析为字典
+    """
+    cookies = {}
+    for item in cookies_str.split(';'):
+        item = item.strip()
+        if '=' in item:
+            key, value = item.split('=', 1)
+            cookies[key] = value
+    return cookies
+
+
+class PooledSession:
+    # 成功率和延迟的指数滑动平均系数
+    SMOOTHING = 0.2
+
+    def __init__(self, session, name, rate_limiter=None):
+        """
+        session: requests.Session实例
+        name: 会话名称，用于输出统计
+        rate_limiter: 该身份专用的限速器，为None时使用爬虫共享的限速器
+        """
+        self.session = session
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.logged_in = False
+        self.success_rate = 1.0
+        self.latency = 0.5
+        self.in_flight = 0
+        self.requests = 0
+        self.throttles = 0
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+
+    def score(self):
+        """
+        健康分：成功率越高、延迟越低、正在进行的请求越少，分数越高
+        """
+        return self.success_rate / (self.latency + 0.05) / (1 + self.in_flight)
+
+    def describe(self):
+        login = "已登录" if self.logged_in else "未登录"
+        return (f"{self.name}（{login}）: 请求 {self.requests} 次, 成功率 {self.success_rate:.0%}, "
+                f"延迟 {self.latency * 1000:.0f}ms, 被限流 {self.throttles} 次")
+
+
+class SessionPool:
+    def __init__(self, session_factory, max_cooldown=60.0):
+        """
+        session_factory: 创建新requests.Session的函数（负责设置请求头、挂载缓存等）
+        max_cooldown: 会话被限流后的最长冷却时间（秒）
+        """
+        self.session_factory = session_factory
+        self.max_cooldown = max_cooldown
+        self.sessions = []
+        self._lock = threading.Lock()
+
+    def add(self, cookies_str=None, proxy=None, rate_limiter=None, name=None):
+        """
+        添加一个会话
+        cookies_str: 该会话的登录cookies
+        proxy: 代理地址，如 http://127.0.0.1:7890
+        rate_limiter: 该身份专用的限速器
+        """
+        session = self.session_factory()
+        if proxy:
+            session.proxies.update({'http': proxy, 'https': proxy})
+        pooled = PooledSession(session, name or f'session-{len(self.sessions) + 1}', rate_limiter)
+        if cookies_str:
+            self.set_cookies(pooled, cookies_str)
+        with self._lock:
+            self.sessions.append(pooled)
+        return pooled
+
+    def set_cookies(self, pooled, cookies_str):
+        pooled.session.cookies.update(parse_cookies(cookies_str))
+        pooled.logged_in = True
+
+    @property
+    def logged_in(self):
+        return any(pooled.logged_in for pooled in self.sessions)
+
+    def acquire(self, require_login=False):
+        """
+        选出当前最健康的会话并占用；require_login为True时优先选择已登录的会话
+        所有会话都在冷却时选择最早结束冷却的会话
+        """
+        with self._lock:
+            candidates = self.sessions
+            if require_login:
+                candidates = [pooled for pooled in candidates if pooled.logged_in] or candidates
+            now = time.monotonic()
+            ready = [pooled for pooled in candidates if pooled.cooldown_until <= now]
+            if ready:
+                pooled = max(ready, key=PooledSession.score)
+            else:
+                pooled = min(candidates, key=lambda item: item.cooldown_until)
+            pooled.in_flight += 1
+            pooled.requests += 1
+            return pooled
+
+    def release(self, pooled, latency, ok, throttled=False):
+        """
+        请求结束后调用，更新会话的健康分
+        latency: 本次请求耗时（秒）
+        ok: 请求是否成功
+        throttled: 是否被限流，被限流的会话进入冷却，连续限流时冷却时间加倍
+        """
+        with self._lock:
+            pooled.in_flight -= 1
+            smoothing = PooledSession.SMOOTHING
+            pooled.success_rate += smoothing * ((1.0 if ok else 0.0) - pooled.success_rate)
+            if ok:
+                pooled.latency += smoothing * (latency - pooled.latency)
+                pooled.consecutive_throttles = 0
+            if throttled:
+                pooled.throttles += 1
+                pooled.consecutive_throttles += 1
+                cooldown = min(self.max_cooldown, 2.0 ** pooled.consecutive_throttles)
+                pooled.cooldown_until = time.monotonic() + cooldown
+
+    def describe(self):
+        with self._lock:
+            return [pooled.describe() for pooled in self.sessions]
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕SQLite存储
+功能：把所有视频的弹幕写入同一个SQLite数据库，每批弹幕在一个事务中用executemany批量插入；
+      弹幕ID有唯一约束，重复抓取的弹幕自动忽略（没有弹幕ID的历史弹幕按内容生成去重键）；(bvid, 出现时间) 和 发送时间戳 上有索引，
+      跨视频的统计（如某首歌每分钟的弹幕数）直接用索引查询，不需要把全部弹幕加载到内存
+
+用法：
+  python sqlite_store.py per-minute --song 歌曲名称
+  python sqlite_store.py per-day --since 2025-01-01
+  python sqlite_store.py import                 # 把数据目录库中登记的CSV弹幕导入SQLite存储
+"""
+
+import argparse
+import csv
+import datetime
+import hashlib
+import sqlite3
+import threading
+import time
+
+from danmaku_batch import DANMAKU_FIELDS
+from parquet_store import VIDEO_INFO_PARQUET_FIELDS
+
+
+# 默认数据库路径
+DEFAULT_SQLITE_PATH = 'danmaku.db'
+
+# 弹幕表的列（弹幕字段加上所属视频、cid和分P）
+DANMAKU_SQLITE_FIELDS = ['bvid', 'cid', 'page'] + DANMAKU_FIELDS
+
+# 视频信息表的列，与Parquet视频信息快照一致
+VIDEO_INFO_SQLITE_FIELDS = ['bvid'] + VIDEO_INFO_PARQUET_FIELDS
+
+# row_id列在弹幕表中的位置
+_ROW_ID_INDEX = DANMAKU_SQLITE_FIELDS.index('row_id')
+_CONTENT_KEY_FIELDS = [DANMAKU_SQLITE_FIELDS.index(name) for name in ('cid', 'time', 'timestamp', 'uid', 'content')]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    bvid TEXT PRIMARY KEY,
+    aid INTEGER,
+    cid INTEGER,
+    title TEXT,
+    song_name TEXT,
+    owner TEXT,
+    pubdate INTEGER,
+    duration INTEGER,
+    view INTEGER,
+    danmaku INTEGER,
+    comment INTEGER,
+    like INTEGER,
+    coin INTEGER,
+    favorite INTEGER,
+    share INTEGER,
+    desc TEXT,
+    crawled_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_song_name ON videos (song_name);
+CREATE TABLE IF NOT EXISTS danmaku (
+    id INTEGER PRIMARY KEY,
+    bvid TEXT NOT NULL,
+    cid INTEGER NOT NULL,
+    page INTEGER,
+    content TEXT,
+    time REAL NOT NULL,
+    type INTEGER,
+    fontsize INTEGER,
+    color INTEGER,
+    timestamp INTEGER NOT NULL,
+    pool INTEGER,
+    uid TEXT,
+    row_id TEXT,
+    UNIQUE (row_id)
+);
+CREATE INDEX IF NOT EXISTS idx_danmaku_bvid_time ON danmaku (bvid, time);
+CREATE INDEX IF NOT EXISTS idx_danmaku_timestamp ON danmaku (timestamp);
+"""
+
+# 批量写入的连接参数：WAL模式下读取不阻塞写入；synchronous=NORMAL在WAL模式下
+# 掉电最多丢失最后几个事务，不会损坏数据库；临时B树放在内存，加大页缓存和内存映射
+_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA wal_autocheckpoint=4096',
+]
+
+
+def content_row_id(row):
+    """
+    没有弹幕ID（部分历史弹幕的id_str为空）的行按 cid、出现时间、发送时间、发送者和内容生成去重键，
+    重复抓取同一条弹幕得到相同的键；以 '~' 开头，与真实弹幕ID（纯数字）区分
+    """
+    key = '\x1f'.join(str(row[index]) for index in _CONTENT_KEY_FIELDS)
+    return '~' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _with_row_ids(rows):
+    for row in rows:
+        if not row[_ROW_ID_INDEX]:
+            row = tuple(row)
+            row = row[:_ROW_ID_INDEX] + (content_row_id(row),) + row[_ROW_ID_INDEX + 1:]
+        yield row
+
+
+class SQLiteDanmakuStore:
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        """
+        path: 数据库路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        for pragma in _PRAGMAS:
+            self._conn.execute(pragma)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.execute('PRAGMA optimize')
+            self._conn.close()
+
+    def insert_rows(self, rows):
+        """
+        在一个事务中批量插入弹幕行（按 DANMAKU_SQLITE_FIELDS 的列顺序），
+        弹幕ID已存在的行被忽略，弹幕ID为空的行改用content_row_id去重，返回新插入的条数
+        """
+        sql = (f'INSERT OR IGNORE INTO danmaku ({", ".join(DANMAKU_SQLITE_FIELDS)}) '
+               f'VALUES ({", ".join("?" * len(DANMAKU_SQLITE_FIELDS))})')
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                cursor = self._conn.executemany(sql, _with_row_ids(rows))
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+        return max(cursor.rowcount, 0)
+
+    def write_danmaku(self, bvid, batch, cid=None, page=None):
+        """
+        插入一个DanmakuBatch，cid和分P取自批次的附加列（或参数），返回新插入的条数
+        """
+        if not batch:
+            return 0
+        cid = batch.constants.get('cid', cid)
+        page = batch.constants.get('page', page or 1)
+        prefix = (bvid, cid, page)
+        return self.insert_rows(prefix + row for row in batch.rows(DANMAKU_FIELDS))
+
+    def write_video_info(self, video_info):
+        """
+        保存视频信息（每个视频只保留最近一次抓取）
+        """
+        row = {name: video_info.get(name) for name in VIDEO_INFO_SQLITE_FIELDS}
+        row['crawled_at'] = int(time.time())
+        with self._lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO videos ({", ".join(VIDEO_INFO_SQLITE_FIELDS)}) '
+                f'VALUES ({", ".join("?" * len(VIDEO_INFO_SQLITE_FIELDS))})',
+                [row[name] for name in VIDEO_INFO_SQLITE_FIELDS])
+
+    def video_info(self, bvid):
+        """
+        返回视频信息字典，没有时返回None
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM videos WHERE bvid = ?', (bvid,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self, bvid=None):
+        """
+        返回弹幕条数，bvid为None时返回全部视频的条数
+        """
+        with self._lock:
+            if bvid is None:
+                return self._conn.execute('SELECT COUNT(*) FROM danmaku').fetchone()[0]
+            return self._conn.execute('SELECT COUNT(*) FROM danmaku WHERE bvid = ?', (bvid,)).fetchone()[0]
+
+    def _video_condition(self, bvid, song_name):
+        # bvid和歌曲名称都走索引：弹幕表的 (bvid, time) 索引、视频信息表的歌曲名称索引
+        if bvid is not None:
+            return 'bvid = ?', [bvid]
+        if song_name is not None:
+            return 'bvid IN (SELECT bvid FROM videos WHERE song_name = ?)', [song_name]
+        return '1', []
+
+    def danmaku_per_minute(self, bvid=None, song_name=None):
+        """
+        统计视频每一分钟（按弹幕出现时间）的弹幕数，返回 [(分钟, 条数)]
+        bvid / song_name: 只统计该视频 / 该歌曲的视频，都为None时统计全部视频
+        只扫描 (bvid, time) 索引，不读取弹幕内容
+        """
+        condition, params = self._video_condition(bvid, song_name)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT CAST(time / 60 AS INTEGER) AS minute, COUNT(*) FROM danmaku '
+                f'WHERE {condition} GROUP BY minute ORDER BY minute', params).fetchall()
+        return [tuple(row) for row in rows]
+
+    def danmaku_per_day(self, since=None, until=None, bvid=None):
+        """
+        按发送日期（本地时间）统计弹幕数，返回 [('YYYY-MM-DD', 条数)]
+        since / until: 发送时间范围（Unix时间戳，含两端），走发送时间戳索引
+        """
+        conditions = ['timestamp >= ?', 'timestamp <= ?']
+        params = [since if since is not None else 0, until if until is not None else 2 ** 62]
+        if bvid is not None:
+            conditions.append('bvid = ?')
+            params.append(bvid)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT date(timestamp, 'unixepoch', 'localtime') AS day, COUNT(*) FROM danmaku "
+                f"WHERE {' AND '.join(conditions)} GROUP BY day ORDER BY day", params).fetchall()
+        return [tuple(row) for row in rows]
+
+    def iter_danmaku(self, bvid, start=None, end=None, columns=None, batch_size=10000):
+        """
+        按出现时间顺序逐批读取一个视频的弹幕，每次产出最多batch_size行（sqlite3.Row列表），
+        不一次性加载全部弹幕
+        start / end: 弹幕出现时间范围（秒，含start不含end）
+        """
+        columns = columns or DANMAKU_SQLITE_FIELDS
+        sql = (f'SELECT {", ".join(columns)} FROM danmaku WHERE bvid = ? AND time >= ? AND time < ? '
+               f'ORDER BY time')
+        # 使用独立的游标连接，逐批读取时不占用写入用的连接
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, (bvid, start if start is not None else float('-inf'),
+                                        end if end is not None else float('inf')))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+
+def import_catalog_csv(store, catalog, batch_size=10000):
+    """
+    把数据目录库中登记的CSV弹幕逐批导入SQLite存储，返回 {bvid: 新插入的条数}
+    """
+    imported = {}
+    for video in catalog.videos(storage='csv'):
+        with open(video['info_path'], 'r', newline='', encoding='utf-8') as f:
+            info = next(csv.DictReader(f), None) or {}
+        info.update(bvid=video['bvid'], title=video['title'], song_name=video['song_name'])
+        if info.get('pubdate'):
+            # CSV中的发布时间为可读格式，转换回Unix时间戳
+            info['pubdate'] = int(datetime.datetime.strptime(info['pubdate'], '%Y-%m-%d %H:%M:%S').timestamp())
+        store.write_video_info(info)
+        default_cid = video['danmaku_files'][0]['cid'] if video['danmaku_files'] else 0
+        inserted = 0
+        for path in video['danmaku_paths']:
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                rows = []
+                for record in reader:
+                    rows.append((video['bvid'], int(record.get('cid') or default_cid), int(record.get('page') or 1))
+                                + tuple(record[name] for name in DANMAKU_FIELDS))
+                    if len(rows) >= batch_size:
+                        inserted += store.insert_rows(rows)
+                        rows = []
+                inserted += store.insert_rows(rows)
+        imported[video['bvid']] = inserted
+    return imported
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili弹幕SQLite存储查询")
+    parser.add_argument('--db', default=DEFAULT_SQLITE_PATH, help="SQLite数据库路径")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    minute_parser = subparsers.add_parser('per-minute', help="统计视频每分钟的弹幕数")
+    minute_parser.add_argument('--song', default=None, help="歌曲名称")
+    minute_parser.add_argument('--bvid', default=None)
+    day_parser = subparsers.add_parser('per-day', help="按发送日期统计弹幕数")
+    day_parser.add_argument('--since', default=None, help="开始日期 YYYY-MM-DD")
+    day_parser.add_argument('--until', default=None, help="结束日期 YYYY-MM-DD（含）")
+    day_parser.add_argument('--bvid', default=None)
+    import_parser = subparsers.add_parser('import', help="导入数据目录库中登记的CSV弹幕")
+    import_parser.add_argument('--catalog', default='data_catalog.db', help="数据目录库路径")
+    args = parser.parse_args()
+
+    store = SQLiteDanmakuStore(args.db)
+    try:
+        if args.command == 'per-minute':
+            for minute, count in store.danmaku_per_minute(bvid=args.bvid, song_name=args.song):
+                print(f"{minute:>4} 分钟  {count}")
+        elif args.command == 'per-day':
+            def epoch(date, end=False):
+                if date is None:
+                    return None
+                day = datetime.datetime.strptime(date, '%Y-%m-%d') + datetime.timedelta(days=1 if end else 0)
+                return int(day.timestamp()) - (1 if end else 0)
+            for day, count in store.danmaku_per_day(epoch(args.since), epoch(args.until, end=True), args.bvid):
+                print(f"{day}  {count}")
+        else:
+            from data_catalog import open_catalog
+            catalog = open_catalog(args.catalog)
+            if catalog is None:
+                print(f"未找到数据目录库 {args.catalog}")
+                return
+            try:
+                imported = import_catalog_csv(store, catalog)
+            finally:
+                catalog.close()
+            print(f"导入 {len(imported)} 个视频，新增 {sum(imported.values())} 条弹幕")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
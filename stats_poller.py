@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili视频统计数据定时轮询
+功能：按固定周期重新读取被跟踪视频的统计数据（播放、弹幕、评论、点赞、投币、收藏、转发），
+      每次读取追加一行带时间戳的记录到SQLite时间序列库，用真实数据计算增长曲线和增长速度；
+      跟踪的视频较多时分批读取，并把各批均匀分散在整个周期内，避免请求集中爆发
+
+用法：
+  python stats_poller.py track urls.txt
+  python stats_poller.py poll --interval 3600
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bilibili_crawler import BilibiliCrawler
+from http_resilience import RequestFailedError
+
+
+# 每次轮询记录的统计字段
+STAT_FIELDS = ['view', 'danmaku', 'reply', 'like', 'coin', 'favorite', 'share']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked_videos (
+    bvid TEXT PRIMARY KEY,
+    song_name TEXT,
+    added_at INTEGER NOT NULL,
+    last_polled_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS video_stats (
+    bvid TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    view INTEGER,
+    danmaku INTEGER,
+    reply INTEGER,
+    like INTEGER,
+    coin INTEGER,
+    favorite INTEGER,
+    share INTEGER,
+    PRIMARY KEY (bvid, ts)
+) WITHOUT ROWID;
+"""
+
+
+class VideoStatsStore:
+    def __init__(self, path='video_stats.db'):
+        """
+        path: 时间序列数据库路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def track(self, bvid, song_name=None):
+        """
+        开始跟踪视频，返回是否为新跟踪的视频
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO tracked_videos (bvid, song_name, added_at) VALUES (?, ?, ?)',
+                (bvid, song_name, int(time.time())))
+            return cursor.rowcount == 1
+
+    def untrack(self, bvid):
+        with self._lock:
+            self._conn.execute('DELETE FROM tracked_videos WHERE bvid = ?', (bvid,))
+
+    def tracked(self):
+        """
+        返回所有被跟踪视频的BV号（按加入顺序）
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT bvid FROM tracked_videos ORDER BY added_at, bvid').fetchall()
+        return [row['bvid'] for row in rows]
+
+    def append(self, samples):
+        """
+        在一个事务中追加一批统计记录
+        samples: get_video_stats返回的字典列表，需包含 'ts' 键
+        """
+        if not samples:
+            return
+        columns = ['bvid', 'ts'] + STAT_FIELDS
+        rows = [tuple(sample[column] for column in columns) for sample in samples]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            # 同一秒内的重复读取只保留一条
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO video_stats ({", ".join(columns)}) '
+                f'VALUES ({", ".join("?" * len(columns))})', rows)
+            self._conn.executemany(
+                'UPDATE tracked_videos SET last_polled_at = ? WHERE bvid = ?',
+                [(sample['ts'], sample['bvid']) for sample in samples])
+            self._conn.execute('COMMIT')
+
+    def series(self, bvid, since=None):
+        """
+        返回视频的统计时间序列（按时间升序）
+        since: 只返回该时间戳之后的记录
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM video_stats WHERE bvid = ? AND ts >= ? ORDER BY ts',
+                (bvid, since or 0)).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest(self, bvid):
+        """
+        返回视频最近一次的统计记录，没有时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM video_stats WHERE bvid = ? ORDER BY ts DESC LIMIT 1', (bvid,)).fetchone()
+        return dict(row) if row else None
+
+    def velocities(self, bvid, field='view', since=None):
+        """
+        返回相邻两次记录之间的增长速度（每小时增量），格式为 [(时间戳, 速度)]
+        """
+        series = self.series(bvid, since)
+        return [(current['ts'], (current[field] - previous[field]) * 3600 / (current['ts'] - previous['ts']))
+                for previous, current in zip(series, series[1:])]
+
+
+class VideoStatsPoller:
+    def __init__(self, crawler, store, interval=3600, batch_size=20, max_workers=4):
+        """
+        crawler: BilibiliCrawler实例，请求受其限速器和熔断器约束
+        store: VideoStatsStore实例
+        interval: 每个视频的轮询周期（秒）
+        batch_size: 每批读取的视频数量，同一批的记录在一个事务中写入
+        max_workers: 同一批内并发请求的数量
+        """
+        self.crawler = crawler
+        self.store = store
+        self.interval = interval
+        self.batch_size = max(1, int(batch_size))
+        self.max_workers = max(1, int(max_workers))
+
+    def _fetch(self, bvid):
+        try:
+            sample = self.crawler.get_video_stats(bvid)
+        except (RequestFailedError, KeyError, ValueError) as e:
+            self.crawler.record_failure(bvid, 'stats', e)
+            return None
+        sample['ts'] = int(time.time())
+        return sample
+
+    def poll_batch(self, bvids, executor=None):
+        """
+        读取一批视频的统计数据并写入时间序列库，返回成功的数量
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                samples = list(executor.map(self._fetch, bvids))
+        else:
+            samples = list(executor.map(self._fetch, bvids))
+        samples = [sample for sample in samples if sample is not None]
+        self.store.append(samples)
+        return len(samples)
+
+    def poll_cycle(self, spread=True):
+        """
+        轮询一遍所有被跟踪的视频，返回成功的数量
+        spread: 是否把各批均匀分散在整个周期内；为False时连续读取
+        """
+        bvids = self.store.tracked()
+        if not bvids:
+            return 0
+        batches = [bvids[i:i + self.batch_size] for i in range(0, len(bvids), self.batch_size)]
+        slot = self.interval / len(batches) if spread else 0
+        cycle_start = time.monotonic()
+        success = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for index, batch in enumerate(batches):
+                # 第index批在周期开始后 index * slot 秒发出
+                delay = cycle_start + index * slot - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                success += self.poll_batch(batch, executor)
+        if spread:
+            remaining = cycle_start + self.interval - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        return success
+
+    def run(self, cycles=None):
+        """
+        持续轮询，cycles为None时一直运行直到被中断
+        """
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            started = time.time()
+            success = self.poll_cycle()
+            cycle += 1
+            print(f"第 {cycle} 轮轮询完成: {success}/{len(self.store.tracked())} 个视频, "
+                  f"耗时 {time.time() - started:.0f} 秒")
+
+
+def track_urls(store, urls_file):
+    """
+    把URL文件中的视频加入跟踪列表
+    """
+    crawler = BilibiliCrawler()
+    crawler.load_song_names(urls_file)
+    urls = crawler.read_urls_file(urls_file)
+    if urls is None:
+        return 0
+    added = 0
+    for url in urls:
+        bvid = crawler.get_bvid_from_url(url) if url.startswith('http') else url
+        if bvid:
+            added += store.track(bvid, crawler.song_names.get(bvid))
+    print(f"新增跟踪 {added} 个视频，共跟踪 {len(store.tracked())} 个视频")
+    return added
+
+
+def main():
+    """
+    主函数
+    """
+    parser = argparse.ArgumentParser(description="Bilibili视频统计数据定时轮询")
+    parser.add_argument('--db', default='video_stats.db', help="时间序列数据库路径")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    track_parser = subparsers.add_parser('track', help="把URL文件中的视频加入跟踪列表")
+    track_parser.add_argument('urls_file')
+
+    poll_parser = subparsers.add_parser('poll', help="按周期轮询所有被跟踪的视频")
+    poll_parser.add_argument('--interval', type=float, default=3600, help="轮询周期（秒）")
+    poll_parser.add_argument('--batch-size', type=int, default=20)
+    poll_parser.add_argument('--workers', type=int, default=4)
+    poll_parser.add_argument('--cycles', type=int, default=None, help="轮询轮数，默认一直运行")
+    poll_parser.add_argument('--api-base', default='https://api.bilibili.com')
+
+    args = parser.parse_args()
+    store = VideoStatsStore(args.db)
+    try:
+        if args.command == 'track':
+            track_urls(store, args.urls_file)
+        else:
+            crawler = BilibiliCrawler(api_base=args.api_base)
+            poller = VideoStatsPoller(crawler, store, interval=args.interval,
+                                      batch_size=args.batch_size, max_workers=args.workers)
+            try:
+                poller.run(args.cycles)
+            except KeyboardInterrupt:
+                print("轮询已停止")
+            crawler.print_failure_summary()
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕爬虫流量录制与回放
+功能：以requests传输适配器的形式挂载到session上。录制模式下把每个请求的响应（状态码、响应头、
+      解压后的响应体、耗时）按顺序保存到录制目录；回放模式下按相同顺序返回录制的响应，不访问网络。
+      录制目录也可以交给本地模拟服务器（MockBilibiliServer(cassette_dir=...)）提供服务，
+      在注入延迟、错误和限流的情况下离线复现线上流量
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from response_cache import _CachingRawResponse, _DROPPED_HEADERS
+
+
+class TrafficCassette:
+    """
+    录制目录：同一个请求（路径+查询参数，不含域名）可以录制多次，
+    文件名为 {key}.{序号}.json / {key}.{序号}.body，回放时按序号依次返回，超出后重复最后一次
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._recorded = {}
+        self._replayed = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def request_key(url):
+        # 不含域名，线上录制的流量可以由本地模拟服务器提供
+        parsed = urlparse(url)
+        return hashlib.sha256(f'{parsed.path}?{parsed.query}'.encode('utf-8')).hexdigest()
+
+    def _paths(self, key, index):
+        base = os.path.join(self.directory, f'{key}.{index}')
+        return base + '.body', base + '.json'
+
+    def count(self, url):
+        """
+        返回该请求录制的次数
+        """
+        key = self.request_key(url)
+        count = 0
+        while os.path.exists(self._paths(key, count)[1]):
+            count += 1
+        return count
+
+    def open_body_writer(self, url):
+        return tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+
+    def commit(self, url, tmp_file, status_code, headers):
+        """
+        保存一次完整的响应，序号按录制顺序递增
+        """
+        key = self.request_key(url)
+        tmp_file.close()
+        with self._lock:
+            if key not in self._recorded:
+                self._recorded[key] = self.count(url)
+            index = self._recorded[key]
+            self._recorded[key] += 1
+        body_path, meta_path = self._paths(key, index)
+        os.replace(tmp_file.name, body_path)
+        headers = {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS}
+        meta = {
+            'url': url,
+            'status_code': status_code,
+            'elapsed': float(headers.pop('X-Recorded-Elapsed', 0.0)),
+            'headers': headers,
+            'recorded_at': time.time(),
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def next_response(self, url):
+        """
+        按录制顺序返回下一次响应的元数据（含body_path），没有录制时返回None
+        """
+        key = self.request_key(url)
+        with self._lock:
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+        body_path, meta_path = self._paths(key, index)
+        if not os.path.exists(meta_path):
+            # 超出录制次数时重复最后一次
+            count = self.count(url)
+            if count == 0:
+                return None
+            body_path, meta_path = self._paths(key, count - 1)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['body_path'] = body_path
+        return meta
+
+    def read_body(self, meta):
+        with open(meta['body_path'], 'rb') as f:
+            return f.read()
+
+
+class _RecordingRawResponse(_CachingRawResponse):
+    """
+    与缓存不同，录制时调用方提前关闭响应（如达到弹幕上限）也要保存完整的响应体，
+    这样回放时使用不同的弹幕上限也能得到相同的结果
+    """
+
+    def close(self):
+        if not self._done:
+            for chunk in self._raw.stream(2 ** 16, decode_content=True):
+                self._file.write(chunk)
+            self._finish()
+        self._raw.close()
+
+
+class RecordingHTTPAdapter(HTTPAdapter):
+    def __init__(self, cassette, **kwargs):
+        """
+        cassette: TrafficCassette实例；其余参数传给HTTPAdapter
+        """
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, **kwargs):
+        response = super().send(request, stream=stream, **kwargs)
+        headers = dict(response.headers)
+        headers['X-Recorded-Elapsed'] = str(response.elapsed.total_seconds())
+        response.raw = _RecordingRawResponse(response.raw, self.cassette, request.url,
+                                             response.status_code, headers)
+        # 录制的是解压后的内容
+        response.headers.pop('Content-Encoding', None)
+        return response
+
+
+def build_response(request, status_code, headers, body, adapter):
+    """
+    用录制的内容构造requests的Response
+    """
+    response = Response()
+    response.status_code = status_code
+    response.reason = 'OK' if status_code == 200 else ''
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.raw = io.BytesIO(body)
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    return response
+
+
+class ReplayHTTPAdapter(HTTPAdapter):
+    def __init__(self, cassette, realtime=False, **kwargs):
+        """
+        cassette: TrafficCassette实例
+        realtime: 是否按录制时的耗时等待后再返回，用于复现线上的请求延迟
+        """
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.realtime = realtime
+
+    def send(self, request, stream=False, **kwargs):
+        meta = self.cassette.next_response(request.url)
+        if meta is None:
+            # 没有录制的请求按404返回，不会被重试
+            return build_response(request, 404, {'X-Replay': 'MISS'}, b'', self)
+        if self.realtime and meta['elapsed']:
+            time.sleep(meta['elapsed'])
+        headers = dict(meta['headers'])
+        headers['X-Replay'] = 'HIT'
+        return build_response(request, meta['status_code'], headers, self.cassette.read_body(meta), self)
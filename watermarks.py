@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bilibili弹幕增量抓取水位线
+功能：按cid持久化记录已抓取弹幕的最大发送时间戳和弹幕ID，
+      再次抓取时只保留水位线之后的新弹幕
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class WatermarkStore:
+    def __init__(self, path='crawl_watermarks.json'):
+        """
+        path: 水位线文件路径（JSON格式，键为cid）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.watermarks = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.watermarks = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取水位线文件时发生异常，将重新全量抓取: {e}")
+                self.watermarks = {}
+
+    def get(self, cid):
+        """
+        返回cid的水位线，不存在时返回None
+        """
+        with self._lock:
+            return self.watermarks.get(str(cid))
+
+    def advance_to(self, cid, key, written):
+        """
+        key: 本次写入弹幕中最大的先后顺序键 (时间戳, 弹幕ID)
+        written: 本次写入的弹幕条数
+        """
+        timestamp, row_id = key
+        with self._lock:
+            watermark = self.watermarks.get(str(cid))
+            count = written + (watermark['count'] if watermark else 0)
+            if watermark is None or (timestamp, row_id) > (watermark['timestamp'], watermark['row_id']):
+                watermark = {'timestamp': timestamp, 'row_id': row_id}
+            watermark['count'] = count
+            watermark['updated_at'] = int(time.time())
+            self.watermarks[str(cid)] = watermark
+            self._save()
+
+    def reset(self, cid):
+        """
+        删除cid的水位线，下次抓取将全量写入
+        """
+        with self._lock:
+            if self.watermarks.pop(str(cid), None) is not None:
+                self._save()
+
+    def _save(self):
+        # 先写临时文件再替换，避免中途退出导致水位线文件损坏
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.watermarks, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+后台写入线程（write-behind）
+功能：抓取线程把写文件的操作（序列化、刷新缓冲区、fsync、改名）提交到有界队列后立即返回，
+      由专门的写入线程按提交顺序执行，磁盘写入与下一批/下一个视频的网络请求重叠；
+      队列满时提交方阻塞等待（磁盘慢时对抓取施加背压），关闭时按顺序写完所有已提交的操作
+"""
+
+import queue
+import threading
+
+
+DEFAULT_WRITE_QUEUE_SIZE = 32
+
+# 通知写入线程退出的标记
+_STOP = object()
+
+
+class WriteBehindWriter:
+    def __init__(self, max_pending=DEFAULT_WRITE_QUEUE_SIZE):
+        """
+        max_pending: 队列中最多等待执行的写入操作数，超过时submit阻塞
+        """
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        # 按key统计未完成的操作数和第一个异常；同一key的操作失败后，其后续操作不再执行
+        self._pending = {}
+        self._errors = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, key, func, *args, cleanup=None):
+        """
+        提交一个写入操作，所有操作按提交顺序在写入线程中执行
+        key: 操作所属的对象（如视频的BV号），wait(key)等待该key的全部操作完成
+        cleanup: 该操作失败或因同一key之前的操作失败而跳过时调用，用于删除临时文件
+        队列已满时阻塞，直到写入线程取走一个操作
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("写入线程已关闭")
+            self._pending[key] = self._pending.get(key, 0) + 1
+        self._queue.put((key, func, args, cleanup))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            key, func, args, cleanup = item
+            with self._condition:
+                failed = key in self._errors
+            error = None
+            if not failed:
+                try:
+                    func(*args)
+                except Exception as e:
+                    error = e
+            if (failed or error is not None) and cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    print(f"清理未完成的写入时发生异常: {e}")
+            with self._condition:
+                if error is not None:
+                    self._errors.setdefault(key, error)
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    del self._pending[key]
+                self._condition.notify_all()
+
+    def pending(self, key=None):
+        """
+        未完成的写入操作数，key为None时返回全部
+        """
+        with self._condition:
+            if key is None:
+                return sum(self._pending.values())
+            return self._pending.get(key, 0)
+
+    def wait(self, key):
+        """
+        等待key的全部写入操作完成，返回其中第一个异常（没有失败时返回None）
+        异常只返回一次，之后该key可以重新提交写入操作
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: key not in self._pending)
+            return self._errors.pop(key, None)
+
+    def flush(self):
+        """
+        等待所有已提交的写入操作完成，返回尚未被wait取走的异常 {key: 异常}
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending)
+            errors, self._errors = self._errors, {}
+            return errors
+
+    def close(self):
+        """
+        按顺序写完所有已提交的操作后停止写入线程，返回尚未被wait取走的异常 {key: 异常}
+        """
+        with self._condition:
+            if self._closed:
+                return {}
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        errors, self._errors = self._errors, {}
+        return errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False